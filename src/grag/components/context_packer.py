@@ -0,0 +1,121 @@
+"""Class for packing retrieved chunks into the context of a prompt.
+
+This module provides:
+
+— ContextPacker
+"""
+
+from typing import Callable, Dict, List, Optional, Union
+
+from grag.components.utils import LRUCache
+from langchain_core.documents import Document
+
+
+class ContextPacker:
+    """Packs retrieved chunks into a token budget, in rank order.
+
+    Chunks are taken greedily from the highest ranked, a chunk that does not fit the remaining budget is skipped so
+    that a shorter, lower ranked chunk can still fill it. Token counts are cached, the same chunks are retrieved
+    again and again.
+
+    Neighbouring chunks of a document share chunk_overlap characters of text. With trim_overlap, the text a chunk
+    shares with an already packed chunk of the same source is cut from it, and chunks that are contained in a
+    packed chunk are dropped.
+
+    Attributes:
+        count_tokens: function returning the number of tokens of a text, for the tokenizer of the model
+        separator: separator of the chunks in the context
+        trim_overlap: whether to trim the text shared by packed chunks
+        min_overlap: minimum number of characters of shared text that is trimmed
+        max_overlap: maximum number of characters of shared text that is trimmed, the chunk_overlap of the splitter
+        token_counts: LRUCache of the token counts of texts
+    """
+
+    def __init__(
+        self,
+        count_tokens: Callable[[str], int],
+        separator: str = "\n\n",
+        trim_overlap: bool = True,
+        min_overlap: Union[int, str] = 20,
+        max_overlap: Union[int, str] = 400,
+        cache_size: Union[int, str] = 4096,
+    ):
+        r"""Initialize the packer.
+
+        Args:
+            count_tokens: function returning the number of tokens of a text, for the tokenizer of the model
+            separator: separator of the chunks in the context, defaults to '\n\n' as in BasicRAG.stuff_docs
+            trim_overlap: whether to trim the text shared by packed chunks, defaults to True
+            min_overlap: minimum number of characters of shared text that is trimmed, defaults to 20
+            max_overlap: maximum number of characters of shared text that is trimmed, defaults to 400
+            cache_size: number of token counts kept in the cache, defaults to 4096
+        """
+        self.count_tokens = count_tokens
+        self.separator = separator
+        self.trim_overlap = trim_overlap
+        self.min_overlap = int(min_overlap)
+        self.max_overlap = int(max_overlap)
+        self.token_counts = LRUCache(cache_size)
+
+    def num_tokens(self, text: str) -> int:
+        """Returns the number of tokens of a text, from the cache if it was counted before."""
+        count = self.token_counts.get(text)
+        if count is None:
+            count = self.count_tokens(text)
+            self.token_counts.put(text, count)
+        return count
+
+    def _overlap(self, first: str, second: str) -> int:
+        """Length of the longest suffix of first that is a prefix of second, 0 if shorter than min_overlap."""
+        for size in range(
+            min(len(first), len(second), self.max_overlap), self.min_overlap - 1, -1
+        ):
+            if first.endswith(second[:size]):
+                return size
+        return 0
+
+    def _trim(self, text: str, packed: List[str]) -> Optional[str]:
+        """Removes the text shared with the packed texts, None if the whole text is in a packed text."""
+        for other in packed:
+            if text in other:
+                return None
+            head = self._overlap(other, text)
+            tail = self._overlap(text, other)
+            text = text[head : len(text) - tail].strip()
+            if not text:
+                return None
+        return text
+
+    def pack(self, docs: List[Document], max_tokens: int) -> List[Document]:
+        """Packs the docs into max_tokens tokens.
+
+        Args:
+            docs: retrieved documents, from the highest to the lowest ranked
+            max_tokens: token budget of the context
+
+        Returns:
+            the packed documents in rank order, with the shared text trimmed from their page content
+        """
+        separator_tokens = self.num_tokens(self.separator) if self.separator else 0
+        packed: List[Document] = []
+        packed_texts: Dict[Optional[str], List[str]] = {}
+        budget = int(max_tokens)
+        for doc in docs:
+            text = doc.page_content
+            if self.trim_overlap:
+                trimmed = self._trim(
+                    text, packed_texts.get(doc.metadata.get("source"), [])
+                )
+                if trimmed is None:
+                    continue
+                text = trimmed
+            tokens = self.num_tokens(text) + (separator_tokens if packed else 0)
+            if tokens > budget:
+                continue
+            budget -= tokens
+            if self.trim_overlap:
+                packed_texts.setdefault(doc.metadata.get("source"), []).append(text)
+            if text != doc.page_content:
+                doc = Document(page_content=text, metadata=doc.metadata)
+            packed.append(doc)
+        return packed
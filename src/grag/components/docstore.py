@@ -0,0 +1,165 @@
+"""Class for the document store.
+
+This module provides:
+
+— SQLiteStore
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+
+from langchain_core.stores import BaseStore
+
+
+class SQLiteStore(BaseStore[str, bytes]):
+    """A langchain byte store that keeps all key-value pairs in a single SQLite file.
+
+    It is a drop-in replacement for langchain LocalFileStore, which writes one file per key. The file is opened in
+    WAL mode with a connection per thread, so reads from several threads or processes do not block each other or
+    the writer. mget and mset read and write many keys in a single query.
+
+    Values can be compressed with zstd, which requires the zstandard package. Each row records whether its value
+    is compressed, so the compression can be turned on or off for an existing file.
+
+    Attributes:
+        path: path to the SQLite file
+        compression: compression of the values, 'zstd' or None
+        compression_level: zstd compression level
+    """
+
+    _max_query_params = 500
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        compression: Optional[str] = None,
+        compression_level: Union[int, str] = 3,
+    ):
+        """Initialize the store, creating the SQLite file if it does not exist.
+
+        Args:
+            path: path to the SQLite file
+            compression: compression of the values, 'zstd' or None, defaults to None
+            compression_level: zstd compression level, defaults to 3
+        """
+        self.path = Path(path)
+        self.compression = compression
+        self.compression_level = int(compression_level)
+        if self.compression not in (None, "zstd"):
+            raise ValueError(f"compression {self.compression} is not supported.")
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS docstore "
+                "(key TEXT PRIMARY KEY, value BLOB NOT NULL, compressed INTEGER NOT NULL)"
+            )
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """The SQLite connection of the current thread."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _zstd(self):
+        """The zstd compressor and decompressor of the current thread, zstd contexts are not thread safe."""
+        contexts = getattr(self._local, "zstd", None)
+        if contexts is None:
+            try:
+                import zstandard
+            except ImportError as e:
+                raise ImportError(
+                    "zstd compression requires the zstandard package, install it with `pip install zstandard`."
+                ) from e
+            contexts = (
+                zstandard.ZstdCompressor(level=self.compression_level),
+                zstandard.ZstdDecompressor(),
+            )
+            self._local.zstd = contexts
+        return contexts
+
+    def _encode(self, value: bytes) -> Tuple[bytes, int]:
+        if self.compression == "zstd":
+            return self._zstd()[0].compress(value), 1
+        return value, 0
+
+    def _decode(self, value: bytes, compressed: int) -> bytes:
+        if compressed:
+            return self._zstd()[1].decompress(value)
+        return value
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        """Get the values associated with the given keys.
+
+        Args:
+            keys: A sequence of keys.
+
+        Returns:
+            A sequence of optional values associated with the keys, None if a key is not found.
+        """
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        for i in range(0, len(unique_keys), self._max_query_params):
+            batch = unique_keys[i : i + self._max_query_params]
+            rows = self._conn.execute(
+                "SELECT key, value, compressed FROM docstore "
+                f"WHERE key IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+            for key, value, compressed in rows:
+                found[key] = self._decode(value, compressed)
+        return [found.get(key) for key in keys]
+
+    def mset(self, key_value_pairs: Sequence[Tuple[str, bytes]]) -> None:
+        """Set the values for the given keys in a single transaction.
+
+        Args:
+            key_value_pairs: A sequence of key-value pairs.
+        """
+        rows = [(key, *self._encode(value)) for key, value in key_value_pairs]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO docstore (key, value, compressed) VALUES (?, ?, ?)",
+                rows,
+            )
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        """Delete the given keys and their associated values.
+
+        Args:
+            keys: A sequence of keys to delete.
+        """
+        with self._conn:
+            self._conn.executemany(
+                "DELETE FROM docstore WHERE key = ?", [(key,) for key in keys]
+            )
+
+    def yield_keys(self, prefix: Optional[str] = None) -> Iterator[str]:
+        """Get an iterator over keys that match the given prefix.
+
+        Args:
+            prefix: The prefix to match, if None all keys are returned.
+
+        Returns:
+            An iterator over keys that match the given prefix.
+        """
+        if prefix:
+            rows = self._conn.execute(
+                "SELECT key FROM docstore WHERE substr(key, 1, ?) = ?",
+                (len(prefix), prefix),
+            )
+        else:
+            rows = self._conn.execute("SELECT key FROM docstore")
+        for (key,) in rows:
+            yield key
+
+    def __len__(self) -> int:
+        """Number of keys in the store."""
+        return self._conn.execute("SELECT COUNT(*) FROM docstore").fetchone()[0]
@@ -3,12 +3,301 @@
 This module provides:
 
 — Embedding
+
+— CachedEmbeddings
+
+— LazyEmbeddings
+
+— get_shared_embeddings: returns the process wide lazily loaded embeddings of a model
+
+— embed_queries
 """
 
-from langchain_community.embeddings import HuggingFaceInstructEmbeddings
-from langchain_community.embeddings.sentence_transformer import (
-    SentenceTransformerEmbeddings,
-)
+import hashlib
+import sqlite3
+import threading
+import time
+import weakref
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+INSTRUCTOR_EMBED_INSTRUCTION = "Represent the document for retrival"
+
+
+class CachedEmbeddings(Embeddings):
+    """A langchain embeddings wrapper that caches document embeddings in a SQLite file.
+
+    Embeddings are keyed by the sha256 hash of the namespace (model name and instruction) and the text, so identical
+    chunks are only embedded once per model. When the cache holds more than max_size embeddings, the least recently
+    used ones are evicted. Query embeddings are not cached.
+
+    Attributes:
+        embeddings: the wrapped langchain embeddings
+        cache_path: path to the SQLite cache file
+        namespace: prefix of the cache keys, identifies the model and instruction
+        max_size: maximum number of cached embeddings
+        hits: number of document embeddings served from the cache
+        misses: number of document embeddings computed by the wrapped embeddings
+    """
+
+    _max_query_params = 500
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache_path: Union[str, Path],
+        namespace: str,
+        max_size: Union[int, str] = 1_000_000,
+    ):
+        """Initialize the cache, creating the cache file if it does not exist.
+
+        Args:
+            embeddings: the langchain embeddings to wrap
+            cache_path: path to the SQLite cache file
+            namespace: prefix of the cache keys, should identify the model and instruction
+            max_size: maximum number of cached embeddings, defaults to 1,000,000
+        """
+        self.embeddings = embeddings
+        self.cache_path = Path(cache_path)
+        self.namespace = namespace
+        self.max_size = int(max_size)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.cache_path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings "
+                "(key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+            )
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def __len__(self) -> int:
+        """Number of cached embeddings."""
+        return self._size
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\x00{text}".encode()).hexdigest()
+
+    def _get(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Fetches the cached embeddings of keys and marks them as recently used."""
+        found: Dict[str, List[float]] = {}
+        for i in range(0, len(keys), self._max_query_params):
+            batch = keys[i : i + self._max_query_params]
+            rows = self._conn.execute(
+                "SELECT key, vector FROM embeddings "
+                f"WHERE key IN ({','.join('?' * len(batch))})",
+                batch,
+            )
+            for key, vector in rows:
+                found[key] = np.frombuffer(vector, dtype=np.float32).tolist()
+        if found:
+            now = time.time()
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+        return found
+
+    def _put(self, items: Dict[str, List[float]]) -> None:
+        """Stores embeddings, evicting the least recently used ones above max_size."""
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                    for key, vector in items.items()
+                ],
+            )
+        self._size += len(items)
+        if self._size > self.max_size:
+            # recount, the cache file may be shared with other processes
+            self._size = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()[0]
+            excess = self._size - self.max_size
+            if excess > 0:
+                with self._conn:
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE key IN "
+                        "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (excess,),
+                    )
+                self._size -= excess
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeds documents, computing only the embeddings missing from the cache.
+
+        Args:
+            texts: list of texts to embed
+
+        Returns:
+            list of embeddings, one per text
+        """
+        keys = [self._key(text) for text in texts]
+        with self._lock:
+            found = self._get(list(set(keys)))
+        missing = {key: text for key, text in zip(keys, texts) if key not in found}
+        num_hits = sum(key in found for key in keys)
+        self.hits += num_hits
+        self.misses += len(texts) - num_hits
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            with self._lock:
+                self._put(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embeds a query using the wrapped embeddings."""
+        return self.embeddings.embed_query(text)
+
+
+class LazyEmbeddings(Embeddings):
+    """A langchain embeddings proxy that loads the embedding model on its first use.
+
+    Loading an embedding model takes seconds and gigabytes of memory, so clients can be created without loading it,
+    and a client that only reads cached embeddings never loads it.
+
+    Attributes:
+        loader: function returning the langchain embeddings
+    """
+
+    def __init__(self, loader: Callable[[], Embeddings]):
+        """Initialize the proxy, the embeddings are not loaded yet.
+
+        Args:
+            loader: function returning the langchain embeddings
+        """
+        self.loader = loader
+        self._embeddings: Optional[Embeddings] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the embeddings are loaded."""
+        return self._embeddings is not None
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """The langchain embeddings, loaded on first access."""
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = self.loader()
+        return self._embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embeds documents using the loaded embeddings."""
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embeds a query using the loaded embeddings."""
+        return self.embeddings.embed_query(text)
+
+
+_shared_embeddings: "weakref.WeakValueDictionary[Tuple[str, str, Optional[str]], LazyEmbeddings]" = weakref.WeakValueDictionary()
+_shared_embeddings_lock = threading.Lock()
+
+
+def _load_embeddings(
+    embedding_type: str, embedding_model: str, device: Optional[str]
+) -> Embeddings:
+    """Loads the langchain embeddings of a model."""
+    model_kwargs = {"device": device} if device is not None else {}
+    match embedding_type:
+        case "sentence-transformers":
+            from langchain_community.embeddings.sentence_transformer import (
+                SentenceTransformerEmbeddings,
+            )
+
+            return SentenceTransformerEmbeddings(
+                model_name=embedding_model,
+                model_kwargs=model_kwargs,  # type: ignore
+            )
+        case "instructor-embedding":
+            from langchain_community.embeddings import HuggingFaceInstructEmbeddings
+
+            embeddings = HuggingFaceInstructEmbeddings(
+                model_name=embedding_model,
+                model_kwargs=model_kwargs,  # type: ignore
+            )
+            embeddings.embed_instruction = INSTRUCTOR_EMBED_INSTRUCTION
+            return embeddings
+    raise Exception("embedding_type is invalid")
+
+
+def get_shared_embeddings(
+    embedding_type: str, embedding_model: str, device: Optional[str] = None
+) -> LazyEmbeddings:
+    """Returns the lazily loaded embeddings of a model, shared by the whole process.
+
+    All callers asking for the same embedding type, model and device get the same instance, so the model is
+    loaded at most once per process, on its first use. The model is freed once no caller holds the instance.
+
+    Args:
+        embedding_type: embedding model type, 'sentence-transformers' or 'instructor-embedding'
+        embedding_model: huggingface model name
+        device: device of the model, like 'cpu' or 'cuda', defaults to None, the default device
+
+    Returns:
+        the shared LazyEmbeddings
+    """
+    if embedding_type not in ("sentence-transformers", "instructor-embedding"):
+        raise Exception("embedding_type is invalid")
+    key = (embedding_type, embedding_model, device)
+    with _shared_embeddings_lock:
+        embeddings = _shared_embeddings.get(key)
+        if embeddings is None:
+            embeddings = LazyEmbeddings(
+                lambda: _load_embeddings(embedding_type, embedding_model, device)
+            )
+            _shared_embeddings[key] = embeddings
+        return embeddings
+
+
+def embed_queries(embeddings: Embeddings, queries: List[str]) -> List[List[float]]:
+    """Embeds queries in a single batched forward pass where the embeddings support it.
+
+    langchain embeddings only embed one query per call, this encodes all queries at once for huggingface
+    instructor and sentence transformers embeddings, other embeddings fall back to embedding one query at a time.
+
+    Args:
+        embeddings: langchain embeddings, optionally wrapped in CachedEmbeddings or LazyEmbeddings
+        queries: list of query strings
+
+    Returns:
+        list of query embeddings, one per query
+    """
+    if not queries:
+        return []
+    if isinstance(embeddings, (CachedEmbeddings, LazyEmbeddings)):
+        return embed_queries(embeddings.embeddings, queries)
+    from langchain_community.embeddings import (
+        HuggingFaceEmbeddings,
+        HuggingFaceInstructEmbeddings,
+    )
+
+    if isinstance(embeddings, HuggingFaceInstructEmbeddings):
+        instruction_pairs = [[embeddings.query_instruction, query] for query in queries]
+        return embeddings.client.encode(
+            instruction_pairs, **embeddings.encode_kwargs
+        ).tolist()
+    if isinstance(embeddings, HuggingFaceEmbeddings):
+        # sentence transformers embed queries and documents the same way
+        return embeddings.embed_documents(queries)
+    return [embeddings.embed_query(query) for query in queries]
 
 
 class Embedding:
@@ -18,26 +307,52 @@ class Embedding:
         huggingface sentence transformers -> model_type = 'sentence-transformers'
         huggingface instructor embeddings -> model_type = 'instructor-embedding'
 
+    The embedding function is shared by all Embedding instances of the same model and device, and the model is only
+    loaded on its first use, see get_shared_embeddings.
+
     Attributes:
         embedding_type: embedding model type, refer above for supported types
         embedding_model: huggingface model name
+        device: device of the model, None for the default device
         embedding_function: langchain embedding type
+        cache_path: path to the embedding cache, if None embeddings are not cached
+        cache_size: maximum number of embeddings in the cache
     """
 
-    def __init__(self, embedding_type: str, embedding_model: str):
-        """Initialize the embedding with embedding_type and embedding_model."""
+    def __init__(
+        self,
+        embedding_type: str,
+        embedding_model: str,
+        cache_path: Optional[Union[str, Path]] = None,
+        cache_size: Union[int, str] = 1_000_000,
+        device: Optional[str] = None,
+    ):
+        """Initialize the embedding with embedding_type and embedding_model.
+
+        Args:
+            embedding_type: embedding model type
+            embedding_model: huggingface model name
+            cache_path: path to the SQLite embedding cache, if None embeddings are not cached, defaults to None
+            cache_size: maximum number of embeddings in the cache, defaults to 1,000,000
+            device: device of the model, like 'cpu' or 'cuda', defaults to None, the default device
+        """
         self.embedding_type = embedding_type
         self.embedding_model = embedding_model
-        match self.embedding_type:
-            case "sentence-transformers":
-                self.embedding_function = SentenceTransformerEmbeddings(
-                    model_name=self.embedding_model  # type: ignore
-                )
-            case "instructor-embedding":
-                self.embedding_instruction = "Represent the document for retrival"
-                self.embedding_function = HuggingFaceInstructEmbeddings(
-                    model_name=self.embedding_model  # type: ignore
-                )
-                self.embedding_function.embed_instruction = self.embedding_instruction  # type: ignore
-            case _:
-                raise Exception("embedding_type is invalid")
+        self.device = device
+        self.cache_path = cache_path
+        self.cache_size = int(cache_size)
+        self.embedding_instruction = (
+            INSTRUCTOR_EMBED_INSTRUCTION
+            if self.embedding_type == "instructor-embedding"
+            else ""
+        )
+        self.embedding_function: Embeddings = get_shared_embeddings(
+            self.embedding_type, self.embedding_model, self.device
+        )
+        if self.cache_path is not None:
+            self.embedding_function = CachedEmbeddings(
+                self.embedding_function,
+                cache_path=self.cache_path,
+                namespace=f"{self.embedding_model}\x00{self.embedding_instruction}",
+                max_size=self.cache_size,
+            )
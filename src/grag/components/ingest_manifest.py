@@ -0,0 +1,117 @@
+"""Class for the ingest manifest.
+
+This module provides:
+
+— IngestManifest
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+from grag.components.utils import hash_file
+
+
+class IngestManifest:
+    """A persistent record of ingested files, used to skip unchanged files when re-ingesting.
+
+    Each file is recorded with the sha256 hash of its content, its size, its modification time and the ids of the
+    parent documents created from it. Size and modification time are checked first, the content is only hashed
+    when the modification time differs from the recorded one.
+
+    Attributes:
+        path: path to the manifest json file
+        files: dictionary of file records keyed by the resolved file path
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        """Initialize the manifest, loading the records from path if it exists.
+
+        Args:
+            path: path to the manifest json file
+        """
+        self.path = Path(path)
+        self.files: Dict[str, Dict[str, Any]] = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                self.files = json.load(f)["files"]
+
+    def __len__(self) -> int:
+        """Number of files in the manifest."""
+        return len(self.files)
+
+    def __contains__(self, filepath: Union[str, Path]) -> bool:
+        """Whether the file is recorded in the manifest."""
+        return self._key(filepath) in self.files
+
+    @staticmethod
+    def _key(filepath: Union[str, Path]) -> str:
+        return str(Path(filepath).resolve())
+
+    def is_unchanged(self, filepath: Union[str, Path]) -> bool:
+        """Checks whether a file is recorded and unchanged since it was recorded.
+
+        Args:
+            filepath: path to the file
+
+        Returns:
+            True if the file content matches the recorded content, else False
+        """
+        record = self.files.get(self._key(filepath))
+        if record is None:
+            return False
+        stat = Path(filepath).stat()
+        if stat.st_size != record["size"]:
+            return False
+        if stat.st_mtime == record["mtime"]:
+            return True
+        if hash_file(filepath) == record["hash"]:
+            # touched but not modified, remember the new mtime to skip hashing next time
+            record["mtime"] = stat.st_mtime
+            return True
+        return False
+
+    def doc_ids(self, filepath: Union[str, Path]) -> List[str]:
+        """Returns the ids of the parent documents recorded for a file, empty if the file is not recorded."""
+        record = self.files.get(self._key(filepath))
+        return list(record["doc_ids"]) if record else []
+
+    def update(
+        self,
+        filepath: Union[str, Path],
+        doc_ids: List[str],
+        file_hash: Optional[str] = None,
+    ) -> None:
+        """Records the current content of a file and the ids of the parent documents created from it.
+
+        Args:
+            filepath: path to the file
+            doc_ids: ids of the parent documents created from the file
+            file_hash: sha256 hash of the file content, optional, hashes the file if None
+        """
+        if file_hash is None:
+            file_hash = hash_file(filepath)
+        stat = Path(filepath).stat()
+        self.files[self._key(filepath)] = {
+            "hash": file_hash,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "doc_ids": sorted(set(doc_ids)),
+        }
+
+    def remove(self, filepath: Union[str, Path]) -> None:
+        """Removes a file from the manifest."""
+        self.files.pop(self._key(filepath), None)
+
+    def clear(self) -> None:
+        """Removes all files from the manifest."""
+        self.files = {}
+
+    def save(self) -> None:
+        """Writes the manifest to its path, replacing the previous file atomically."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"files": self.files}, f, indent=2)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,207 @@
+"""Class for ingesting files through concurrent stages.
+
+This module provides:
+
+— IngestPipeline
+"""
+
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from grag.components.parse_pdf import parse_files
+from langchain_core.documents import Document
+
+_DONE = object()
+
+
+class IngestPipeline:
+    """Parses, splits and embeds files in concurrent stages connected by bounded queues.
+
+    Files flow through the stages parse -> split -> embed, each stage has its own workers: parse_workers processes
+    parse the files and split_workers and embed_workers threads split and embed them. The files are then yielded to
+    the consumer, the write stage. Each queue holds at most queue_size files, so a stage that runs ahead of the next
+    one waits for it instead of piling up files in memory, while all stages keep working on different files.
+
+    Files are yielded in the order their stages complete, not in the order of paths.
+
+    Attributes:
+        split: function splitting documents into chunks
+        embed: function embedding a list of texts, if None chunks are not embedded
+        formats: keys of the documents of ParsePDF.load_file that are ingested
+        parser_kwargs: arguments to pass to ParsePDF
+        parse_workers: number of parser processes
+        split_workers: number of splitter threads
+        embed_workers: number of embedding threads
+        embed_batch_size: number of chunks embedded per call to embed
+        queue_size: maximum number of files waiting between two stages
+    """
+
+    def __init__(
+        self,
+        split: Callable[[List[Document]], List[Document]],
+        embed: Optional[Callable[[List[str]], List[List[float]]]] = None,
+        formats: Iterable[str] = ("Text", "Tables"),
+        parser_kwargs: Optional[Dict[str, Any]] = None,
+        parse_workers: Union[int, str, None] = 1,
+        split_workers: Union[int, str] = 1,
+        embed_workers: Union[int, str] = 1,
+        embed_batch_size: Union[int, str] = 64,
+        queue_size: Union[int, str] = 4,
+    ):
+        """Initialize the pipeline.
+
+        Args:
+            split: function splitting documents into chunks, like Retriever.split_docs
+            embed: function embedding a list of texts, like the embed_documents method of the embedding function
+                of the vector database, defaults to None, chunks are not embedded
+            formats: keys of the documents of ParsePDF.load_file that are ingested, defaults to Text and Tables
+            parser_kwargs: arguments to pass to ParsePDF, defaults to None
+            parse_workers: number of parser processes, if None or 1 files are parsed in a thread, defaults to 1
+            split_workers: number of splitter threads, defaults to 1
+            embed_workers: number of embedding threads, defaults to 1
+            embed_batch_size: number of chunks embedded per call to embed, defaults to 64
+            queue_size: maximum number of files waiting between two stages, defaults to 4
+        """
+        self.split = split
+        self.embed = embed
+        self.formats = list(formats)
+        self.parser_kwargs = parser_kwargs
+        self.parse_workers = int(parse_workers) if parse_workers else 1
+        self.split_workers = int(split_workers)
+        self.embed_workers = int(embed_workers)
+        self.embed_batch_size = int(embed_batch_size)
+        self.queue_size = int(queue_size)
+
+    def _split_file(self, item: Tuple[Union[str, Path], Dict[str, List[Document]]]):
+        filepath, parsed = item
+        docs = [doc for key in self.formats for doc in parsed[key]]
+        return filepath, docs, self.split(docs), None
+
+    def _embed_file(self, item):
+        filepath, docs, chunks, _ = item
+        assert self.embed is not None
+        embeddings: List[List[float]] = []
+        for i in range(0, len(chunks), self.embed_batch_size):
+            batch = chunks[i : i + self.embed_batch_size]
+            embeddings.extend(self.embed([chunk.page_content for chunk in batch]))
+        return filepath, docs, chunks, embeddings
+
+    def run(
+        self, paths: Iterable[Union[str, Path]]
+    ) -> Iterator[
+        Tuple[
+            Union[str, Path],
+            List[Document],
+            List[Document],
+            Optional[List[List[float]]],
+        ]
+    ]:
+        """Runs the files through the stages, yielding each file once it is embedded.
+
+        Closing the iterator, or an error in a stage, stops all the stages. An error is raised in the consumer.
+
+        Args:
+            paths: paths of the PDF files to ingest
+
+        Yields:
+            tuples of the file path, its documents, their chunks and the embeddings of the chunks, None if the
+            pipeline does not embed
+        """
+        stop = threading.Event()
+        errors: List[BaseException] = []
+
+        def put(q: queue.Queue, item) -> bool:
+            """Puts an item, waiting while the queue is full, returns False if the pipeline was stopped."""
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def get(q: queue.Queue):
+            """Gets an item, returns _DONE if the pipeline was stopped."""
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _DONE
+
+        def fail(error: BaseException) -> None:
+            errors.append(error)
+            stop.set()
+
+        def parse(out_q: queue.Queue, num_consumers: int) -> None:
+            files = parse_files(
+                paths, parser_kwargs=self.parser_kwargs, workers=self.parse_workers
+            )
+            try:
+                for item in files:
+                    if not put(out_q, item):
+                        break
+            except BaseException as e:
+                fail(e)
+            finally:
+                files.close()
+                for _ in range(num_consumers):
+                    put(out_q, _DONE)
+
+        def stage(
+            fn: Callable,
+            in_q: queue.Queue,
+            out_q: queue.Queue,
+            workers: int,
+            num_consumers: int,
+        ) -> Callable[[], None]:
+            """Returns the work function of the threads of a stage, the last thread to finish signals the next stage."""
+            remaining = [workers]
+            lock = threading.Lock()
+
+            def work() -> None:
+                try:
+                    while (item := get(in_q)) is not _DONE:
+                        if not put(out_q, fn(item)):
+                            break
+                except BaseException as e:
+                    fail(e)
+                finally:
+                    with lock:
+                        remaining[0] -= 1
+                        last = remaining[0] == 0
+                    if last:
+                        for _ in range(num_consumers):
+                            put(out_q, _DONE)
+
+            return work
+
+        stages: List[Tuple[Callable, int]] = [(self._split_file, self.split_workers)]
+        if self.embed is not None:
+            stages.append((self._embed_file, self.embed_workers))
+        queues: List[queue.Queue] = [
+            queue.Queue(self.queue_size) for _ in range(len(stages) + 1)
+        ]
+        threads = [
+            threading.Thread(target=parse, args=(queues[0], stages[0][1]), daemon=True)
+        ]
+        for index, (fn, workers) in enumerate(stages):
+            # the consumer of the last stage is the caller
+            num_consumers = stages[index + 1][1] if index + 1 < len(stages) else 1
+            work = stage(fn, queues[index], queues[index + 1], workers, num_consumers)
+            threads.extend(
+                threading.Thread(target=work, daemon=True) for _ in range(workers)
+            )
+        for thread in threads:
+            thread.start()
+        try:
+            while (item := get(queues[-1])) is not _DONE:
+                yield item
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
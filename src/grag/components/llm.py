@@ -2,20 +2,12 @@
 
 import os
 from pathlib import Path
-from typing import Optional, Union
+from typing import Callable, Optional, Union
 
-import torch
+from grag.components.model_registry import get_model_registry
 from grag.components.utils import configure_args
 from langchain.callbacks.manager import CallbackManager
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
-from langchain_community.llms import LlamaCpp
-from langchain_community.llms.huggingface_pipeline import HuggingFacePipeline
-from transformers import (
-    AutoModelForCausalLM,
-    AutoTokenizer,
-    BitsAndBytesConfig,
-    pipeline,
-)
 
 
 @configure_args
@@ -37,6 +29,10 @@ class LLM:
         n_batch (int): Number of batches for GPU CPP, impacting batch processing.
         n_ctx (int): Context size for CPP, defining the extent of context considered.
         n_gpu_layers (int): Number of GPU layers for CPP, specifying computational depth.
+        batch_size (int): Maximum number of prompts generated together by the hf pipeline.
+        prompt_cache (str or None): KV cache of prompt prefixes for CPP, 'ram', 'disk' or None.
+        prompt_cache_size (int): Capacity of the CPP prompt cache in bytes.
+        prompt_cache_dir (str or Path or None): Directory of the CPP disk prompt cache.
         std_out (bool or str): Flag or descriptor for standard output during operations.
         base_dir (str or Path): Base directory path for model files, defaults to 'models'.
         callbacks (list or None): List of callback functions for additional processing.
@@ -54,6 +50,10 @@ class LLM:
         n_batch: Union[str, int] = 1024,
         n_ctx: Union[str, int] = 6000,
         n_gpu_layers: Union[str, int] = -1,
+        batch_size: Union[str, int] = 8,
+        prompt_cache: Optional[str] = None,
+        prompt_cache_size: Union[str, int] = 2 << 30,
+        prompt_cache_dir: Union[str, Path, None] = None,
         std_out: Union[bool, str] = True,
         base_dir: Union[str, Path] = Path("models"),
         callbacks=None,
@@ -71,6 +71,12 @@ class LLM:
             n_batch (int, optional): Adjusts batch processing size.
             n_ctx (int, optional): Configures the context size used in model operations.
             n_gpu_layers (int, optional): Sets the depth of computation in GPU layers.
+            batch_size (int, optional): Maximum number of prompts generated together by the hf pipeline.
+            prompt_cache (str, optional): Keeps the KV cache state of prompt prefixes for CPP, in 'ram' or on 'disk'.
+                Defaults to None, no cache.
+            prompt_cache_size (int, optional): Capacity of the CPP prompt cache in bytes, defaults to 2 GiB.
+            prompt_cache_dir (str or Path, optional): Directory of the CPP disk prompt cache, defaults to a
+                prompt_cache directory next to the model file.
             std_out (bool or str, optional): Manages standard output settings.
             base_dir (str or Path, optional): Specifies the directory for storing model files.
             callbacks (list, optional): Provides custom callback functions for runtime.
@@ -86,6 +92,14 @@ class LLM:
         self.n_batch = n_batch
         self.n_ctx = n_ctx
         self.n_gpu_layers = n_gpu_layers
+        self.batch_size = int(batch_size)
+        if prompt_cache not in (None, "ram", "disk"):
+            raise ValueError(
+                f"{prompt_cache} is not a valid prompt_cache. Choose from 'ram', 'disk' or None."
+            )
+        self.prompt_cache = prompt_cache
+        self.prompt_cache_size = int(prompt_cache_size)
+        self.prompt_cache_dir = prompt_cache_dir
         if std_out:
             self.callback_manager = CallbackManager([StreamingStdOutCallbackHandler()])
         else:
@@ -114,6 +128,16 @@ class LLM:
         Args:
             is_local (bool): Whether to load the model from a local path.
         """
+        # torch and transformers take seconds to import, only import them when loading a model
+        import torch
+        from langchain_community.llms.huggingface_pipeline import HuggingFacePipeline
+        from transformers import (
+            AutoModelForCausalLM,
+            AutoTokenizer,
+            BitsAndBytesConfig,
+            pipeline,
+        )
+
         if is_local:
             hf_model = Path(self.model_path).parent
         else:
@@ -151,6 +175,11 @@ class LLM:
                 token=True,
             )
 
+        if tokenizer.pad_token is None:
+            # batched generation pads the prompts, on the left for decoder only models
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+
         pipe = pipeline(
             self.task,
             model=model,
@@ -164,12 +193,16 @@ class LLM:
             eos_token_id=tokenizer.eos_token_id,
         )
         llm = HuggingFacePipeline(
-            pipeline=pipe, model_kwargs={"temperature": self.temperature}
+            pipeline=pipe,
+            model_kwargs={"temperature": self.temperature},
+            batch_size=self.batch_size,
         )
         return llm
 
     def llama_cpp(self):
         """Loads the model using a custom CPP pipeline."""
+        from langchain_community.llms import LlamaCpp
+
         # https://stackoverflow.com/a/77734908/13808323
         llm = LlamaCpp(
             model_path=self.model_path,
@@ -181,8 +214,79 @@ class LLM:
             callbacks=self.callback_manager,
             verbose=True,  # Verbose is required to pass to the callback manager
         )
+        if self.prompt_cache is not None:
+            llm.client.set_cache(self._llama_cache())
         return llm
 
+    def _llama_cache(self):
+        """Creates the llama.cpp cache of KV states, looked up by the longest common prefix of the prompt tokens."""
+        from llama_cpp import LlamaDiskCache, LlamaRAMCache
+
+        if self.prompt_cache == "disk":
+            cache_dir = self.prompt_cache_dir
+            if cache_dir is None:
+                cache_dir = Path(self.model_path).parent / "prompt_cache"
+            return LlamaDiskCache(
+                cache_dir=str(cache_dir), capacity_bytes=self.prompt_cache_size
+            )
+        return LlamaRAMCache(capacity_bytes=self.prompt_cache_size)
+
+    def get_token_counter(self, llm) -> Callable[[str], int]:
+        """Returns a function counting the tokens of a text with the tokenizer of a loaded model.
+
+        Args:
+            llm: The model returned by load_model.
+
+        Returns:
+            Callable: A function returning the number of tokens of a text, without special tokens.
+        """
+        match self.pipeline:
+            case "llama_cpp":
+                return lambda text: len(
+                    llm.client.tokenize(text.encode("utf-8"), add_bos=False)
+                )
+            case "hf":
+                tokenizer = llm.pipeline.tokenizer
+                return lambda text: len(
+                    tokenizer.encode(text, add_special_tokens=False)
+                )
+        return llm.get_num_tokens
+
+    def warm_prompt_cache(self, llm, prompt) -> bool:
+        """Evaluates the static prefix of a prompt and stores its KV state in the prompt cache.
+
+        When a later prompt starts with the prefix, llama.cpp restores the state from the cache and only evaluates
+        the rest of the prompt, the context and question. The prefix is evaluated once, a disk cache keeps it
+        across processes.
+
+        Args:
+            llm: The model returned by load_model.
+            prompt (Prompt): The prompt whose static prefix is cached.
+
+        Returns:
+            bool: Whether the prefix state is in the cache, always False without a CPP prompt cache.
+        """
+        client = getattr(llm, "client", None)
+        if self.pipeline != "llama_cpp" or getattr(client, "cache", None) is None:
+            return False
+        prefix = prompt.static_prefix
+        # the last token of the prefix may merge with the following text, so it is left out
+        tokens = client.tokenize(prefix.encode("utf-8"), special=True)[:-1]
+        if len(tokens) < 2:
+            return False
+        try:
+            state = client.cache[tokens]
+            if client.longest_token_prefix(state.input_ids.tolist(), tokens) == len(
+                tokens
+            ):
+                return True
+        except KeyError:
+            pass
+        client.reset()
+        client.eval(tokens)
+        client.cache[tokens] = client.save_state()
+        return True
+
     def load_model(
         self,
         model_name: Optional[str] = None,
@@ -212,3 +316,71 @@ class LLM:
                 return self.llama_cpp()
             case "hf":
                 return self.hf_pipeline(is_local=is_local)
+
+    def model_key(self, is_local: bool = False) -> tuple:
+        """Returns the key of the model in the model registry, the arguments the model is loaded with.
+
+        Args:
+            is_local (bool): Whether the model is loaded from a local directory.
+        """
+        return tuple(
+            str(value)
+            for value in (
+                self.model_name,
+                self.quantization,
+                self.pipeline,
+                self.n_ctx,
+                self.n_gpu_layers,
+                self.n_batch,
+                self.max_new_tokens,
+                self.temperature,
+                self.device_map,
+                self.task,
+                self.batch_size,
+                self.prompt_cache,
+                is_local,
+            )
+        )
+
+    def model_size(self, llm) -> int:
+        """Estimates the memory of a loaded model in bytes.
+
+        Args:
+            llm: The model returned by load_model.
+        """
+        match self.pipeline:
+            case "llama_cpp":
+                # the weights are memory mapped from the model file
+                return os.path.getsize(self.model_path)
+            case "hf":
+                return llm.pipeline.model.get_memory_footprint()
+        return 0
+
+    def acquire_model(
+        self,
+        model_name: Optional[str] = None,
+        pipeline: Optional[str] = None,
+        quantization: Optional[str] = None,
+        is_local: Optional[bool] = None,
+    ):
+        """Returns a handle of the model from the process wide model registry, loading it if it is not loaded.
+
+        Models loaded with the same arguments are shared, the model is only loaded once per process. Release the
+        handle when the model is no longer used, the registry may then unload it. Takes the arguments of load_model.
+
+        Returns:
+            ModelHandle: An acquired handle, its model attribute is the model returned by load_model.
+        """
+        if model_name is not None:
+            self.model_name = model_name
+        if pipeline is not None:
+            self.pipeline = pipeline
+        if quantization is not None:
+            self.quantization = quantization
+        if is_local is None:
+            is_local = False
+        return get_model_registry().acquire(
+            self.model_key(is_local),
+            loader=lambda: self.load_model(is_local=is_local),
+            size=self.model_size,
+        )
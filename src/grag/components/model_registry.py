@@ -0,0 +1,248 @@
+"""Class for sharing loaded models across a process.
+
+This module provides:
+
+— ModelHandle
+
+— ModelRegistry
+
+— get_model_registry: returns the process wide ModelRegistry
+"""
+
+import gc
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Union
+
+from grag.components.utils import configure_args
+
+
+class _Entry:
+    """A loaded model, its estimated size in bytes and its number of acquired handles."""
+
+    def __init__(self, model: Any, size: int):
+        self.model = model
+        self.size = size
+        self.refs = 0
+        self.lock = threading.RLock()
+
+
+class ModelHandle:
+    """A reference to a model of a ModelRegistry, the model is not unloaded while the handle is acquired.
+
+    llama.cpp and transformers models must not generate from several threads at once, hold the lock of the handle
+    while generating. The lock is shared by all handles of the model.
+
+    Attributes:
+        key: key of the model in the registry
+        model: the loaded model
+        lock: reentrant lock of the model
+    """
+
+    def __init__(self, registry: "ModelRegistry", key: Hashable, entry: _Entry):
+        """Initialize an acquired handle, use ModelRegistry.acquire instead."""
+        self._registry = registry
+        self._entry: Optional[_Entry] = entry
+        self.key = key
+        self.lock = entry.lock
+
+    @property
+    def model(self) -> Any:
+        """The loaded model."""
+        if self._entry is None:
+            raise RuntimeError(f"The handle of model {self.key} was released.")
+        return self._entry.model
+
+    @property
+    def released(self) -> bool:
+        """Whether the handle was released."""
+        return self._entry is None
+
+    def release(self) -> None:
+        """Releases the handle, the model can be unloaded once all its handles are released."""
+        if self._entry is not None:
+            self._entry = None
+            self._registry._release(self.key)
+
+    def __enter__(self) -> "ModelHandle":
+        """Returns the handle."""
+        return self
+
+    def __exit__(self, *args) -> None:
+        """Releases the handle."""
+        self.release()
+
+    def __del__(self):
+        """Releases the handle when it is garbage collected."""
+        try:
+            self.release()
+        except Exception:
+            pass
+
+
+@configure_args
+class ModelRegistry:
+    """A thread safe cache of loaded models, shared by the whole process.
+
+    Models are loaded once per key and handed out as ModelHandles, counting their references. A model whose handles
+    are all released stays loaded, so it is not reloaded when it is acquired again, until it is unloaded in least
+    recently used order to keep the registry under max_models models and max_memory_gb of memory. Acquired models
+    are never unloaded, the registry can exceed its limits while they are in use.
+
+    Attributes:
+        max_models: maximum number of loaded models, None for no limit
+        max_memory: maximum estimated memory of the loaded models in bytes, None for no limit
+    """
+
+    def __init__(
+        self,
+        max_models: Union[int, str, None] = None,
+        max_memory_gb: Union[float, str, None] = None,
+    ):
+        """Initialize an empty registry.
+
+        Args:
+            max_models: maximum number of loaded models, defaults to None, no limit
+            max_memory_gb: maximum estimated memory of the loaded models in GB, defaults to None, no limit
+        """
+        self.max_models = int(max_models) if max_models else None
+        self.max_memory = int(float(max_memory_gb) * 1e9) if max_memory_gb else None
+        self._entries: OrderedDict[Hashable, _Entry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Hashable, threading.Lock] = {}
+
+    def __len__(self) -> int:
+        """Number of loaded models."""
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether the model of key is loaded."""
+        return key in self._entries
+
+    def keys(self) -> List[Hashable]:
+        """Keys of the loaded models, from the least to the most recently used."""
+        with self._lock:
+            return list(self._entries)
+
+    @property
+    def memory(self) -> int:
+        """Estimated memory of the loaded models in bytes."""
+        with self._lock:
+            return sum(entry.size for entry in self._entries.values())
+
+    def acquire(
+        self,
+        key: Hashable,
+        loader: Callable[[], Any],
+        size: Optional[Callable[[Any], int]] = None,
+    ) -> ModelHandle:
+        """Returns a handle of the model of key, loading it with loader if it is not loaded.
+
+        Concurrent calls for the same key load the model once, the other callers wait for it.
+
+        Args:
+            key: key identifying the model and the arguments it is loaded with
+            loader: function loading the model
+            size: function estimating the memory of the loaded model in bytes, optional
+
+        Returns:
+            an acquired ModelHandle, release it when the model is no longer used
+        """
+        with self._lock:
+            entry = self._acquire_entry(key)
+            if entry is not None:
+                return ModelHandle(self, key, entry)
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            with self._lock:
+                entry = self._acquire_entry(key)
+                if entry is not None:
+                    return ModelHandle(self, key, entry)
+                # unloads models before loading, the new model may not fit next to them
+                unloaded = self._evict(reserve=1)
+            self._unload(unloaded)
+            model = loader()
+            model_size = size(model) if size is not None else 0
+            with self._lock:
+                entry = _Entry(model, model_size)
+                entry.refs += 1
+                self._entries[key] = entry
+                self._load_locks.pop(key, None)
+                unloaded = self._evict()
+        self._unload(unloaded)
+        return ModelHandle(self, key, entry)
+
+    def _acquire_entry(self, key: Hashable) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry.refs += 1
+            self._entries.move_to_end(key)
+        return entry
+
+    def _release(self, key: Hashable) -> None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refs -= 1
+            unloaded = self._evict()
+        self._unload(unloaded)
+
+    def _over_limits(self, reserve: int = 0) -> bool:
+        if (
+            self.max_models is not None
+            and len(self._entries) + reserve > self.max_models
+        ):
+            return True
+        if self.max_memory is not None:
+            return sum(entry.size for entry in self._entries.values()) > self.max_memory
+        return False
+
+    def _evict(self, reserve: int = 0) -> List[_Entry]:
+        """Removes unreferenced models in least recently used order while the registry is over its limits."""
+        unloaded = []
+        for key in list(self._entries):
+            if not self._over_limits(reserve):
+                break
+            if self._entries[key].refs <= 0:
+                unloaded.append(self._entries.pop(key))
+        return unloaded
+
+    def clear(self) -> None:
+        """Unloads all models that have no acquired handles."""
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if entry.refs <= 0]
+            unloaded = [self._entries.pop(key) for key in keys]
+        self._unload(unloaded)
+
+    @staticmethod
+    def _unload(entries: List[_Entry]) -> None:
+        """Frees the memory of removed models, once the models are not generating."""
+        if not entries:
+            return
+        for entry in entries:
+            # waits for generations still holding the lock of a released handle
+            with entry.lock:
+                # llama.cpp frees the model and its context on close
+                close = getattr(getattr(entry.model, "client", None), "close", None)
+                if callable(close):
+                    close()
+                entry.model = None
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Returns the process wide ModelRegistry, configured from the model_registry section of 'config.ini'."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+        return _registry
@@ -5,15 +5,19 @@ This module provides:
 — Retriever
 """
 
+import asyncio
 import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Union
 
-from grag.components.parse_pdf import ParsePDF
+from grag.components.docstore import SQLiteStore
+from grag.components.ingest_manifest import IngestManifest
+from grag.components.ingest_pipeline import IngestPipeline
+from grag.components.parse_pdf import load_file
 from grag.components.text_splitter import TextSplitter
-from grag.components.utils import configure_args
+from grag.components.utils import LRUCache, configure_args, hash_file
 from grag.components.vectordb.base import VectorDB
-from grag.components.vectordb.deeplake_client import DeepLakeClient
 from langchain.retrievers.multi_vector import MultiVectorRetriever
 from langchain.storage import LocalFileStore
 from langchain_core.documents import Document
@@ -34,12 +38,19 @@ class Retriever:
                    (Optional, if the user provides it, store_path, id_key and namespace is not considered)
         store_path: Path to the local file store
         id_key: A key prefix for identifying documents
-        store: langchain.storage.LocalFileStore object, stores the key value pairs of document id and parent file
+        docstore_type: Type of the parent document store, 'local_file' or 'sqlite'
+        store: langchain.storage.LocalFileStore or components.docstore.SQLiteStore object,
+               stores the key value pairs of document id and parent file
         retriever: langchain.retrievers.multi_vector.MultiVectorRetriever class instance,
                     langchain's multi-vector retriever
         splitter: TextSplitter class instance from components.text_splitter
         namespace: Namespace for producing unique id
         top_k: Number of top chunks to return from similarity search.
+        manifest_path: Path to the ingest manifest, records ingested files to skip unchanged files on re-ingest
+        query_embedding_cache: LRU cache of query embeddings, keyed by query
+        result_cache: LRU cache of get_chunk results, keyed by (query, top_k, with_score), cleared when the
+                      vector database changes
+        doc_cache: LRU cache of parent documents, keyed by document id
 
     """
 
@@ -51,6 +62,11 @@ class Retriever:
         id_key: str = "doc_id",
         namespace: str = "71e4b558187b270922923569301f1039",
         client_kwargs: Optional[Dict[str, Any]] = None,
+        manifest_path: Optional[Union[str, Path]] = None,
+        docstore_type: str = "local_file",
+        docstore_compression: Optional[str] = None,
+        cache_size: Union[int, str] = 1024,
+        doc_cache_size: Union[int, str] = 256,
     ):
         """Initialize the Retriever.
 
@@ -61,6 +77,16 @@ class Retriever:
         namespace: A namespace for producing unique id
         top_k: Number of top chunks to return from similarity search, defaults to 3
         client_kwargs: kwargs to pass to the vectordb client constructor, optional, defaults to None
+        manifest_path: Path to the ingest manifest, defaults to '<store_path>.manifest.json' next to the store
+        docstore_type: Type of the parent document store, defaults to 'local_file'
+                       'local_file': langchain LocalFileStore, one file per document under store_path
+                       'sqlite': SQLiteStore, a single '<store_path>.sqlite' file
+        docstore_compression: Compression of the parent documents in the sqlite store, 'zstd' or None,
+                              defaults to None
+        cache_size: Maximum number of entries in the query embedding cache and in the result cache, 0 disables
+                    the caches, defaults to 1024
+        doc_cache_size: Maximum number of parent documents in the document cache, 0 disables the cache,
+                        defaults to 256
         """
         self.store_path = store_path
         self.id_key = id_key
@@ -72,13 +98,25 @@ class Retriever:
                 raise TypeError(
                     "Arguments [store_path, id_key, namespace] or vectordb must be provided."
                 )
+            from grag.components.vectordb.deeplake_client import DeepLakeClient
+
             if client_kwargs is not None:
                 self.vectordb = DeepLakeClient(**client_kwargs)
             else:
                 self.vectordb = DeepLakeClient()
         else:
             self.vectordb = vectordb
-        self.store = LocalFileStore(self.store_path)
+        self.docstore_type = docstore_type
+        match self.docstore_type:
+            case "local_file":
+                self.store = LocalFileStore(self.store_path)
+            case "sqlite":
+                self.store = SQLiteStore(
+                    Path(f"{self.store_path}.sqlite"),
+                    compression=docstore_compression or None,
+                )
+            case _:
+                raise ValueError(f"docstore_type {self.docstore_type} is invalid.")
         self.retriever = MultiVectorRetriever(
             vectorstore=self.vectordb.langchain_client,
             byte_store=self.store,  # type: ignore
@@ -88,6 +126,13 @@ class Retriever:
         self.splitter = TextSplitter()
         self.top_k: int = int(top_k)
         self.retriever.search_kwargs = {"k": self.top_k}
+        if manifest_path is None:
+            manifest_path = Path(f"{self.store_path}.manifest.json")
+        self.manifest_path = Path(manifest_path)
+        self.query_embedding_cache = LRUCache(cache_size)
+        self.result_cache = LRUCache(cache_size)
+        self.doc_cache = LRUCache(doc_cache_size)
+        self._cache_version = self.vectordb.version
 
     def id_gen(self, doc: Document) -> str:
         """Takes a document and returns a unique id (uuid5) using the namespace and document source.
@@ -147,28 +192,145 @@ class Retriever:
 
         """
         chunks = self.split_docs(docs)
+        self.add_split_docs(docs, chunks)
+
+    def add_split_docs(
+        self,
+        docs: List[Document],
+        chunks: List[Document],
+        embeddings: Optional[List[List[float]]] = None,
+    ):
+        """Adds the chunks of documents into the vector database and the documents into the file store.
+
+        The vector database is saved after the chunks are added.
+
+        Args:
+            docs: List of langchain_core.documents.Document
+            chunks: chunks of the documents, as returned by split_docs
+            embeddings: embeddings of the chunks from the embedding function of the vector database, optional,
+                if None the vector database embeds the chunks
+
+        Returns:
+            None
+
+        """
+        self._add_split_docs(docs, chunks, embeddings)
+        self.vectordb.save()
+
+    def _add_split_docs(
+        self,
+        docs: List[Document],
+        chunks: List[Document],
+        embeddings: Optional[List[List[float]]] = None,
+    ):
+        """Adds the chunks and documents like add_split_docs without saving the vector database, used by ingest."""
+        if embeddings is None:
+            self.vectordb.add_docs(chunks)
+        else:
+            self.vectordb.add_embedded_docs(chunks, embeddings)
         doc_ids = self.gen_doc_ids(docs)
-        self.vectordb.add_docs(chunks)
+        self._uncache_docs(doc_ids)
         self.retriever.docstore.mset(list(zip(doc_ids, docs)))
 
-    async def aadd_docs(self, docs: List[Document]):
+    def _pipeline_embed(self):
+        """Returns the function embedding chunks in the ingest pipeline, None if the vector database embeds them."""
+        if type(self.vectordb).add_embedded_docs is VectorDB.add_embedded_docs:
+            return None
+        embedding_function = getattr(self.vectordb, "embedding_function", None)
+        return embedding_function.embed_documents if embedding_function else None
+
+    async def aadd_docs(self, docs: List[Document], verbose: bool = True):
         """Adds given documents into the vector database also adds the parent document into the file store.
 
+        Splitting, writing to the file store and saving the vector database run in a worker thread, so the event loop
+        is not blocked.
+
         Args:
             docs: List of langchain_core.documents.Document
+            verbose: if True, shows the progress of adding the chunks to the vector database
 
         Returns:
             None
 
         """
-        chunks = self.split_docs(docs)
+        await self._aadd_docs(docs, verbose=verbose)
+        await asyncio.to_thread(self.vectordb.save)
+
+    async def _aadd_docs(self, docs: List[Document], verbose: bool = True):
+        """Adds documents like aadd_docs without saving the vector database, used by aingest."""
+        chunks = await asyncio.to_thread(self.split_docs, docs)
         doc_ids = self.gen_doc_ids(docs)
-        await self.vectordb.aadd_docs(chunks)
-        self.retriever.docstore.mset(list(zip(doc_ids, docs)))
+        await self.vectordb.aadd_docs(chunks, verbose=verbose)
+        self._uncache_docs(doc_ids)
+        await asyncio.to_thread(self.retriever.docstore.mset, list(zip(doc_ids, docs)))
+
+    def delete_docs(self, doc_ids: List[str]):
+        """Deletes the given parent documents from the file store and their chunks from the vector database.
+
+        The vector database is saved after the chunks are deleted.
+
+        Args:
+            doc_ids: ids of the parent documents
+
+        Returns:
+            None
+
+        """
+        self._delete_docs(doc_ids)
+        self.vectordb.save()
+
+    def _delete_docs(self, doc_ids: List[str]):
+        """Deletes documents like delete_docs without saving the vector database, used by ingest."""
+        self.vectordb.delete_docs(doc_ids, id_key=self.id_key)
+        self._uncache_docs(doc_ids)
+        self.retriever.docstore.mdelete(doc_ids)
+
+    def _uncache_docs(self, doc_ids: List[str]) -> None:
+        """Removes documents that are replaced or deleted from the document cache."""
+        for doc_id in doc_ids:
+            self.doc_cache.pop(doc_id)
+
+    def _check_result_cache(self) -> int:
+        """Clears the result cache if the vector database changed since the results were cached.
+
+        Returns:
+            the current version of the vector database
+        """
+        version = self.vectordb.version
+        if version != self._cache_version:
+            self.result_cache.clear()
+            self._cache_version = version
+        return version
+
+    def _cache_result(self, key, chunks, version: int) -> None:
+        """Caches a result, unless the vector database changed while it was searched."""
+        if self.vectordb.version == version:
+            self.result_cache.put(key, chunks)
+
+    def _embed_query(self, query: str) -> List[float]:
+        """Returns the embedding of a query, from the query embedding cache if possible."""
+        embedding = self.query_embedding_cache.get(query)
+        if embedding is None:
+            embedding = self.vectordb.embedding_function.embed_query(query)  # type: ignore
+            self.query_embedding_cache.put(query, embedding)
+        return embedding
+
+    def _search(self, query: str, with_score: bool, top_k: int):
+        if getattr(self.vectordb, "embedding_function", None) is not None:
+            try:
+                return self.vectordb.get_chunk_by_vector(
+                    self._embed_query(query), top_k=top_k, with_score=with_score
+                )
+            except NotImplementedError:
+                pass
+        return self.vectordb.get_chunk(query=query, top_k=top_k, with_score=with_score)
 
     def get_chunk(self, query: str, with_score=False, top_k=None):
         """Returns the most similar chunks from the vector database.
 
+        Results and query embeddings are cached, a repeated query is answered from the result cache until the
+        vector database changes.
+
         Args:
             query: A query string
             with_score: Outputs scores of returned chunks
@@ -179,11 +341,51 @@ class Retriever:
 
         """
         _top_k = top_k if top_k else self.retriever.search_kwargs["k"]
-        return self.vectordb.get_chunk(query=query, top_k=_top_k, with_score=with_score)
+        version = self._check_result_cache()
+        key = (query, _top_k, with_score)
+        chunks = self.result_cache.get(key)
+        if chunks is None:
+            chunks = self._search(query, with_score=with_score, top_k=_top_k)
+            self._cache_result(key, chunks, version)
+        return list(chunks)
+
+    def get_chunks(self, queries: List[str], with_score=False, top_k=None):
+        """Returns the most similar chunks from the vector database for each query.
+
+        Queries missing from the result cache are embedded in a single batch and searched together where the vector
+        database supports it.
+
+        Args:
+            queries: A list of query strings
+            with_score: Outputs scores of returned chunks
+            top_k: Number of top similar chunks to return per query, if None defaults to self.top_k
+
+        Returns:
+            list of lists of Documents, one list per query
+
+        """
+        _top_k = top_k if top_k else self.retriever.search_kwargs["k"]
+        version = self._check_result_cache()
+        results = {}
+        for query in queries:
+            chunks = self.result_cache.get((query, _top_k, with_score))
+            if chunks is not None:
+                results[query] = chunks
+        missing = [query for query in dict.fromkeys(queries) if query not in results]
+        if missing:
+            searched = self.vectordb.get_chunks(
+                queries=missing, top_k=_top_k, with_score=with_score
+            )
+            for query, chunks in zip(missing, searched):
+                self._cache_result((query, _top_k, with_score), chunks, version)
+                results[query] = chunks
+        return [list(results[query]) for query in queries]
 
     async def aget_chunk(self, query: str, with_score=False, top_k=None):
         """Returns the most (cosine) similar chunks from the vector database, asynchronously.
 
+        Results are cached like get_chunk.
+
         Args:
             query: A query string
             with_score: Outputs scores of returned chunks
@@ -194,9 +396,15 @@ class Retriever:
 
         """
         _top_k = top_k if top_k else self.retriever.search_kwargs["k"]
-        return await self.vectordb.aget_chunk(
-            query=query, top_k=_top_k, with_score=with_score
-        )
+        version = self._check_result_cache()
+        key = (query, _top_k, with_score)
+        chunks = self.result_cache.get(key)
+        if chunks is None:
+            chunks = await self.vectordb.aget_chunk(
+                query=query, top_k=_top_k, with_score=with_score
+            )
+            self._cache_result(key, chunks, version)
+        return list(chunks)
 
     def get_doc(self, query: str):
         """Returns the parent document of the most (cosine) similar chunk from the vector database.
@@ -223,24 +431,34 @@ class Retriever:
     def get_docs_from_chunks(self, chunks: List[Document], one_to_one=False):
         """Returns the parent documents of chunks.
 
+        The parents are fetched from the file store in a single batch, parents in the document cache are not
+        fetched again.
+
         Args:
-            chunks: chunks from vector store
-            one_to_one: if True, returns parent doc for each chunk
+            chunks: chunks from vector store in rank order, or (chunk, score) tuples
+            one_to_one: if True, returns parent doc for each chunk, None for chunks without a stored parent
         Returns:
-             parent documents
+             parent documents, in the order of the chunks, without duplicates unless one_to_one
         """
-        ids = []
-        for d in chunks:
-            if one_to_one:
-                if self.id_key in d.metadata:
-                    ids.append(d.metadata[self.id_key])
-                docs = self.retriever.docstore.mget(ids)
-                return docs
-            else:
-                if self.id_key in d.metadata and d.metadata[self.id_key] not in ids:
-                    ids.append(d.metadata[self.id_key])
-                docs = self.retriever.docstore.mget(ids)
-                return [d for d in docs if d is not None]
+        ids = [
+            (chunk[0] if isinstance(chunk, tuple) else chunk).metadata.get(self.id_key)
+            for chunk in chunks
+        ]
+        unique_ids = [_id for _id in dict.fromkeys(ids) if _id is not None]
+        docs = {}
+        for _id in unique_ids:
+            doc = self.doc_cache.get(_id)
+            if doc is not None:
+                docs[_id] = doc
+        missing = [_id for _id in unique_ids if _id not in docs]
+        if missing:
+            for _id, doc in zip(missing, self.retriever.docstore.mget(missing)):
+                if doc is not None:
+                    self.doc_cache.put(_id, doc)
+                    docs[_id] = doc
+        if one_to_one:
+            return [docs.get(_id) for _id in ids]
+        return [docs[_id] for _id in unique_ids if _id in docs]
 
     def ingest(
         self,
@@ -249,40 +467,92 @@ class Retriever:
         dry_run: bool = False,
         verbose: bool = True,
         parser_kwargs: Optional[Dict[str, Any]] = None,
+        workers: Optional[int] = None,
+        incremental: bool = True,
+        split_workers: int = 1,
+        embed_workers: int = 1,
+        queue_size: int = 4,
     ):
         """Ingests the files in directory.
 
+        Files go through an IngestPipeline: they are parsed, split and embedded in concurrent stages, and added to
+        the vector database in the main process as soon as each file is embedded. With workers > 1, files are
+        parsed across a process pool. Vector databases that do not support adding precomputed embeddings embed the
+        chunks when they are added.
+
+        With incremental, ingested files are recorded in the ingest manifest. Files that are unchanged since they
+        were recorded are skipped and the documents of changed files are replaced.
+
         Args:
             dir_path: path to the directory
             glob_pattern: glob pattern to identify files
             dry_run: if True, does not ingest any files
             verbose: if True, shows progress
             parser_kwargs: arguments to pass to the parser
+            workers: number of processes used for parsing, if None files are parsed in the main process
+            incremental: if True, skips files that are unchanged since the last ingest
+            split_workers: number of threads splitting documents into chunks
+            embed_workers: number of threads embedding chunks
+            queue_size: maximum number of files waiting between two stages of the pipeline
 
         """
         _formats_to_add = ["Text", "Tables"]
-        filepath_gen = Path(dir_path).glob(glob_pattern)
-        if parser_kwargs:
-            parser = ParsePDF(parser_kwargs)
-        else:
-            parser = ParsePDF()
-        if verbose:
-            num_files = len(list(Path(dir_path).glob(glob_pattern)))
-            pbar = tqdm(filepath_gen, total=num_files, desc="Ingesting Files")
-            for filepath in pbar:
-                if not dry_run:
-                    pbar.set_postfix_str(
-                        f"Parsing file - {filepath.relative_to(dir_path)}"
-                    )
-                    docs = parser.load_file(filepath)
-                    pbar.set_postfix_str(
-                        f"Adding file - {filepath.relative_to(dir_path)}"
-                    )
-                    for format_key in _formats_to_add:
-                        self.add_docs(docs[format_key])
-                    print(f"Completed adding - {filepath.relative_to(dir_path)}")
-                else:
-                    print(f"DRY RUN: found - {filepath.relative_to(dir_path)}")
+        filepaths = list(Path(dir_path).glob(glob_pattern))
+        manifest = self._load_manifest() if incremental else None
+        if manifest is not None:
+            num_files = len(filepaths)
+            filepaths = [fp for fp in filepaths if not manifest.is_unchanged(fp)]
+            if verbose:
+                print(f"Skipping {num_files - len(filepaths)} unchanged files")
+        if dry_run:
+            for filepath in filepaths:
+                print(f"DRY RUN: found - {filepath.relative_to(dir_path)}")
+            return
+        pipeline = IngestPipeline(
+            split=self.split_docs,
+            embed=self._pipeline_embed(),
+            formats=_formats_to_add,
+            parser_kwargs=parser_kwargs,
+            parse_workers=workers,
+            split_workers=split_workers,
+            embed_workers=embed_workers,
+            embed_batch_size=self.vectordb.batch_size,
+            queue_size=queue_size,
+        )
+        files = pipeline.run(filepaths)
+        pbar = tqdm(
+            files,
+            total=len(filepaths),
+            desc="Ingesting Files",
+            disable=not verbose,
+        )
+        try:
+            for filepath, docs, chunks, embeddings in pbar:
+                pbar.set_postfix_str(
+                    f"Adding file - {Path(filepath).relative_to(dir_path)}"
+                )
+                if manifest is not None and filepath in manifest:
+                    self._delete_docs(manifest.doc_ids(filepath))
+                self._add_split_docs(docs, chunks, embeddings)
+                if manifest is not None:
+                    manifest.update(filepath, self.gen_doc_ids(docs))
+                if verbose:
+                    print(f"Completed adding - {Path(filepath).relative_to(dir_path)}")
+        finally:
+            # stops the pipeline if adding a file failed
+            files.close()
+            # the vector database is saved first, the manifest must not record files that were not saved
+            self.vectordb.save()
+            if manifest is not None:
+                manifest.save()
+
+    def _load_manifest(self) -> IngestManifest:
+        """Loads the ingest manifest, discarding it if the vector database is empty."""
+        manifest = IngestManifest(self.manifest_path)
+        if len(manifest) > 0 and len(self.vectordb) == 0:
+            # the vector database was reset, the recorded files are no longer ingested
+            manifest.clear()
+        return manifest
 
     async def aingest(
         self,
@@ -291,37 +561,92 @@ class Retriever:
         dry_run: bool = False,
         verbose: bool = True,
         parser_kwargs: Optional[Dict[str, Any]] = None,
+        max_concurrency: int = 4,
+        workers: Optional[int] = None,
+        executor: Optional[Executor] = None,
+        incremental: bool = True,
     ):
         """Asynchronously ingests the files in directory.
 
+        Up to max_concurrency files are ingested at once: they are parsed in an executor and added with concurrent
+        aadd_docs calls, so the event loop keeps serving other tasks while files are ingested. Files are parsed in
+        the default executor of the event loop (threads), in a process pool of workers processes, or in the given
+        executor.
+
+        With incremental, files are skipped or replaced like in ingest.
+
         Args:
             dir_path: path to the directory
             glob_pattern: glob pattern to identify files
             dry_run: if True, does not ingest any files
             verbose: if True, shows progress
             parser_kwargs: arguments to pass to the parser
+            max_concurrency: maximum number of files ingested at once
+            workers: number of processes used for parsing, if None or 1 files are parsed in the default executor
+            executor: executor used for parsing, optional, overrides workers
+            incremental: if True, skips files that are unchanged since the last ingest
 
         """
         _formats_to_add = ["Text", "Tables"]
-        filepath_gen = Path(dir_path).glob(glob_pattern)
-        if parser_kwargs:
-            parser = ParsePDF(parser_kwargs)
-        else:
-            parser = ParsePDF()
-        if verbose:
-            num_files = len(list(Path(dir_path).glob(glob_pattern)))
-            pbar = atqdm(filepath_gen, total=num_files, desc="Ingesting Files")
-            for filepath in pbar:
-                if not dry_run:
-                    pbar.set_postfix_str(
-                        f"Parsing file - {filepath.relative_to(dir_path)}"
+        filepaths = list(Path(dir_path).glob(glob_pattern))
+        manifest = await asyncio.to_thread(self._load_manifest) if incremental else None
+        if manifest is not None:
+            num_files = len(filepaths)
+            unchanged = await asyncio.to_thread(
+                lambda: [manifest.is_unchanged(fp) for fp in filepaths]
+            )
+            filepaths = [fp for fp, skip in zip(filepaths, unchanged) if not skip]
+            if verbose:
+                print(f"Skipping {num_files - len(filepaths)} unchanged files")
+        if dry_run:
+            for filepath in filepaths:
+                print(f"DRY RUN: found - {filepath.relative_to(dir_path)}")
+            return
+        own_executor = None
+        if executor is None and workers and int(workers) > 1:
+            executor = own_executor = ProcessPoolExecutor(max_workers=int(workers))
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(int(max_concurrency))
+        pbar = atqdm(total=len(filepaths), desc="Ingesting Files", disable=not verbose)
+
+        async def ingest_file(filepath: Path):
+            async with semaphore:
+                parse = loop.run_in_executor(
+                    executor, load_file, filepath, parser_kwargs
+                )
+                if manifest is not None:
+                    # hashed next to the parse, the event loop only records the hash
+                    file_hash, docs = await asyncio.gather(
+                        asyncio.to_thread(hash_file, filepath), parse
                     )
-                    docs = parser.load_file(filepath)
-                    pbar.set_postfix_str(
-                        f"Adding file - {filepath.relative_to(dir_path)}"
+                else:
+                    docs = await parse
+                if manifest is not None and filepath in manifest:
+                    await asyncio.to_thread(
+                        self._delete_docs, manifest.doc_ids(filepath)
+                    )
+                docs_to_add = [doc for key in _formats_to_add for doc in docs[key]]
+                # concurrent files would interleave their progress bars
+                await self._aadd_docs(docs_to_add, verbose=False)
+                if manifest is not None:
+                    manifest.update(
+                        filepath, self.gen_doc_ids(docs_to_add), file_hash=file_hash
                     )
-                    for format_key in _formats_to_add:
-                        await self.aadd_docs(docs[format_key])
+                pbar.update(1)
+                if verbose:
                     print(f"Completed adding - {filepath.relative_to(dir_path)}")
-                else:
-                    print(f"DRY RUN: found - {filepath.relative_to(dir_path)}")
+
+        tasks = [asyncio.ensure_future(ingest_file(fp)) for fp in filepaths]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            # waits for the cancelled files, so none is written after the manifest is saved
+            await asyncio.gather(*tasks, return_exceptions=True)
+            pbar.close()
+            if own_executor is not None:
+                own_executor.shutdown(cancel_futures=True)
+            await asyncio.to_thread(self.vectordb.save)
+            if manifest is not None:
+                await asyncio.to_thread(manifest.save)
@@ -3,13 +3,23 @@
 This module provides:
 
 — ParsePDF
+
+— parse_files: parses multiple PDF files, optionally across a process pool
+
+— load_file: parses a PDF file with a new ParsePDF instance
 """
 
-from typing import Optional
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-from grag.components.utils import configure_args
+from grag.components.utils import configure_args, hash_file
 from langchain_core.documents import Document
-from unstructured.partition.pdf import partition_pdf
 
 
 @configure_args
@@ -18,7 +28,8 @@ class ParsePDF:
 
     Attributes:
         single_text_out (bool): Whether to combine all text elements into a single output document.
-        strategy (str): The strategy for PDF partitioning; default is "hi_res" for better accuracy.
+        strategy (str): The strategy for PDF partitioning; default is "hi_res" for better accuracy. "auto" chooses
+                        between "fast" and "hi_res" for each page, see partition.
         infer_table_structure (bool): Whether to extract tables during partitioning.
         extract_images (bool): Whether to extract images.
         image_output_dir (str): Directory to save extracted images, if any.
@@ -27,6 +38,12 @@ class ParsePDF:
         add_caption_first (bool): Whether to place captions before their corresponding image or table in the output.
                                   Default is True.
         table_as_html (bool): Whether to add table elements as HTML. Default is False.
+        min_page_chars (int): With "auto", pages with fewer characters in their text layer are parsed with "hi_res".
+        hi_res_ratio (float): With "auto", files with at least this fraction of "hi_res" pages are parsed with
+                              "hi_res" as a whole.
+        cache_dir (Path): Directory caching the partitioned elements of files, None if they are not cached.
+        page_workers (int): Number of processes partitioning the page ranges of a file, 1 to partition it at once.
+        page_range_size (int): Number of pages per range with page_workers.
     """
 
     def __init__(
@@ -40,6 +57,11 @@ class ParsePDF:
         add_captions_to_blocks: bool = True,
         add_caption_first: bool = True,
         table_as_html: bool = False,
+        min_page_chars: Union[int, str] = 100,
+        hi_res_ratio: Union[float, str] = 0.5,
+        cache_dir: Optional[Union[str, Path]] = None,
+        page_workers: Union[int, str, None] = 1,
+        page_range_size: Union[int, str] = 50,
     ):
         """Initialize instance variables with parameters."""
         self.strategy = strategy
@@ -57,10 +79,131 @@ class ParsePDF:
         self.single_text_out = single_text_out
         self.add_caption_first = add_caption_first
         self.table_as_html = table_as_html
+        self.min_page_chars = int(min_page_chars)
+        self.hi_res_ratio = float(hi_res_ratio)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.page_workers = int(page_workers) if page_workers else 1
+        self.page_range_size = int(page_range_size)
+
+    def needs_hi_res(self, page) -> bool:
+        """Checks whether a page needs the "hi_res" strategy.
+
+        A page needs layout detection and OCR if its text layer is missing or sparse, as in scanned pages, or if it
+        has tables or images that are to be extracted.
+
+        Parameters:
+            page (pdfplumber.page.Page): The page to inspect.
+
+        Returns:
+            bool: True if the page is to be parsed with "hi_res", False if the "fast" text extraction suffices.
+        """
+        if len(page.chars) < self.min_page_chars:
+            return True
+        if "Image" in self.extract_image_block_types and page.images:
+            return True
+        return self.infer_table_structure and len(page.find_tables()) > 0
+
+    def page_strategies(self, path: str) -> List[str]:
+        """Chooses the partitioning strategy of each page of a PDF document from its text layer.
+
+        Inspecting the text layer is cheap compared to "hi_res" partitioning.
+
+        Parameters:
+            path (str): The file path of the PDF document.
+
+        Returns:
+            list: The strategy, "fast" or "hi_res", of each page.
+        """
+        import pdfplumber
+
+        with pdfplumber.open(path) as pdf:
+            strategies = []
+            for page in pdf.pages:
+                strategies.append("hi_res" if self.needs_hi_res(page) else "fast")
+                # frees the parsed objects of the page, they are not needed for the next pages
+                page.close()
+        return strategies
+
+    def _partition_kwargs(self) -> Dict[str, Any]:
+        """Arguments of partition_pdf from the instance's configuration."""
+        return {
+            # extract_images_in_pdf=True,  # Not required if specifies extract_image_block_type
+            "extract_image_block_types": self.extract_image_block_types,
+            "infer_table_structure": self.infer_table_structure,
+            "extract_image_block_to_payload": False,
+            "extract_image_block_output_dir": self.image_output_dir,
+        }
+
+    def _partition_pdf(self, path: str, strategy: str, **kwargs):
+        from unstructured.partition.pdf import partition_pdf
+
+        return partition_pdf(
+            filename=path, strategy=strategy, **{**self._partition_kwargs(), **kwargs}
+        )
+
+    def cache_path(self, path: str) -> Optional[Path]:
+        """Returns the path of the cached elements of a PDF document, None if the elements are not cached.
+
+        The cache is keyed by the content of the file and the parameters that affect partitioning, so a file is
+        partitioned again when it changes or when these parameters change, but not when the caption or output
+        options change.
+
+        Parameters:
+            path (str): The file path of the PDF document.
+
+        Returns:
+            Path: The path of the cache file, it may not exist yet.
+        """
+        if self.cache_dir is None:
+            return None
+        params = {
+            "file": hash_file(path),
+            "strategy": self.strategy,
+            "infer_table_structure": self.infer_table_structure,
+            "extract_image_block_types": self.extract_image_block_types,
+            "image_output_dir": self.image_output_dir,
+        }
+        if self.strategy == "auto":
+            params["min_page_chars"] = self.min_page_chars
+            params["hi_res_ratio"] = self.hi_res_ratio
+        key = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        return self.cache_dir / f"{key}.json"
+
+    def _load_cached(self, cache_path: Path, path: str):
+        from unstructured.staging.base import elements_from_json
+
+        partitions = elements_from_json(filename=str(cache_path))
+        # the same content may have been cached from another path
+        for element in partitions:
+            element.metadata.filename = Path(path).name
+            element.metadata.file_directory = str(Path(path).parent)
+        return partitions
+
+    def _save_cached(self, cache_path: Path, partitions) -> None:
+        from unstructured.staging.base import elements_to_json
+
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # a unique temporary file, workers may partition the same file concurrently
+        tmp_path = cache_path.with_name(f"{cache_path.name}.{uuid.uuid4().hex}.tmp")
+        elements_to_json(partitions, filename=str(tmp_path))
+        os.replace(tmp_path, cache_path)
 
     def partition(self, path: str):
         """Partitions a PDF document into elements based on the instance's configuration.
 
+        With a cache_dir, the elements are read from the cache if the file was partitioned before, see cache_path,
+        and written to it otherwise.
+
+        With the "auto" strategy, each page is inspected with page_strategies. Files where no page needs "hi_res" are
+        parsed with "fast", files where at least hi_res_ratio of the pages need it are parsed with "hi_res". Otherwise
+        only the pages that need it are parsed with "hi_res" and the remaining pages with "fast". Images are only
+        extracted from pages parsed with "hi_res".
+
+        With page_workers > 1, files longer than page_range_size pages are split into page ranges that are
+        partitioned concurrently in worker processes. The elements of all ranges are merged in page order before
+        they are classified, so captions are still matched to the tables and images of the previous range. The
+        worker processes add to the processes of parse_files, choose page_workers with the workers of the ingest.
+
         Parameters:
             path (str): The file path of the PDF document to be parsed and partitioned.
 
@@ -68,15 +211,67 @@ class ParsePDF:
             list: A list of partitioned elements from the PDF document.
         """
         self.file_path = path
-        partitions = partition_pdf(
-            filename=self.file_path,
-            strategy=self.strategy,
-            # extract_images_in_pdf=True,  # Not required if specifies extract_image_block_type
-            extract_image_block_types=self.extract_image_block_types,
-            infer_table_structure=self.infer_table_structure,
-            extract_image_block_to_payload=False,
-            extract_image_block_output_dir=self.image_output_dir,
-        )
+        cache_path = self.cache_path(self.file_path)
+        if cache_path is not None and cache_path.exists():
+            return self._load_cached(cache_path, self.file_path)
+        partitions = self._partition_file(self.file_path)
+        if cache_path is not None:
+            self._save_cached(cache_path, partitions)
+        return partitions
+
+    def _partition_file(self, path: str):
+        """Partitions a PDF document, choosing the strategy per page with auto and splitting it into page ranges."""
+        if self.strategy == "auto":
+            strategies = self.page_strategies(path)
+            num_hi_res = strategies.count("hi_res")
+            if num_hi_res == 0 or num_hi_res >= self.hi_res_ratio * len(strategies):
+                # a single partitioning of the whole file
+                strategies = ["hi_res" if num_hi_res else "fast"] * len(strategies)
+        elif self.page_workers > 1:
+            from pypdf import PdfReader
+
+            strategies = [self.strategy] * len(PdfReader(path).pages)
+        else:
+            return self._partition_pdf(path, self.strategy)
+
+        groups: Dict[str, List[int]] = {}
+        for i, strategy in enumerate(strategies):
+            groups.setdefault(strategy, []).append(i + 1)
+        ranges = []
+        for strategy, pages in groups.items():
+            size = self.page_range_size if self.page_workers > 1 else len(pages)
+            ranges.extend(
+                (pages[i : i + size], strategy) for i in range(0, len(pages), size)
+            )
+        if len(ranges) == 1:
+            return self._partition_pdf(path, ranges[0][1])
+
+        if self.page_workers > 1:
+            with ProcessPoolExecutor(
+                max_workers=min(self.page_workers, len(ranges))
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        _partition_pages_in_worker,
+                        path,
+                        pages,
+                        strategy,
+                        self.image_output_dir,
+                        self._partition_kwargs(),
+                    )
+                    for pages, strategy in ranges
+                ]
+                results = [future.result() for future in futures]
+        else:
+            results = [
+                _partition_pages(
+                    self._partition_pdf, path, pages, strategy, self.image_output_dir
+                )
+                for pages, strategy in ranges
+            ]
+        partitions = [element for result in results for element in result]
+        # stable sort, the elements of a page come from a single range and keep their order
+        partitions.sort(key=lambda element: element.metadata.page_number or 0)
         return partitions
 
     def classify(self, partitions):
@@ -245,3 +440,140 @@ class ParsePDF:
         table_docs = self.process_tables(classified_elements["Tables"])
         image_docs = self.process_images(classified_elements["Images"])
         return {"Text": text_docs, "Tables": table_docs, "Images": image_docs}
+
+
+def _partition_pages(
+    partition_pdf: Callable,
+    path: str,
+    pages: List[int],
+    strategy: str,
+    image_output_dir: Optional[str] = None,
+):
+    """Partitions the given pages (1-indexed) of a PDF document with partition_pdf, keeping their page numbers.
+
+    Images are extracted to a subdirectory of image_output_dir for each page range, the images of every range are
+    numbered from its first page.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(path)
+    writer = PdfWriter()
+    for page_number in pages:
+        writer.add_page(reader.pages[page_number - 1])
+    kwargs: Dict[str, Any] = {"metadata_filename": path}
+    if image_output_dir and image_output_dir != "None":
+        kwargs["extract_image_block_output_dir"] = str(
+            Path(image_output_dir) / f"{Path(path).stem}-pages-{pages[0]}"
+        )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pages_path = str(Path(tmp_dir) / Path(path).name)
+        writer.write(pages_path)
+        partitions = partition_pdf(pages_path, strategy, **kwargs)
+    for element in partitions:
+        if element.metadata.page_number is not None:
+            element.metadata.page_number = pages[element.metadata.page_number - 1]
+    return partitions
+
+
+def _partition_pages_in_worker(
+    path: str,
+    pages: List[int],
+    strategy: str,
+    image_output_dir: Optional[str],
+    partition_kwargs: Dict[str, Any],
+):
+    """Partitions a page range in a worker process, with the partition_pdf arguments of a ParsePDF instance."""
+    from unstructured.partition.pdf import partition_pdf
+
+    def partition(pages_path: str, strategy: str, **kwargs):
+        return partition_pdf(
+            filename=pages_path, strategy=strategy, **{**partition_kwargs, **kwargs}
+        )
+
+    return _partition_pages(partition, path, pages, strategy, image_output_dir)
+
+
+def load_file(
+    path: Union[str, Path], parser_kwargs: Optional[Dict[str, Any]] = None
+) -> Dict[str, List[Document]]:
+    """Parses a PDF file with a new ParsePDF instance.
+
+    A ParsePDF instance keeps the path of the file it is parsing, so concurrent threads can not share one. This
+    function can be run concurrently in threads and, being picklable, in process pools.
+
+    Args:
+        path: path of the PDF file
+        parser_kwargs: arguments to pass to ParsePDF, optional, defaults to None
+
+    Returns:
+        the dictionary returned by ParsePDF.load_file
+    """
+    return ParsePDF(**(parser_kwargs or {})).load_file(path)
+
+
+_worker_parser = None
+
+
+def _init_worker_parser(parser_kwargs: Dict[str, Any]) -> None:
+    """Creates the ParsePDF instance used by a worker process."""
+    global _worker_parser
+    _worker_parser = ParsePDF(**parser_kwargs)
+
+
+def _load_file_in_worker(path: Union[str, Path]) -> Dict[str, List[Document]]:
+    """Loads a file with the ParsePDF instance of the worker process."""
+    assert _worker_parser is not None, "worker parser is not initialized"
+    return _worker_parser.load_file(path)
+
+
+def parse_files(
+    paths: Iterable[Union[str, Path]],
+    parser_kwargs: Optional[Dict[str, Any]] = None,
+    workers: Optional[int] = None,
+) -> Iterator[Tuple[Union[str, Path], Dict[str, List[Document]]]]:
+    """Parses PDF files, yielding the documents of each file as it is completed.
+
+    With more than one worker, files are parsed across a process pool and yielded in completion order.
+    At most twice as many files as workers are in flight at once, so parsed files do not pile up in memory
+    when the consumer is slower than the parsers.
+
+    Args:
+        paths: paths of the PDF files to parse
+        parser_kwargs: arguments to pass to ParsePDF, optional, defaults to None
+        workers: number of worker processes, if None or 1 files are parsed in the calling process
+
+    Yields:
+        tuples of the file path and the dictionary returned by ParsePDF.load_file
+    """
+    parser_kwargs = parser_kwargs if parser_kwargs else {}
+    workers = int(workers) if workers else 1
+    if workers <= 1:
+        parser = ParsePDF(**parser_kwargs)
+        for path in paths:
+            yield path, parser.load_file(path)
+        return
+
+    paths_iter = iter(paths)
+    executor = ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker_parser,
+        initargs=(parser_kwargs,),
+    )
+    try:
+        pending = {}
+        for path in paths_iter:
+            pending[executor.submit(_load_file_in_worker, path)] = path
+            if len(pending) >= 2 * workers:
+                break
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                yield path, future.result()
+                next_path = next(paths_iter, None)
+                if next_path is not None:
+                    pending[executor.submit(_load_file_in_worker, next_path)] = (
+                        next_path
+                    )
+    finally:
+        executor.shutdown(cancel_futures=True)
@@ -18,7 +18,7 @@ from pydantic import BaseModel, Field, field_validator
 Example = Dict[str, Any]
 
 SUPPORTED_TASKS = ["QA"]
-SUPPORTED_DOC_CHAINS = ["stuff", "refine"]
+SUPPORTED_DOC_CHAINS = ["stuff", "refine", "map_reduce"]
 
 
 class Prompt(BaseModel):
@@ -29,7 +29,7 @@ class Prompt(BaseModel):
         llm_type (str): The type of llm, llama2, etc (Optional, defaults to "None")
         task (str): The task (Optional, defaults to QA)
         source (str): The source of the prompt (Optional, defaults to "NoSource")
-        doc_chain (str): The doc chain for the prompt ("stuff", "refine") (Optional, defaults to "stuff")
+        doc_chain (str): The doc chain for the prompt ("stuff", "refine", "map_reduce") (Optional, defaults to "stuff")
         language (str): The language of the prompt (Optional, defaults to "en")
         filepath (str): The filepath of the prompt (Optional)
         input_keys (List[str]): The input keys for the prompt
@@ -115,6 +115,13 @@ class Prompt(BaseModel):
             return self.prompt.format(**kwargs)
         raise ValueError("Prompt is not defined.")
 
+    @property
+    def static_prefix(self) -> str:
+        """The text of the formatted prompt before its first input, identical for every call."""
+        marker = "\x00grag-prompt-input\x00"
+        formatted = self.format(**{key: marker for key in self.input_keys})
+        return formatted.split(marker, 1)[0]
+
 
 class FewShotPrompt(Prompt):
     """A class for generic prompts.
@@ -124,7 +131,7 @@ class FewShotPrompt(Prompt):
         llm_type (str): The type of llm, llama2, etc (Optional, defaults to "None") (Parent Class)
         task (str): The task (Optional, defaults to QA) (Parent Class)
         source (str): The source of the prompt (Optional, defaults to "NoSource") (Parent Class)
-        doc_chain (str): The doc chain for the prompt ("stuff", "refine") (Optional, defaults to "stuff") (Parent Class)
+        doc_chain (str): The doc chain for the prompt ("stuff", "refine", "map_reduce") (Optional, defaults to "stuff") (Parent Class)
         language (str): The language of the prompt (Optional, defaults to "en") (Parent Class)
         filepath (str): The filepath of the prompt (Optional) (Parent Class)
         input_keys (List[str]): The input keys for the prompt (Parent Class)
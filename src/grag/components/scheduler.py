@@ -0,0 +1,268 @@
+"""Class for scheduling LLM generations.
+
+This module provides:
+
+— GenerationStats
+
+— GenerationScheduler
+"""
+
+import asyncio
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple, Union
+
+from langchain_core.language_models.llms import BaseLLM
+
+
+@dataclass
+class GenerationStats:
+    """Timings of a generation request, in seconds from its submission.
+
+    Attributes:
+        queue_time: time until its generation started
+        time_to_first_token: time until its first token was generated
+        total_time: time until its generation finished
+        batch_size: number of requests generated in the same batch
+    """
+
+    queue_time: float
+    time_to_first_token: float
+    total_time: float
+    batch_size: int
+
+
+class _Request:
+    """A pending generation request, its tokens are put in a queue as they are generated."""
+
+    def __init__(self, prompt: str, stream: bool):
+        self.prompt = prompt
+        self.stream = stream
+        self.submitted = time.perf_counter()
+        self.tokens: asyncio.Queue = asyncio.Queue()
+        self.result: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def finish(self, text: str, stats: GenerationStats) -> None:
+        self.tokens.put_nowait(None)
+        if not self.result.done():
+            self.result.set_result((text, stats))
+
+    def fail(self, error: BaseException) -> None:
+        self.tokens.put_nowait(None)
+        if not self.result.done():
+            self.result.set_exception(error)
+
+
+class GenerationScheduler:
+    """Schedules generation requests from concurrent callers on a single LLM.
+
+    Requests are queued and served by a background task of the running event loop, the LLM runs in a worker thread
+    so the event loop is never blocked. The worker thread holds lock while generating, pass the lock of a shared
+    model so that it does not generate for another caller at the same time.
+
+    For the 'hf' pipeline, requests that arrive within max_wait_ms of each other are generated together in a batch
+    of up to max_batch_size prompts. The batch is generated at once, so every request of a batch gets its whole
+    response at the end of the batch.
+
+    For the 'llama_cpp' pipeline, the model runs one sequence at a time, so requests are generated one after another
+    in arrival order, streaming their tokens as they are generated.
+
+    Attributes:
+        llm: langchain LLM, as returned by LLM.load_model
+        pipeline: pipeline of the LLM, 'hf' or 'llama_cpp'
+        max_batch_size: maximum number of prompts generated in one batch, only used by the 'hf' pipeline
+        max_wait_ms: maximum time a request waits for other requests to fill its batch, in milliseconds
+        lock: lock held while the LLM generates
+        stats: GenerationStats of the most recent requests
+    """
+
+    def __init__(
+        self,
+        llm: BaseLLM,
+        pipeline: str,
+        max_batch_size: Union[int, str] = 8,
+        max_wait_ms: Union[float, str] = 10,
+        stats_size: int = 1000,
+        lock: Optional[threading.RLock] = None,
+    ):
+        """Initialize the scheduler, the background task is started by the first request.
+
+        Args:
+            llm: langchain LLM, as returned by LLM.load_model
+            pipeline: pipeline of the LLM, 'hf' or 'llama_cpp'
+            max_batch_size: maximum number of prompts generated in one batch, defaults to 8
+            max_wait_ms: maximum time a request waits for other requests to fill its batch, defaults to 10 ms
+            stats_size: number of recent requests kept in stats, defaults to 1000
+            lock: lock held while the LLM generates, defaults to a new lock
+        """
+        self.llm = llm
+        self.pipeline = pipeline
+        self.max_batch_size = int(max_batch_size)
+        self.max_wait_ms = float(max_wait_ms)
+        self.stats: Deque[GenerationStats] = deque(maxlen=stats_size)
+        self.lock = lock if lock is not None else threading.RLock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: asyncio.Queue
+        self._worker: asyncio.Task
+
+    def _submit(self, prompt: str, stream: bool) -> _Request:
+        """Queues a request, starting the background task on the running event loop if needed."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+        request = _Request(prompt, stream)
+        self._queue.put_nowait(request)
+        return request
+
+    async def generate(
+        self, prompt: str, return_stats: bool = False
+    ) -> Union[str, Tuple[str, GenerationStats]]:
+        """Generates the response to a prompt.
+
+        Args:
+            prompt: the prompt
+            return_stats: if True, also returns the GenerationStats of the request
+
+        Returns:
+            the response, and its GenerationStats if return_stats
+        """
+        text, stats = await self._submit(prompt, stream=False).result
+        return (text, stats) if return_stats else text
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Streams the response tokens of a prompt.
+
+        Args:
+            prompt: the prompt
+
+        Yields:
+            response tokens, the whole response as a single token for the 'hf' pipeline
+        """
+        request = self._submit(prompt, stream=True)
+        while (token := await request.tokens.get()) is not None:
+            yield token
+        # raises the error of a failed generation
+        await request.result
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            if self.pipeline == "hf":
+                await self._fill_batch(batch)
+                await self._generate_batch(batch)
+            else:
+                await self._generate_stream(batch[0])
+
+    async def _fill_batch(self, batch: List[_Request]) -> None:
+        """Adds the requests arriving within max_wait_ms to the batch, up to max_batch_size requests."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+    def _locked_generate(self, prompts: List[str]):
+        """Generates a batch of prompts in the worker thread, returns the result and the time it started."""
+        with self.lock:
+            start = time.perf_counter()
+            result = self.llm.generate(
+                prompts, pipeline_kwargs={"batch_size": len(prompts)}
+            )
+        return result, start
+
+    async def _generate_batch(self, batch: List[_Request]) -> None:
+        try:
+            result, start = await asyncio.to_thread(
+                self._locked_generate, [request.prompt for request in batch]
+            )
+        except Exception as e:
+            for request in batch:
+                request.fail(e)
+            return
+        end = time.perf_counter()
+        for request, generations in zip(batch, result.generations):
+            text = generations[0].text
+            stats = GenerationStats(
+                queue_time=start - request.submitted,
+                time_to_first_token=end - request.submitted,
+                total_time=end - request.submitted,
+                batch_size=len(batch),
+            )
+            self.stats.append(stats)
+            if request.stream:
+                request.tokens.put_nowait(text)
+            request.finish(text, stats)
+
+    def _locked_stream(self, request: _Request, loop: asyncio.AbstractEventLoop):
+        """Streams a prompt in the worker thread, putting the tokens in the queue of the request.
+
+        Returns:
+            the response, the time the generation started and the time of its first token
+        """
+        tokens = []
+        first_token: Optional[float] = None
+        with self.lock:
+            start = time.perf_counter()
+            for token in self.llm.stream(request.prompt):
+                if first_token is None:
+                    first_token = time.perf_counter()
+                tokens.append(token)
+                if request.stream:
+                    loop.call_soon_threadsafe(request.tokens.put_nowait, token)
+        return "".join(tokens), start, first_token
+
+    async def _generate_stream(self, request: _Request) -> None:
+        try:
+            text, start, first_token = await asyncio.to_thread(
+                self._locked_stream, request, asyncio.get_running_loop()
+            )
+        except Exception as e:
+            request.fail(e)
+            return
+        end = time.perf_counter()
+        stats = GenerationStats(
+            queue_time=start - request.submitted,
+            time_to_first_token=(first_token or end) - request.submitted,
+            total_time=end - request.submitted,
+            batch_size=1,
+        )
+        self.stats.append(stats)
+        request.finish(text, stats)
+
+    def summary(self) -> Dict[str, float]:
+        """Summarizes the stats of the recent requests.
+
+        Returns:
+            number of requests, mean and 95th percentile time to first token and total time, and mean batch size
+        """
+        stats = list(self.stats)
+        if not stats:
+            return {"requests": 0}
+        ttft = [s.time_to_first_token for s in stats]
+        total = [s.total_time for s in stats]
+        return {
+            "requests": len(stats),
+            "mean_time_to_first_token": statistics.fmean(ttft),
+            "p95_time_to_first_token": _percentile(ttft, 95),
+            "mean_total_time": statistics.fmean(total),
+            "p95_total_time": _percentile(total, 95),
+            "mean_batch_size": statistics.fmean(s.batch_size for s in stats),
+        }
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
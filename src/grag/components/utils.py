@@ -11,14 +11,20 @@ This module provides:
 — get_config: retrieves and parses the configuration settings from the 'config.ini' file.
 
 — configure_args: a decorator to configure class instantiation arguments from a 'config.ini' file.
+
+— hash_file: computes the sha256 hex digest of a file's content.
+
+— LRUCache: a thread safe, size bounded, least recently used cache with hit and miss counters.
 """
 
+import hashlib
 import os
-from collections import defaultdict
+import threading
+from collections import OrderedDict, defaultdict
 from configparser import ConfigParser, ExtendedInterpolation
 from functools import wraps
 from pathlib import Path
-from typing import List
+from typing import Any, Hashable, List, Union
 
 from dotenv import load_dotenv
 from langchain_core.documents import Document
@@ -102,6 +108,7 @@ def configure_args(cls):
 
     This function reads configuration specific to a class's module from 'config.ini', then uses it to override or
     provide defaults for keyword arguments passed during class instantiation.
+    The config is read on the first instantiation rather than at import, and reused for later instantiations.
 
     Args:
         cls (class): The class whose instantiation is to be configured.
@@ -113,11 +120,18 @@ def configure_args(cls):
         TypeError: If there is a mismatch in provided arguments and class constructor requirements.
     """
     module_namespace = cls.__module__.split(".")[-1]
-
-    config = get_config()[module_namespace]
+    config = None
 
     @wraps(cls)
     def wrapper(*args, **kwargs):
+        nonlocal config
+        if config is None:
+            full_config = get_config()
+            config = (
+                dict(full_config[module_namespace])
+                if module_namespace in full_config
+                else {}
+            )
         new_kwargs = {**config, **kwargs}
         try:
             return cls(*args, **new_kwargs)
@@ -125,3 +139,80 @@ def configure_args(cls):
             raise TypeError(f"{e}, or create a config.ini file. ") from e
 
     return wrapper
+
+
+def hash_file(path: Union[str, Path], block_size: int = 1 << 20) -> str:
+    """Computes the sha256 hex digest of a file's content, reading it in blocks.
+
+    Args:
+        path: path to the file
+        block_size: number of bytes read at a time, defaults to 1 MiB
+
+    Returns:
+        str: hexadecimal sha256 digest of the file content
+    """
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class LRUCache:
+    """A thread safe, size bounded, least recently used cache with hit and miss counters.
+
+    Attributes:
+        max_size: maximum number of entries, the least recently used entry is evicted above it, 0 disables the cache
+        hits: number of lookups that found an entry
+        misses: number of lookups that did not find an entry
+    """
+
+    def __init__(self, max_size: Union[int, str] = 1024):
+        """Initialize an empty cache.
+
+        Args:
+            max_size: maximum number of entries, defaults to 1024
+        """
+        self.max_size = int(max_size)
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Number of entries in the cache."""
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Whether key has an entry, does not count as a lookup."""
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Returns the entry of key and marks it as most recently used, or default if key has no entry."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Stores value as the most recently used entry of key, evicting the least recently used entry if full."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Removes the entry of key and returns it, or default if key has no entry, does not count as a lookup."""
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        """Removes all entries, the counters are kept."""
+        with self._lock:
+            self._data.clear()
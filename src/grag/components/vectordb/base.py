@@ -6,7 +6,7 @@ This module provides:
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Optional, Tuple, Union
+from typing import Iterator, List, Optional, Tuple, Union
 
 from langchain_community.vectorstores.utils import filter_complex_metadata
 from langchain_core.documents import Document
@@ -18,6 +18,19 @@ class VectorDB(ABC):
     def __init__(self):
         """Initialize the vector."""
         self.allowed_metadata_types = ()
+        self.batch_size = 64
+        self._version = 0
+
+    @property
+    def version(self) -> int:
+        """Number of times the chunks in the vector database were changed through this client.
+
+        Caches of search results compare it to detect that they are stale.
+        """
+        return getattr(self, "_version", 0)
+
+    def _bump_version(self) -> None:
+        self._version = self.version + 1
 
     @abstractmethod
     def __len__(self) -> int:
@@ -28,6 +41,28 @@ class VectorDB(ABC):
     def delete(self) -> None:
         """Delete all chunks in the vector database."""
 
+    @abstractmethod
+    def delete_docs(self, doc_ids: List[str], id_key: str = "doc_id") -> None:
+        """Delete the chunks of the given parent documents.
+
+        Args:
+            doc_ids: ids of the parent documents
+            id_key: metadata key of the chunks holding the parent document id
+
+        Returns:
+            None
+        """
+        ...
+
+    def save(self) -> None:
+        """Writes pending inserts and deletes to storage.
+
+        Clients that write through on every call, the default, have nothing to save.
+
+        Returns:
+            None
+        """
+
     @abstractmethod
     def add_docs(self, docs: List[Document], verbose: bool = True) -> None:
         """Adds documents to the vector database.
@@ -86,5 +121,73 @@ class VectorDB(ABC):
         """
         ...
 
+    def get_chunk_by_vector(
+        self,
+        embedding: List[float],
+        with_score: bool = False,
+        top_k: Optional[int] = None,
+    ) -> Union[List[Document], List[Tuple[Document, float]]]:
+        """Returns the most similar chunks to a query embedding from the vector database.
+
+        Args:
+            embedding: A query embedding, from the embedding_function of the client
+            with_score: Outputs scores of returned chunks
+            top_k: Number of top similar chunks to return, if None defaults to self.top_k
+
+        Returns:
+            list of Documents
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support search by embedding."
+        )
+
+    def add_embedded_docs(
+        self, docs: List[Document], embeddings: List[List[float]]
+    ) -> None:
+        """Adds documents with precomputed embeddings to the vector database.
+
+        The embeddings must come from the embedding_function of the client. Clients that can write precomputed
+        embeddings override this, the ingest pipeline then embeds documents in a stage of its own.
+
+        Args:
+            docs: List of Documents
+            embeddings: List of embeddings, one per document
+
+        Returns:
+            None
+        """
+        raise NotImplementedError(
+            f"{type(self).__name__} does not support adding precomputed embeddings."
+        )
+
+    def get_chunks(
+        self, queries: List[str], with_score: bool = False, top_k: Optional[int] = None
+    ) -> Union[List[List[Document]], List[List[Tuple[Document, float]]]]:
+        """Returns the most similar chunks from the vector database for each query.
+
+        Clients with a native multi-query search override this, by default each query is searched in turn.
+
+        Args:
+            queries: list of query strings
+            with_score: Outputs scores of returned chunks
+            top_k: Number of top similar chunks to return per query, if None defaults to self.top_k
+
+        Returns:
+            list of lists of Documents, one list per query
+        """
+        return [
+            self.get_chunk(query=query, with_score=with_score, top_k=top_k)
+            for query in queries
+        ]
+
     def _filter_metadata(self, docs: List[Document]) -> List[Document]:
         return filter_complex_metadata(docs, allowed_types=self.allowed_metadata_types)
+
+    def _batch_docs(self, docs: List[Document]) -> Iterator[List[Document]]:
+        """Yields consecutive batches of at most batch_size documents."""
+        for i in range(0, len(docs), self.batch_size):
+            yield docs[i : i + self.batch_size]
+
+    def _num_batches(self, docs: List[Document]) -> int:
+        """Number of batches _batch_docs yields for the given documents."""
+        return -(-len(docs) // self.batch_size)
@@ -5,10 +5,12 @@ This module provides:
 — ChromaClient
 """
 
+import uuid
+from pathlib import Path
 from typing import List, Optional, Tuple, Union
 
 import chromadb
-from grag.components.embedding import Embedding
+from grag.components.embedding import Embedding, embed_queries
 from grag.components.utils import configure_args
 from grag.components.vectordb.base import VectorDB
 from langchain_community.vectorstores import Chroma
@@ -32,6 +34,12 @@ class ChromaClient(VectorDB):
             type of embedding used, supported 'sentence-transformers' and 'instructor-embedding'
         embedding_model : str
             model name of embedding used, should correspond to the embedding_type
+        batch_size : int
+            number of documents embedded and written per insert
+        embedding_cache_path : str, Path
+            path to the embedding cache, if None document embeddings are not cached
+        embedding_cache_size : int
+            maximum number of embeddings in the embedding cache
         embedding_function
             a function of the embedding model, derived from the embedding_type and embedding_modelname
         client: chromadb.HttpClient
@@ -49,6 +57,9 @@ class ChromaClient(VectorDB):
         collection_name: str = "grag",
         embedding_type: str = "instructor-embedding",
         embedding_model: str = "hkunlp/instructor-xl",
+        batch_size: Union[int, str] = 64,
+        embedding_cache_path: Optional[Union[str, Path]] = None,
+        embedding_cache_size: Union[int, str] = 1_000_000,
     ):
         """Initialize a ChromaClient object.
 
@@ -60,15 +71,25 @@ class ChromaClient(VectorDB):
                             defaults to instructor-embedding
             embedding_model: model name of embedding used, should correspond to the embedding_type,
                              defaults to hkunlp/instructor-xl.
+            batch_size: number of documents embedded and written per insert, defaults to 64.
+            embedding_cache_path: path to the embedding cache, if None document embeddings are not cached,
+                                  defaults to None.
+            embedding_cache_size: maximum number of embeddings in the embedding cache, defaults to 1,000,000.
         """
         self.host = host
         self.port = port
         self.collection_name = collection_name
         self.embedding_type = embedding_type
         self.embedding_model = embedding_model
+        self.batch_size = int(batch_size)
+        self.embedding_cache_path = embedding_cache_path
+        self.embedding_cache_size = int(embedding_cache_size)
 
         self.embedding_function = Embedding(
-            embedding_model=self.embedding_model, embedding_type=self.embedding_type
+            embedding_model=self.embedding_model,
+            embedding_type=self.embedding_type,
+            cache_path=self.embedding_cache_path,
+            cache_size=self.embedding_cache_size,
         ).embedding_function
 
         self.client = chromadb.HttpClient(host=self.host, port=self.port)  # type: ignore
@@ -97,6 +118,21 @@ class ChromaClient(VectorDB):
             collection_name=self.collection_name,
             embedding_function=self.embedding_function,
         )
+        self._bump_version()
+
+    def delete_docs(self, doc_ids: List[str], id_key: str = "doc_id") -> None:
+        """Delete the chunks of the given parent documents from the database collection.
+
+        Args:
+            doc_ids: ids of the parent documents
+            id_key: metadata key of the chunks holding the parent document id
+
+        Returns:
+            None
+        """
+        if doc_ids:
+            self.collection.delete(where={id_key: {"$in": list(doc_ids)}})
+        self._bump_version()
 
     def test_connection(self, verbose=True) -> int:
         """Tests connection with Chroma Vectorstore.
@@ -118,6 +154,8 @@ class ChromaClient(VectorDB):
     def add_docs(self, docs: List[Document], verbose=True) -> None:
         """Adds documents to chroma vectorstore.
 
+        Documents are embedded and written in batches of batch_size.
+
         Args:
             docs: List of Documents
             verbose: Show progress bar
@@ -126,14 +164,43 @@ class ChromaClient(VectorDB):
             None
         """
         docs = self._filter_metadata(docs)
-        for doc in (
-            tqdm(docs, desc=f"Adding to {self.collection_name}:") if verbose else docs
+        for batch in tqdm(
+            self._batch_docs(docs),
+            total=self._num_batches(docs),
+            desc=f"Adding to {self.collection_name}:",
+            disable=not verbose,
         ):
-            _id = self.langchain_client.add_documents([doc])
+            _ids = self.langchain_client.add_documents(batch)
+        self._bump_version()
+
+    def add_embedded_docs(
+        self, docs: List[Document], embeddings: List[List[float]]
+    ) -> None:
+        """Adds documents with precomputed embeddings to the chroma vectorstore.
+
+        Args:
+            docs: List of Documents
+            embeddings: List of embeddings from embedding_function, one per document
+
+        Returns:
+            None
+        """
+        if not docs:
+            return
+        docs = self._filter_metadata(docs)
+        self.collection.upsert(
+            ids=[str(uuid.uuid4()) for _ in docs],
+            embeddings=embeddings,  # type: ignore
+            documents=[doc.page_content for doc in docs],
+            metadatas=[doc.metadata for doc in docs],
+        )
+        self._bump_version()
 
     async def aadd_docs(self, docs: List[Document], verbose=True) -> None:
         """Asynchronously adds documents to chroma vectorstore.
 
+        Documents are embedded and written in batches of batch_size.
+
         Args:
             docs: List of Documents
             verbose: Show progress bar
@@ -142,16 +209,14 @@ class ChromaClient(VectorDB):
             None
         """
         docs = self._filter_metadata(docs)
-        if verbose:
-            for doc in atqdm(
-                docs,
-                desc=f"Adding documents to {self.collection_name}",
-                total=len(docs),
-            ):
-                await self.langchain_client.aadd_documents([doc])
-        else:
-            for doc in docs:
-                await self.langchain_client.aadd_documents([doc])
+        for batch in atqdm(
+            self._batch_docs(docs),
+            total=self._num_batches(docs),
+            desc=f"Adding documents to {self.collection_name}",
+            disable=not verbose,
+        ):
+            await self.langchain_client.aadd_documents(batch)
+        self._bump_version()
 
     def get_chunk(
         self, query: str, with_score: bool = False, top_k: Optional[int] = None
@@ -176,6 +241,82 @@ class ChromaClient(VectorDB):
                 query=query, k=top_k if top_k else 1
             )
 
+    def get_chunks(
+        self, queries: List[str], with_score: bool = False, top_k: Optional[int] = None
+    ) -> Union[List[List[Document]], List[List[Tuple[Document, float]]]]:
+        """Returns the most similar chunks from the chroma database for each query.
+
+        All queries are embedded in a single batch and sent in a single collection query.
+
+        Args:
+            queries: list of query strings
+            with_score: Outputs scores of returned chunks
+            top_k: Number of top similar chunks to return per query, if None defaults to self.top_k
+
+        Returns:
+            list of lists of Documents, one list per query
+
+        """
+        if not queries:
+            return []
+        results = self.collection.query(
+            query_embeddings=embed_queries(self.embedding_function, queries),  # type: ignore
+            n_results=top_k if top_k else 1,
+            include=["documents", "metadatas", "distances"],  # type: ignore
+        )
+        relevance_score_fn = self.langchain_client._select_relevance_score_fn()
+        chunks = []
+        for texts, metadatas, distances in zip(
+            results["documents"],  # type: ignore
+            results["metadatas"],  # type: ignore
+            results["distances"],  # type: ignore
+        ):
+            docs = [
+                Document(page_content=text, metadata=metadata or {})
+                for text, metadata in zip(texts, metadatas)
+            ]
+            if with_score:
+                chunks.append(
+                    [
+                        (doc, relevance_score_fn(distance))
+                        for doc, distance in zip(docs, distances)
+                    ]
+                )
+            else:
+                chunks.append(docs)
+        return chunks
+
+    def get_chunk_by_vector(
+        self,
+        embedding: List[float],
+        with_score: bool = False,
+        top_k: Optional[int] = None,
+    ) -> Union[List[Document], List[Tuple[Document, float]]]:
+        """Returns the most (cosine) similar chunks to a query embedding from the chroma database.
+
+        Args:
+            embedding: A query embedding, from self.embedding_function
+            with_score: Outputs scores of returned chunks
+            top_k: Number of top similar chunks to return, if None defaults to self.top_k
+
+        Returns:
+            list of Documents
+
+        """
+        if with_score:
+            # langchain returns distances here, convert them to the relevance scores returned by get_chunk
+            relevance_score_fn = self.langchain_client._select_relevance_score_fn()
+            return [
+                (doc, relevance_score_fn(distance))
+                for doc, distance in self.langchain_client.similarity_search_by_vector_with_relevance_scores(
+                    embedding, k=top_k if top_k else 1
+                )
+            ]
+        else:
+            return self.langchain_client.similarity_search_by_vector(
+                embedding, k=top_k if top_k else 1
+            )
+
     async def aget_chunk(
         self, query: str, with_score=False, top_k=None
     ) -> Union[List[Document], List[Tuple[Document, float]]]:
@@ -28,6 +28,12 @@ class DeepLakeClient(VectorDB):
             type of embedding used, supported 'sentence-transformers' and 'instructor-embedding'
         embedding_model : str
             model name of embedding used, should correspond to the embedding_type
+        batch_size : int
+            number of documents embedded and written per insert
+        embedding_cache_path : str, Path
+            path to the embedding cache, if None document embeddings are not cached
+        embedding_cache_size : int
+            maximum number of embeddings in the embedding cache
         embedding_function
             a function of the embedding model, derived from the embedding_type and embedding_modelname
         client: deeplake.core.vectorstore.VectorStore
@@ -45,6 +51,9 @@ class DeepLakeClient(VectorDB):
         embedding_type: str = "instructor-embedding",
         embedding_model: str = "kunlp/instructor-xl",
         read_only: bool = False,
+        batch_size: Union[int, str] = 64,
+        embedding_cache_path: Optional[Union[str, Path]] = None,
+        embedding_cache_size: Union[int, str] = 1_000_000,
     ):
         """Initialize a DeepLakeClient object.
 
@@ -56,15 +65,25 @@ class DeepLakeClient(VectorDB):
             embedding_model: model name of embedding used, should correspond to the embedding_type,
                              defaults to hkunlp/instructor-xl
             read_only: flag indicating whether the client is read-only, defaults to False.
+            batch_size: number of documents embedded and written per insert, defaults to 64.
+            embedding_cache_path: path to the embedding cache, if None document embeddings are not cached,
+                                  defaults to None.
+            embedding_cache_size: maximum number of embeddings in the embedding cache, defaults to 1,000,000.
         """
         self.store_path = Path(store_path)
         self.collection_name = collection_name
         self.read_only = read_only
         self.embedding_type: str = embedding_type
         self.embedding_model: str = embedding_model
+        self.batch_size = int(batch_size)
+        self.embedding_cache_path = embedding_cache_path
+        self.embedding_cache_size = int(embedding_cache_size)
 
         self.embedding_function = Embedding(
-            embedding_model=self.embedding_model, embedding_type=self.embedding_type
+            embedding_model=self.embedding_model,
+            embedding_type=self.embedding_type,
+            cache_path=self.embedding_cache_path,
+            cache_size=self.embedding_cache_size,
         ).embedding_function
 
         # self.client = VectorStore(path=self.store_path / self.collection_name)
@@ -83,10 +102,27 @@ class DeepLakeClient(VectorDB):
     def delete(self) -> None:
         """Delete all chunks in the vector database."""
         self.client.delete(delete_all=True)
+        self._bump_version()
+
+    def delete_docs(self, doc_ids: List[str], id_key: str = "doc_id") -> None:
+        """Delete the chunks of the given parent documents from the vector database.
+
+        Args:
+            doc_ids: ids of the parent documents
+            id_key: metadata key of the chunks holding the parent document id
+
+        Returns:
+            None
+        """
+        for doc_id in doc_ids:
+            self.client.delete(filter={"metadata": {id_key: doc_id}})
+        self._bump_version()
 
     def add_docs(self, docs: List[Document], verbose=True) -> None:
         """Adds documents to deeplake vectorstore.
 
+        Documents are embedded and written in batches of batch_size.
+
         Args:
             docs: List of Documents
             verbose: Show progress bar
@@ -95,13 +131,41 @@ class DeepLakeClient(VectorDB):
             None
         """
         docs = self._filter_metadata(docs)
-        for doc in (
-            tqdm(docs, desc=f"Adding to {self.collection_name}:") if verbose else docs
+        for batch in tqdm(
+            self._batch_docs(docs),
+            total=self._num_batches(docs),
+            desc=f"Adding to {self.collection_name}:",
+            disable=not verbose,
         ):
-            _id = self.langchain_client.add_documents([doc])
+            _ids = self.langchain_client.add_documents(batch)
+        self._bump_version()
+
+    def add_embedded_docs(
+        self, docs: List[Document], embeddings: List[List[float]]
+    ) -> None:
+        """Adds documents with precomputed embeddings to the deeplake vectorstore.
+
+        Args:
+            docs: List of Documents
+            embeddings: List of embeddings from embedding_function, one per document
+
+        Returns:
+            None
+        """
+        if not docs:
+            return
+        docs = self._filter_metadata(docs)
+        self.client.add(
+            text=[doc.page_content for doc in docs],
+            metadata=[doc.metadata for doc in docs],
+            embedding=embeddings,
+        )
+        self._bump_version()
 
     async def aadd_docs(self, docs: List[Document], verbose=True) -> None:
-        """Asynchronously adds documents to chroma vectorstore.
+        """Asynchronously adds documents to deeplake vectorstore.
+
+        Documents are embedded and written in batches of batch_size.
 
         Args:
             docs: List of Documents
@@ -111,16 +175,14 @@ class DeepLakeClient(VectorDB):
             None
         """
         docs = self._filter_metadata(docs)
-        if verbose:
-            for doc in atqdm(
-                docs,
-                desc=f"Adding documents to {self.collection_name}",
-                total=len(docs),
-            ):
-                await self.langchain_client.aadd_documents([doc])
-        else:
-            for doc in docs:
-                await self.langchain_client.aadd_documents([doc])
+        for batch in atqdm(
+            self._batch_docs(docs),
+            total=self._num_batches(docs),
+            desc=f"Adding documents to {self.collection_name}",
+            disable=not verbose,
+        ):
+            await self.langchain_client.aadd_documents(batch)
+        self._bump_version()
 
     def get_chunk(
         self, query: str, with_score: bool = False, top_k: Optional[int] = None
@@ -145,6 +207,33 @@ class DeepLakeClient(VectorDB):
                 query=query, k=top_k if top_k else 1
             )
 
+    def get_chunk_by_vector(
+        self,
+        embedding: List[float],
+        with_score: bool = False,
+        top_k: Optional[int] = None,
+    ) -> Union[List[Document], List[Tuple[Document, float]]]:
+        """Returns the most (cosine) similar chunks to a query embedding from the deeplake vectorstore.
+
+        Args:
+            embedding: A query embedding, from self.embedding_function
+            with_score: Outputs scores of returned chunks
+            top_k: Number of top similar chunks to return, if None defaults to self.top_k
+
+        Returns:
+            list of Documents
+
+        """
+        if with_score:
+            # the langchain DeepLake search by embedding with scores, as used by similarity_search_with_score
+            return self.langchain_client._search(
+                embedding=embedding, k=top_k if top_k else 1, return_score=True
+            )
+        else:
+            return self.langchain_client.similarity_search_by_vector(
+                embedding, k=top_k if top_k else 1
+            )
+
     async def aget_chunk(
         self, query: str, with_score=False, top_k=None
     ) -> Union[List[Document], List[Tuple[Document, float]]]:
@@ -0,0 +1,645 @@
+"""Class for an HNSW vector database.
+
+This module provides:
+
+— HNSWVectorStore
+
+— HNSWClient
+"""
+
+import os
+import pickle
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+import hnswlib
+import numpy as np
+from grag.components.embedding import Embedding, embed_queries
+from grag.components.utils import configure_args
+from grag.components.vectordb.base import VectorDB
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from tqdm import tqdm
+from tqdm.asyncio import tqdm as atqdm
+
+
+class HNSWVectorStore(VectorStore):
+    """A langchain vectorstore backed by an hnswlib graph index, searched approximately.
+
+    The index uses the cosine space, scores are cosine similarities. Deleted rows are marked deleted in the graph
+    and their slots are reused by later inserts. The texts, metadata and ids are kept in a side-table keyed by the
+    index label. The index and side-table are saved together to a single pickle file.
+
+    Attributes:
+        path: path to the index file
+        embedding: langchain embeddings used for texts and queries
+        M: number of bi-directional links per node, higher improves recall at the cost of memory
+        ef_construction: size of the candidate list while inserting, higher improves recall at the cost of insert
+                         time
+        ef_search: size of the candidate list while searching, higher improves recall at the cost of latency
+        read_only: if True, inserts, deletes and saves raise an error
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        embedding: Embeddings,
+        M: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        read_only: bool = False,
+        initial_capacity: int = 1024,
+    ):
+        """Initialize the vectorstore, loading the index file if it exists.
+
+        Args:
+            path: path to the index file
+            embedding: langchain embeddings used for texts and queries
+            M: number of bi-directional links per node, defaults to 16
+            ef_construction: size of the candidate list while inserting, defaults to 200
+            ef_search: size of the candidate list while searching, defaults to 64
+            read_only: if True, inserts, deletes and saves raise an error, defaults to False
+            initial_capacity: number of rows allocated for the first insert, defaults to 1024
+        """
+        self.path = Path(path)
+        self.embedding = embedding
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.read_only = read_only
+        self.initial_capacity = initial_capacity
+        self._lock = threading.RLock()
+        self._index: Optional[hnswlib.Index] = None
+        self._records: Dict[int, Tuple[str, str, dict]] = {}
+        self._labels: Dict[str, int] = {}
+        self._next_label = 0
+        self._metadata_index: Dict[str, Dict[Any, Set[int]]] = {}
+        self.load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """Access the query embedding object."""
+        return self.embedding
+
+    def __len__(self) -> int:
+        """Number of rows in the vectorstore."""
+        return len(self._records)
+
+    def load(self) -> None:
+        """Loads the index and side-table from the index file, if it exists."""
+        if not self.path.exists():
+            return
+        with open(self.path, "rb") as f:
+            state = pickle.load(f)
+        with self._lock:
+            self._index = state["index"]
+            self._records = state["records"]
+            self._next_label = state["next_label"]
+            self._labels = {record[0]: label for label, record in self._records.items()}
+            self._metadata_index = {}
+            if self._index is not None:
+                self._index.set_ef(self.ef_search)
+
+    def save(self) -> None:
+        """Saves the index and side-table to the index file, replacing the previous file atomically."""
+        self._check_writable()
+        with self._lock:
+            if self._index is None and not self.path.exists():
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                pickle.dump(
+                    {
+                        "index": self._index,
+                        "records": self._records,
+                        "next_label": self._next_label,
+                    },
+                    f,
+                    protocol=pickle.HIGHEST_PROTOCOL,
+                )
+            os.replace(tmp_path, self.path)
+
+    def _check_writable(self) -> None:
+        if self.read_only:
+            raise PermissionError(f"{self.path} is opened read-only.")
+
+    def _reserve(self, dim: int, num_rows: int) -> hnswlib.Index:
+        """Returns the index with room for num_rows more rows, doubling the capacity when needed."""
+        required = len(self._records) + num_rows
+        if self._index is None:
+            self._index = hnswlib.Index(space="cosine", dim=dim)
+            self._index.init_index(
+                max_elements=max(self.initial_capacity, required),
+                M=self.M,
+                ef_construction=self.ef_construction,
+                allow_replace_deleted=True,
+            )
+            self._index.set_ef(self.ef_search)
+        elif self._index.get_max_elements() < required:
+            self._index.resize_index(max(required, 2 * self._index.get_max_elements()))
+        return self._index
+
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """Adds texts with precomputed embeddings.
+
+        Args:
+            texts: list of texts
+            embeddings: list of embeddings, one per text
+            metadatas: list of metadata dictionaries, one per text, optional
+            ids: list of ids, one per text, optional, defaults to random uuid4 strings
+
+        Returns:
+            list of ids of the added texts
+        """
+        self._check_writable()
+        if not texts:
+            return []
+        metadatas = metadatas if metadatas else [{} for _ in texts]
+        ids = ids if ids else [str(uuid.uuid4()) for _ in texts]
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            replaced = [self._labels[_id] for _id in ids if _id in self._labels]
+            if replaced:
+                self._delete_labels(replaced)
+            index = self._reserve(matrix.shape[1], len(texts))
+            labels = np.arange(self._next_label, self._next_label + len(texts))
+            index.add_items(matrix, labels, replace_deleted=True)
+            self._next_label += len(texts)
+            for label, _id, text, metadata in zip(
+                labels.tolist(), ids, texts, metadatas
+            ):
+                self._records[label] = (_id, text, metadata)
+                self._labels[_id] = label
+                for key, values in self._metadata_index.items():
+                    if key in metadata:
+                        values.setdefault(metadata[key], set()).add(label)
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        """Embeds texts in a single batch and adds them to the vectorstore.
+
+        Args:
+            texts: texts to add
+            metadatas: list of metadata dictionaries, one per text, optional
+            ids: list of ids, one per text, optional
+            **kwargs: unused
+
+        Returns:
+            list of ids of the added texts
+        """
+        texts = list(texts)
+        embeddings = self.embedding.embed_documents(texts)
+        return self.add_embeddings(texts, embeddings, metadatas=metadatas, ids=ids)
+
+    def similarity_search_by_vectors_with_score(
+        self, embeddings: List[List[float]], k: int = 4
+    ) -> List[List[Tuple[Document, float]]]:
+        """Returns the approximately k documents most similar to each embedding with their cosine similarity.
+
+        All embeddings are searched in a single knn query across the index threads.
+
+        Args:
+            embeddings: list of query embeddings
+            k: number of documents to return per embedding
+
+        Returns:
+            list of lists of (document, score) tuples, one list per embedding
+        """
+        if not embeddings:
+            return []
+        query_vectors = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            k = min(k, len(self._records))
+            if k == 0 or self._index is None:
+                return [[] for _ in embeddings]
+            # the candidate list must hold at least k rows
+            self._index.set_ef(max(self.ef_search, k))
+            try:
+                labels, distances = self._index.knn_query(query_vectors, k=k)
+            finally:
+                self._index.set_ef(self.ef_search)
+            records = [
+                [self._records[label] for label in row] for row in labels.tolist()
+            ]
+        return [
+            [
+                (Document(page_content=text, metadata=metadata), float(1 - distance))
+                for (_, text, metadata), distance in zip(row, row_distances)
+            ]
+            for row, row_distances in zip(records, distances)
+        ]
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Returns the k documents most similar to an embedding with their cosine similarity."""
+        return self.similarity_search_by_vectors_with_score([embedding], k=k)[0]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        """Returns the k documents most similar to an embedding."""
+        return [
+            doc
+            for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k)
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Returns the k documents most similar to a query with their cosine similarity."""
+        return self.similarity_search_by_vector_with_score(
+            self.embedding.embed_query(query), k=k
+        )
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        """Returns the k documents most similar to a query."""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # scores are already cosine similarities
+        return lambda score: score
+
+    def _delete_labels(self, labels: Iterable[int]) -> None:
+        for label in labels:
+            _id, _, metadata = self._records.pop(label)
+            del self._labels[_id]
+            for key, values in self._metadata_index.items():
+                if key in metadata:
+                    values.get(metadata[key], set()).discard(label)
+            self._index.mark_deleted(label)  # type: ignore
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Deletes rows by id, if ids is None all rows are deleted.
+
+        Args:
+            ids: list of ids to delete
+            **kwargs: unused
+
+        Returns:
+            True
+        """
+        self._check_writable()
+        with self._lock:
+            if ids is None:
+                self._index = None
+                self._records = {}
+                self._labels = {}
+                self._next_label = 0
+                self._metadata_index = {}
+            else:
+                self._delete_labels(
+                    [self._labels[_id] for _id in set(ids) if _id in self._labels]
+                )
+        return True
+
+    def delete_where(self, key: str, values: List[Any]) -> None:
+        """Deletes the rows whose metadata value for key is in values.
+
+        The first call for a key builds an in-memory index of the metadata values of key, later calls only look up
+        the values.
+
+        Args:
+            key: metadata key
+            values: metadata values of the rows to delete
+        """
+        self._check_writable()
+        with self._lock:
+            if key not in self._metadata_index:
+                value_index: Dict[Any, Set[int]] = {}
+                for label, (_, _, metadata) in self._records.items():
+                    if key in metadata:
+                        value_index.setdefault(metadata[key], set()).add(label)
+                self._metadata_index[key] = value_index
+            labels = set()
+            for value in values:
+                labels.update(self._metadata_index[key].pop(value, ()))
+            self._delete_labels(labels)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        path: Union[str, Path] = Path("data/vectordb/grag.hnsw"),
+        **kwargs: Any,
+    ) -> "HNSWVectorStore":
+        """Creates a vectorstore at path from texts and saves it."""
+        store = cls(path=path, embedding=embedding)
+        store.add_texts(texts, metadatas=metadatas, **kwargs)
+        store.save()
+        return store
+
+
+@configure_args
+class HNSWClient(VectorDB):
+    """A class for an in-process vectorstore backed by an HNSW graph index with approximate top-k search.
+
+    Search time grows logarithmically with the number of chunks, so it suits collections of tens of millions of
+    chunks that are too large for exact search. The index is held in memory, inserts and deletes of chunks are only
+    written to its file by save, which rewrites the whole index: call it once after a batch of writes, as
+    Retriever.ingest does. delete saves the emptied index.
+
+    Attributes:
+        store_path : str, Path
+            The path to store the index file.
+        collection_name: str
+             The name of the collection, the index file is '<collection_name>.hnsw' under store_path.
+        read_only: bool
+            flag indicating whether the client is read-only
+        M : int
+            number of bi-directional links per node, configured as 'm', config keys are lowercase
+        ef_construction : int
+            size of the candidate list while inserting
+        ef_search : int
+            size of the candidate list while searching
+        embedding_type : str
+            type of embedding used, supported 'sentence-transformers' and 'instructor-embedding'
+        embedding_model : str
+            model name of embedding used, should correspond to the embedding_type
+        batch_size : int
+            number of documents embedded and inserted per insert
+        embedding_cache_path : str, Path
+            path to the embedding cache, if None document embeddings are not cached
+        embedding_cache_size : int
+            maximum number of embeddings in the embedding cache
+        embedding_function
+            a function of the embedding model, derived from the embedding_type and embedding_modelname
+        langchain_client: HNSWVectorStore
+            LangChain vectorstore holding the collection
+        client: HNSWVectorStore
+            same as langchain_client
+    """
+
+    def __init__(
+        self,
+        store_path: Union[str, Path] = Path("data/vectordb"),
+        collection_name: str = "grag",
+        embedding_type: str = "instructor-embedding",
+        embedding_model: str = "hkunlp/instructor-xl",
+        read_only: bool = False,
+        m: Union[int, str] = 16,
+        ef_construction: Union[int, str] = 200,
+        ef_search: Union[int, str] = 64,
+        batch_size: Union[int, str] = 64,
+        embedding_cache_path: Optional[Union[str, Path]] = None,
+        embedding_cache_size: Union[int, str] = 1_000_000,
+    ):
+        """Initialize a HNSWClient object.
+
+        Args:
+            store_path: path to the index file directory, defaults to 'data/vectordb'
+            collection_name: name of the collection, defaults to 'grag'
+            embedding_type: type of embedding used, supported 'sentence-transformers' and 'instructor-embedding',
+                            defaults to instructor-embedding
+            embedding_model: model name of embedding used, should correspond to the embedding_type,
+                             defaults to hkunlp/instructor-xl
+            read_only: flag indicating whether the client is read-only, defaults to False.
+            m: number of bi-directional links per node (hnswlib's M), only used when the index is created,
+               defaults to 16.
+            ef_construction: size of the candidate list while inserting, only used when the index is created,
+                             defaults to 200.
+            ef_search: size of the candidate list while searching, defaults to 64.
+            batch_size: number of documents embedded and inserted per insert, defaults to 64.
+            embedding_cache_path: path to the embedding cache, if None document embeddings are not cached,
+                                  defaults to None.
+            embedding_cache_size: maximum number of embeddings in the embedding cache, defaults to 1,000,000.
+        """
+        self.store_path = Path(store_path)
+        self.collection_name = collection_name
+        self.read_only = read_only
+        self.M = int(m)
+        self.ef_construction = int(ef_construction)
+        self.ef_search = int(ef_search)
+        self.embedding_type: str = embedding_type
+        self.embedding_model: str = embedding_model
+        self.batch_size = int(batch_size)
+        self.embedding_cache_path = embedding_cache_path
+        self.embedding_cache_size = int(embedding_cache_size)
+
+        self.embedding_function = Embedding(
+            embedding_model=self.embedding_model,
+            embedding_type=self.embedding_type,
+            cache_path=self.embedding_cache_path,
+            cache_size=self.embedding_cache_size,
+        ).embedding_function
+
+        self.langchain_client = HNSWVectorStore(
+            path=self.store_path / f"{self.collection_name}.hnsw",
+            embedding=self.embedding_function,
+            M=self.M,
+            ef_construction=self.ef_construction,
+            ef_search=self.ef_search,
+            read_only=self.read_only,
+        )
+        self.client = self.langchain_client
+        self.allowed_metadata_types = (str, int, float, bool)
+
+    def __len__(self) -> int:
+        """Number of chunks in the vector database."""
+        return len(self.client)
+
+    def delete(self) -> None:
+        """Delete all chunks in the vector database."""
+        self.client.delete()
+        self.save()
+        self._bump_version()
+
+    def save(self) -> None:
+        """Writes the index to its file, replacing the previous file atomically."""
+        self.client.save()
+
+    def delete_docs(self, doc_ids: List[str], id_key: str = "doc_id") -> None:
+        """Delete the chunks of the given parent documents from the vector database.
+
+        Args:
+            doc_ids: ids of the parent documents
+            id_key: metadata key of the chunks holding the parent document id
+
+        Returns:
+            None
+        """
+        if doc_ids:
+            self.client.delete_where(id_key, doc_ids)
+        self._bump_version()
+
+    def add_docs(self, docs: List[Document], verbose=True) -> None:
+        """Adds documents to the HNSW index, call save to write them to the index file.
+
+        Documents are embedded and inserted in batches of batch_size.
+
+        Args:
+            docs: List of Documents
+            verbose: Show progress bar
+
+        Returns:
+            None
+        """
+        docs = self._filter_metadata(docs)
+        for batch in tqdm(
+            self._batch_docs(docs),
+            total=self._num_batches(docs),
+            desc=f"Adding to {self.collection_name}:",
+            disable=not verbose,
+        ):
+            _ids = self.langchain_client.add_documents(batch)
+        self._bump_version()
+
+    def add_embedded_docs(
+        self, docs: List[Document], embeddings: List[List[float]]
+    ) -> None:
+        """Adds documents with precomputed embeddings to the HNSW index, call save to write them to the index file.
+
+        Args:
+            docs: List of Documents
+            embeddings: List of embeddings from embedding_function, one per document
+
+        Returns:
+            None
+        """
+        if not docs:
+            return
+        docs = self._filter_metadata(docs)
+        self.client.add_embeddings(
+            [doc.page_content for doc in docs],
+            embeddings,
+            [doc.metadata for doc in docs],
+        )
+        self._bump_version()
+
+    async def aadd_docs(self, docs: List[Document], verbose=True) -> None:
+        """Asynchronously adds documents to the HNSW index, call save to write them to the index file.
+
+        Documents are embedded and inserted in batches of batch_size.
+
+        Args:
+            docs: List of Documents
+            verbose: Show progress bar
+
+        Returns:
+            None
+        """
+        docs = self._filter_metadata(docs)
+        for batch in atqdm(
+            self._batch_docs(docs),
+            total=self._num_batches(docs),
+            desc=f"Adding documents to {self.collection_name}",
+            disable=not verbose,
+        ):
+            await self.langchain_client.aadd_documents(batch)
+        self._bump_version()
+
+    def get_chunk(
+        self, query: str, with_score: bool = False, top_k: Optional[int] = None
+    ) -> Union[List[Document], List[Tuple[Document, float]]]:
+        """Returns the most (cosine) similar chunks from the HNSW index.
+
+        Args:
+            query: A query string
+            with_score: Outputs scores of returned chunks
+            top_k: Number of top similar chunks to return, if None defaults to self.top_k
+
+        Returns:
+            list of Documents
+
+        """
+        if with_score:
+            return self.langchain_client.similarity_search_with_score(
+                query=query, k=top_k if top_k else 1
+            )
+        else:
+            return self.langchain_client.similarity_search(
+                query=query, k=top_k if top_k else 1
+            )
+
+    def get_chunks(
+        self, queries: List[str], with_score: bool = False, top_k: Optional[int] = None
+    ) -> Union[List[List[Document]], List[List[Tuple[Document, float]]]]:
+        """Returns the most (cosine) similar chunks from the HNSW index for each query.
+
+        All queries are embedded in a single batch and searched together.
+
+        Args:
+            queries: list of query strings
+            with_score: Outputs scores of returned chunks
+            top_k: Number of top similar chunks to return per query, if None defaults to self.top_k
+
+        Returns:
+            list of lists of Documents, one list per query
+
+        """
+        results = self.langchain_client.similarity_search_by_vectors_with_score(
+            embed_queries(self.embedding_function, queries), k=top_k if top_k else 1
+        )
+        if with_score:
+            return results
+        else:
+            return [[doc for doc, _ in result] for result in results]
+
+    def get_chunk_by_vector(
+        self,
+        embedding: List[float],
+        with_score: bool = False,
+        top_k: Optional[int] = None,
+    ) -> Union[List[Document], List[Tuple[Document, float]]]:
+        """Returns the most (cosine) similar chunks to a query embedding from the HNSW index.
+
+        Args:
+            embedding: A query embedding, from self.embedding_function
+            with_score: Outputs scores of returned chunks
+            top_k: Number of top similar chunks to return, if None defaults to self.top_k
+
+        Returns:
+            list of Documents
+
+        """
+        if with_score:
+            return self.langchain_client.similarity_search_by_vector_with_score(
+                embedding, k=top_k if top_k else 1
+            )
+        else:
+            return self.langchain_client.similarity_search_by_vector(
+                embedding, k=top_k if top_k else 1
+            )
+
+    async def aget_chunk(
+        self, query: str, with_score=False, top_k=None
+    ) -> Union[List[Document], List[Tuple[Document, float]]]:
+        """Returns the most (cosine) similar chunks from the HNSW index, asynchronously.
+
+        Args:
+            query: A query string
+            with_score: Outputs scores of returned chunks
+            top_k: Number of top similar chunks to return, if None defaults to self.top_k
+
+        Returns:
+            list of Documents
+
+        """
+        if with_score:
+            return await self.langchain_client.asimilarity_search_with_score(
+                query=query, k=top_k if top_k else 1
+            )
+        else:
+            return await self.langchain_client.asimilarity_search(
+                query=query, k=top_k if top_k else 1
+            )
@@ -0,0 +1,975 @@
+"""Class for an in-process NumPy vector database.
+
+This module provides:
+
+— NumpyVectorStore
+
+— NumpyClient
+"""
+
+import json
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+from grag.components.embedding import Embedding, embed_queries
+from grag.components.utils import configure_args
+from grag.components.vectordb.base import VectorDB
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from numpy.lib.format import open_memmap
+from tqdm import tqdm
+from tqdm.asyncio import tqdm as atqdm
+
+_POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _popcount(words: np.ndarray) -> np.ndarray:
+    """Returns the number of set bits of uint64 words, summed over the last axis.
+
+    Uses np.bitwise_count (NumPy >= 2.0), otherwise a lookup table over the bytes of the words.
+    """
+    if hasattr(np, "bitwise_count"):
+        counts = np.bitwise_count(words)
+    else:
+        counts = _POPCOUNT_TABLE[np.ascontiguousarray(words).view(np.uint8)]
+    return counts.sum(axis=-1, dtype=np.int32)
+
+
+class NumpyVectorStore(VectorStore):
+    """A langchain vectorstore backed by a flat float32 matrix, searched exactly.
+
+    Embeddings are L2 normalized and stored as the rows of a memory mapped '.npy' file, so scores are cosine
+    similarities computed with a single matrix-vector product. The texts, metadata and ids are stored as one json
+    line per row in a side-table that is only read for the returned rows.
+
+    The matrix file is preallocated and doubled when full, its header therefore holds the capacity and the number
+    of rows in use is recorded in 'index.json', which is written last on every insert and delete. Files that are
+    rewritten, by deletes or int8 requantization, are written next to the current ones, alternating between
+    'name.ext' and 'name.1.ext', and 'index.json' names the files in use, so an interrupted write leaves the store
+    as it was.
+
+    With quantization, the embeddings are also stored as float16, int8 or binary codes, which take 2x, 4x or 32x
+    less memory, and searches scan the codes instead of the float32 matrix. int8 codes are scaled per dimension by
+    the largest absolute value of the dimension, codes are requantized when a larger value is added, from the
+    float32 matrix if it is stored. Binary codes hold the sign bits of the embeddings packed into uint64 words and are ranked by Hamming distance. The top
+    k * rescore_factor candidates of the codes are rescored with the float32 matrix, which is memory mapped and
+    only read for the candidates. With a rescore_factor of 0 the float32 matrix is not stored and scores are
+    approximate.
+
+    Files in path:
+        vectors.npy: float32 matrix of normalized embeddings, shape (capacity, dim)
+        codes.npy: float16, int8 or uint64 matrix of quantized embeddings, shape (capacity, dim) or
+                   (capacity, ceil(dim / 64)) for binary codes, with quantization
+        docs.jsonl: one json object per row with keys 'id', 'text' and 'metadata'
+        index.json: number of rows in use, embedding dimension, quantization, names of the files in use and scale
+                    of each dimension of the int8 codes
+
+    Attributes:
+        path: directory of the vectorstore files
+        embedding: langchain embeddings used for texts and queries
+        read_only: if True, the files are opened read-only and inserts raise an error
+        quantization: type of the quantized codes, 'float16', 'int8' or 'binary', None if embeddings are not
+                      quantized
+        rescore_factor: number of candidates rescored with float32 embeddings per returned row
+    """
+
+    _max_block_scores = 1 << 26
+    _max_block_rows = 1 << 16
+    _code_dtypes = {"float16": np.float16, "int8": np.int8, "binary": np.uint64}
+    _file_names = {
+        "vectors": ("vectors.npy", "vectors.1.npy"),
+        "codes": ("codes.npy", "codes.1.npy"),
+        "docs": ("docs.jsonl", "docs.1.jsonl"),
+    }
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        embedding: Embeddings,
+        read_only: bool = False,
+        initial_capacity: int = 1024,
+        quantization: Optional[str] = None,
+        rescore_factor: Union[int, str, None] = None,
+    ):
+        """Initialize the vectorstore, loading the files in path if they exist.
+
+        Args:
+            path: directory of the vectorstore files
+            embedding: langchain embeddings used for texts and queries
+            read_only: if True, the files are opened read-only, defaults to False
+            initial_capacity: number of rows allocated for the first insert, defaults to 1024
+            quantization: type of the quantized codes, 'float16', 'int8' or 'binary', must match the quantization
+                          the files were created with, defaults to None, embeddings are not quantized
+            rescore_factor: with quantization, number of candidates rescored with float32 embeddings per returned
+                            row, 0 disables rescoring, a new store then does not store float32 embeddings,
+                            defaults to 4, 10 for binary codes which rank candidates more coarsely
+
+        Raises:
+            ValueError: if quantization is invalid or does not match the quantization of the files
+        """
+        if quantization is not None and quantization not in self._code_dtypes:
+            raise ValueError(
+                f"quantization {quantization} is invalid, supported: {list(self._code_dtypes)}."
+            )
+        self.path = Path(path)
+        self.embedding = embedding
+        self.read_only = read_only
+        self.initial_capacity = initial_capacity
+        self.quantization = quantization
+        if rescore_factor is None or rescore_factor == "":
+            rescore_factor = 10 if quantization == "binary" else 4
+        self.rescore_factor = int(rescore_factor)
+        self._lock = threading.RLock()
+        self._vectors: Optional[np.ndarray] = None
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._files = {kind: names[0] for kind, names in self._file_names.items()}
+        # whether the float32 embeddings are stored, always without quantization
+        self._has_vectors = quantization is None or self.rescore_factor > 0
+        self._offsets: List[int] = [0]
+        self._size = 0
+        self._dim: Optional[int] = None
+        self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        """Access the query embedding object."""
+        return self.embedding
+
+    @property
+    def _vectors_path(self) -> Path:
+        return self.path / self._files["vectors"]
+
+    @property
+    def _docs_path(self) -> Path:
+        return self.path / self._files["docs"]
+
+    @property
+    def _index_path(self) -> Path:
+        return self.path / "index.json"
+
+    @property
+    def _codes_path(self) -> Path:
+        return self.path / self._files["codes"]
+
+    def _alternate(self, kind: str) -> str:
+        """Name of the file that is not in use of the two files of kind."""
+        names = self._file_names[kind]
+        return names[1 - names.index(self._files[kind])]
+
+    def __len__(self) -> int:
+        """Number of rows in the vectorstore."""
+        return self._size
+
+    def _load(self) -> None:
+        """Memory maps the matrix and indexes the side-table lines of the rows in use."""
+        if not self._index_path.exists():
+            return
+        with open(self._index_path, "r") as f:
+            index = json.load(f)
+        self._size, self._dim = index["size"], index["dim"]
+        quantization = index.get("quantization")
+        if quantization != self.quantization:
+            raise ValueError(
+                f"{self.path} is stored with quantization {quantization}, not {self.quantization}."
+            )
+        mmap_mode = "r" if self.read_only else "r+"
+        self._has_vectors = index.get("float32", True)
+        self._files.update(index.get("files", {}))
+        if self._has_vectors:
+            self._vectors = np.load(self._vectors_path, mmap_mode=mmap_mode)
+        if self.quantization is not None:
+            self._codes = np.load(self._codes_path, mmap_mode=mmap_mode)
+        if self.quantization == "int8":
+            self._scales = np.asarray(index["scales"], dtype=np.float32)
+        offsets = [0]
+        with open(self._docs_path, "rb") as f:
+            for _ in range(self._size):
+                offsets.append(offsets[-1] + len(f.readline()))
+        self._offsets = offsets
+        if not self.read_only:
+            # drop lines of an insert that was interrupted before index.json was written
+            os.truncate(self._docs_path, offsets[-1])
+
+    def _write_index(self) -> None:
+        tmp_path = self._index_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "size": self._size,
+                    "dim": self._dim,
+                    "quantization": self.quantization,
+                    "float32": self._has_vectors,
+                    "files": self._files,
+                    "scales": None if self._scales is None else self._scales.tolist(),
+                },
+                f,
+            )
+        os.replace(tmp_path, self._index_path)
+        for kind in self._file_names:
+            # files replaced by the write, or left by a write interrupted before index.json was written
+            alternate = self.path / self._alternate(kind)
+            if alternate.exists():
+                os.remove(alternate)
+
+    @property
+    def _code_width(self) -> int:
+        """Number of columns of the codes, binary codes pack 64 dimensions per column."""
+        assert self._dim is not None
+        return -(-self._dim // 64) if self.quantization == "binary" else self._dim
+
+    def _grow(
+        self,
+        path: Path,
+        matrix: Optional[np.ndarray],
+        dtype,
+        capacity: int,
+        width: Optional[int] = None,
+    ) -> np.ndarray:
+        """Returns a copy of the rows in use of matrix in a new file of capacity rows, replacing the file at path."""
+        tmp_path = path.with_suffix(".tmp.npy")
+        grown = open_memmap(
+            tmp_path, mode="w+", dtype=dtype, shape=(capacity, width or self._dim)
+        )
+        if matrix is not None:
+            grown[: self._size] = matrix[: self._size]
+        grown.flush()
+        os.replace(tmp_path, path)
+        return grown
+
+    def _reserve(self, num_rows: int) -> None:
+        """Makes room for num_rows more rows in the matrices, doubling their capacity when needed."""
+        if self.read_only:
+            raise PermissionError(f"{self.path} is opened read-only.")
+        required = self._size + num_rows
+        current = self._vectors if self._has_vectors else self._codes
+        if current is not None and current.shape[0] >= required:
+            return
+        capacity = max(self.initial_capacity, required)
+        if current is not None:
+            capacity = max(capacity, 2 * current.shape[0])
+        self.path.mkdir(parents=True, exist_ok=True)
+        if self._has_vectors:
+            self._vectors = self._grow(
+                self._vectors_path, self._vectors, np.float32, capacity
+            )
+        if self.quantization is not None:
+            self._codes = self._grow(
+                self._codes_path,
+                self._codes,
+                self._code_dtypes[self.quantization],
+                capacity,
+                self._code_width,
+            )
+
+    def _encode(self, matrix: np.ndarray) -> np.ndarray:
+        """Quantizes normalized embeddings into codes, growing the int8 scales and requantizing stored codes if needed."""
+        if self.quantization == "float16":
+            return matrix.astype(np.float16)
+        if self.quantization == "binary":
+            return self._binarize(matrix)
+        scales = np.abs(matrix).max(axis=0).astype(np.float32)
+        if self._scales is not None:
+            scales = np.maximum(scales, self._scales)
+            if self._size > 0 and np.any(scales > self._scales):
+                self._requantize(scales)
+        self._scales = scales
+        return self._quantize(matrix, scales)
+
+    @staticmethod
+    def _quantize(matrix: np.ndarray, scales: np.ndarray) -> np.ndarray:
+        codes = matrix / np.where(scales > 0, scales, 1) * 127
+        return np.clip(np.round(codes), -127, 127).astype(np.int8)
+
+    def _requantize(self, scales: np.ndarray) -> None:
+        """Writes the int8 codes of the rows in use with the grown scales to the alternate codes file.
+
+        The current codes file is left untouched, index.json switches to the new file and its scales together, so an
+        interrupted insert leaves consistent codes and scales. Rows are requantized from the float32 matrix if it is
+        stored, else their codes are rescaled, which rounds them once more.
+        """
+        assert self._codes is not None and self._scales is not None
+        codes_file = self._alternate("codes")
+        codes = open_memmap(
+            self.path / codes_file,
+            mode="w+",
+            dtype=np.int8,
+            shape=self._codes.shape,
+        )
+        ratio = self._scales / np.where(scales > 0, scales, 1)
+        for start in range(0, self._size, self._max_block_rows):
+            block = slice(start, min(start + self._max_block_rows, self._size))
+            if self._vectors is not None:
+                codes[block] = self._quantize(self._vectors[block], scales)
+            else:
+                codes[block] = np.round(self._codes[block] * ratio)
+        codes.flush()
+        self._codes, self._files["codes"] = codes, codes_file
+
+    def _binarize(self, matrix: np.ndarray) -> np.ndarray:
+        """Packs the sign bits of vectors into uint64 words, padding the last word with zeros."""
+        bits = np.zeros((len(matrix), self._code_width * 64), dtype=bool)
+        bits[:, : matrix.shape[1]] = matrix > 0
+        return np.packbits(bits, axis=1).view(np.uint64)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def add_embeddings(
+        self,
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """Adds texts with precomputed embeddings.
+
+        Args:
+            texts: list of texts
+            embeddings: list of embeddings, one per text
+            metadatas: list of metadata dictionaries, one per text, optional
+            ids: list of ids, one per text, optional, defaults to random uuid4 strings
+
+        Returns:
+            list of ids of the added texts
+        """
+        if not texts:
+            return []
+        metadatas = metadatas if metadatas else [{} for _ in texts]
+        ids = ids if ids else [str(uuid.uuid4()) for _ in texts]
+        matrix = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            if self._dim is None:
+                self._dim = matrix.shape[1]
+            self._reserve(len(texts))
+            rows = slice(self._size, self._size + len(texts))
+            if self._vectors is not None:
+                self._vectors[rows] = matrix
+                self._vectors.flush()
+            if self._codes is not None:
+                self._codes[rows] = self._encode(matrix)
+                self._codes.flush()
+            lines = [
+                (
+                    json.dumps({"id": _id, "text": text, "metadata": metadata}) + "\n"
+                ).encode()
+                for _id, text, metadata in zip(ids, texts, metadatas)
+            ]
+            with open(self._docs_path, "ab") as f:
+                f.writelines(lines)
+            for line in lines:
+                self._offsets.append(self._offsets[-1] + len(line))
+            self._size += len(texts)
+            self._write_index()
+        return ids
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        """Embeds texts in a single batch and adds them to the vectorstore.
+
+        Args:
+            texts: texts to add
+            metadatas: list of metadata dictionaries, one per text, optional
+            ids: list of ids, one per text, optional
+            **kwargs: unused
+
+        Returns:
+            list of ids of the added texts
+        """
+        texts = list(texts)
+        embeddings = self.embedding.embed_documents(texts)
+        return self.add_embeddings(texts, embeddings, metadatas=metadatas, ids=ids)
+
+    def _read_rows(self, rows: Iterable[int]) -> List[dict]:
+        """Reads the side-table records of rows."""
+        records = []
+        with self._lock, open(self._docs_path, "rb") as f:
+            for row in rows:
+                f.seek(self._offsets[row])
+                records.append(json.loads(f.readline()))
+        return records
+
+    def _iter_records(self):
+        if self._size == 0:
+            return
+        with open(self._docs_path, "rb") as f:
+            for _ in range(self._size):
+                yield json.loads(f.readline())
+
+    def _search(
+        self, query_vectors: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the rows and scores of the k rows most similar to each normalized query vector.
+
+        Queries are scored in blocks, so that a block's score matrix holds at most _max_block_scores entries.
+
+        Args:
+            query_vectors: normalized query vectors, shape (num_queries, dim)
+            k: number of rows to return per query
+
+        Returns:
+            rows and scores, both of shape (num_queries, min(k, size)), sorted by descending score
+        """
+        if self.quantization is not None:
+            return self._search_codes(query_vectors, k)
+        size, vectors = self._size, self._vectors
+        num_queries = len(query_vectors)
+        k = min(k, size)
+        rows = np.empty((num_queries, k), dtype=np.int64)
+        scores = np.empty((num_queries, k), dtype=np.float32)
+        if k == 0 or vectors is None:
+            return rows, scores
+        block_size = max(1, self._max_block_scores // size)
+        for start in range(0, num_queries, block_size):
+            block = slice(start, start + block_size)
+            block_scores = np.asarray(query_vectors[block] @ vectors[:size].T)
+            if k < size:
+                top = np.argpartition(-block_scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.broadcast_to(np.arange(size), block_scores.shape)
+            top_scores = np.take_along_axis(block_scores, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind="stable")
+            rows[block] = np.take_along_axis(top, order, axis=1)
+            scores[block] = np.take_along_axis(top_scores, order, axis=1)
+        return rows, scores
+
+    def _encode_queries(self, query_vectors: np.ndarray) -> np.ndarray:
+        """Converts normalized query vectors into the form scored against the codes."""
+        if self.quantization == "binary":
+            return self._binarize(query_vectors)
+        if self.quantization == "int8":
+            assert self._scales is not None
+            # the scales are folded into the queries instead of dequantizing the codes
+            return query_vectors * (self._scales / 127)
+        return query_vectors
+
+    def _score_codes(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Returns the approximate cosine similarities of the encoded queries to a block of codes.
+
+        The cosine similarity of binary codes is estimated from their Hamming distance h as cos(pi * h / dim).
+        """
+        if self.quantization == "binary":
+            assert self._dim is not None
+            distances = _popcount(queries[:, None, :] ^ codes[None, :, :])
+            return np.cos(np.pi * distances / self._dim).astype(np.float32)
+        return queries @ codes.astype(np.float32).T
+
+    def _search_codes(
+        self, query_vectors: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns the rows and scores of the k rows most similar to each normalized query vector, searching the codes.
+
+        The codes are scanned in blocks of rows, only a block is converted to float32 at once, keeping the best
+        candidates of each query. Binary codes are ranked by Hamming distance, computed with a popcount of the xor
+        of the packed words. With rescoring, the candidates are rescored with their float32 embeddings.
+
+        Args:
+            query_vectors: normalized query vectors, shape (num_queries, dim)
+            k: number of rows to return per query
+
+        Returns:
+            rows and scores, both of shape (num_queries, min(k, size)), sorted by descending score
+        """
+        size, codes = self._size, self._codes
+        num_queries = len(query_vectors)
+        k = min(k, size)
+        rescore = self._vectors is not None and self.rescore_factor > 0
+        num_candidates = min(k * self.rescore_factor, size) if rescore else k
+        rows = np.empty((num_queries, 0), dtype=np.int64)
+        scores = np.empty((num_queries, 0), dtype=np.float32)
+        if k == 0 or codes is None:
+            return rows, scores
+        queries = self._encode_queries(query_vectors)
+        # binary scores go through an xor of shape (num_queries, block_rows, width)
+        per_row = num_queries * (codes.shape[1] if self.quantization == "binary" else 1)
+        block_rows = max(
+            1, min(self._max_block_rows, self._max_block_scores // per_row)
+        )
+        for start in range(0, size, block_rows):
+            stop = min(start + block_rows, size)
+            block_scores = self._score_codes(queries, codes[start:stop])
+            scores = np.concatenate([scores, block_scores], axis=1)
+            rows = np.concatenate(
+                [rows, np.broadcast_to(np.arange(start, stop), block_scores.shape)],
+                axis=1,
+            )
+            if scores.shape[1] > num_candidates:
+                top = np.argpartition(-scores, num_candidates - 1, axis=1)
+                top = top[:, :num_candidates]
+                rows = np.take_along_axis(rows, top, axis=1)
+                scores = np.take_along_axis(scores, top, axis=1)
+        if rescore:
+            assert self._vectors is not None
+            candidates = self._vectors[rows.ravel()].reshape(*rows.shape, -1)
+            scores = np.einsum("qcd,qd->qc", candidates, query_vectors)
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        return (
+            np.take_along_axis(rows, order, axis=1),
+            np.take_along_axis(scores, order, axis=1).astype(np.float32),
+        )
+
+    def similarity_search_by_vectors_with_score(
+        self, embeddings: List[List[float]], k: int = 4
+    ) -> List[List[Tuple[Document, float]]]:
+        """Returns the k documents most similar to each embedding with their cosine similarity.
+
+        The rows are searched and read under the lock, a concurrent delete can not move rows in between.
+
+        Args:
+            embeddings: list of query embeddings
+            k: number of documents to return per embedding
+
+        Returns:
+            list of lists of (document, score) tuples, one list per embedding
+        """
+        if not embeddings:
+            return []
+        query_vectors = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        with self._lock:
+            rows, scores = self._search(query_vectors, k)
+            records = self._read_rows(rows.ravel().tolist())
+        results = []
+        for i in range(len(rows)):
+            results.append(
+                [
+                    (
+                        Document(
+                            page_content=record["text"], metadata=record["metadata"]
+                        ),
+                        float(score),
+                    )
+                    for record, score in zip(
+                        records[i * rows.shape[1] : (i + 1) * rows.shape[1]], scores[i]
+                    )
+                ]
+            )
+        return results
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Returns the k documents most similar to an embedding with their cosine similarity."""
+        return self.similarity_search_by_vectors_with_score([embedding], k=k)[0]
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        """Returns the k documents most similar to an embedding."""
+        return [
+            doc
+            for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k)
+        ]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Returns the k documents most similar to a query with their cosine similarity."""
+        return self.similarity_search_by_vector_with_score(
+            self.embedding.embed_query(query), k=k
+        )
+
+    def similarity_search(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        """Returns the k documents most similar to a query."""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # scores are already cosine similarities
+        return lambda score: score
+
+    def _compact(self, keep: np.ndarray) -> None:
+        """Writes the matrices and side-table with only the rows in keep to the alternate files.
+
+        The current files are left untouched until index.json switches to the alternate files, so an interrupted
+        delete leaves the rows and the side-table as they were.
+        """
+        if self.read_only:
+            raise PermissionError(f"{self.path} is opened read-only.")
+        if self._size == 0:
+            return
+        kept_rows = np.flatnonzero(keep)
+        if len(kept_rows) == self._size:
+            return
+        compacted = {}
+        for kind, matrix in (("vectors", self._vectors), ("codes", self._codes)):
+            if matrix is None:
+                continue
+            name = self._alternate(kind)
+            compacted[kind] = open_memmap(
+                self.path / name, mode="w+", dtype=matrix.dtype, shape=matrix.shape
+            )
+            for start in range(0, len(kept_rows), self._max_block_rows):
+                block = kept_rows[start : start + self._max_block_rows]
+                compacted[kind][start : start + len(block)] = matrix[block]
+            compacted[kind].flush()
+        docs_file = self._alternate("docs")
+        offsets = [0]
+        with (
+            open(self._docs_path, "rb") as src,
+            open(self.path / docs_file, "wb") as dst,
+        ):
+            for row in range(self._size):
+                line = src.readline()
+                if keep[row]:
+                    dst.write(line)
+                    offsets.append(offsets[-1] + len(line))
+        self._vectors = compacted.get("vectors", self._vectors)
+        self._codes = compacted.get("codes", self._codes)
+        for kind in compacted:
+            self._files[kind] = self._alternate(kind)
+        self._files["docs"] = docs_file
+        self._offsets = offsets
+        self._size = len(kept_rows)
+        self._write_index()
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Deletes rows by id, if ids is None all rows are deleted.
+
+        Args:
+            ids: list of ids to delete
+            **kwargs: unused
+
+        Returns:
+            True
+        """
+        with self._lock:
+            if ids is None:
+                keep = np.zeros(self._size, dtype=bool)
+            else:
+                id_set = set(ids)
+                keep = np.array(
+                    [record["id"] not in id_set for record in self._iter_records()],
+                    dtype=bool,
+                )
+            self._compact(keep)
+        return True
+
+    def delete_where(self, key: str, values: List[Any]) -> None:
+        """Deletes the rows whose metadata value for key is in values.
+
+        Args:
+            key: metadata key
+            values: metadata values of the rows to delete
+        """
+        value_set = set(values)
+        with self._lock:
+            keep = np.array(
+                [
+                    record["metadata"].get(key) not in value_set
+                    for record in self._iter_records()
+                ],
+                dtype=bool,
+            )
+            self._compact(keep)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        path: Union[str, Path] = Path("data/vectordb/grag"),
+        **kwargs: Any,
+    ) -> "NumpyVectorStore":
+        """Creates a vectorstore at path from texts."""
+        store = cls(path=path, embedding=embedding)
+        store.add_texts(texts, metadatas=metadatas, **kwargs)
+        return store
+
+
+@configure_args
+class NumpyClient(VectorDB):
+    """A class for an in-process vectorstore backed by a NumPy matrix with exact top-k search.
+
+    It needs no server and searches with a single matrix-vector product, so it suits collections of up to a few
+    million chunks and is a baseline for benchmarking the other clients.
+
+    Attributes:
+        store_path : str, Path
+            The path to store the vectorstore.
+        collection_name: str
+             The name of the collection, stored in a directory under store_path.
+        read_only: bool
+            flag indicating whether the client is read-only
+        embedding_type : str
+            type of embedding used, supported 'sentence-transformers' and 'instructor-embedding'
+        embedding_model : str
+            model name of embedding used, should correspond to the embedding_type
+        batch_size : int
+            number of documents embedded and written per insert
+        embedding_cache_path : str, Path
+            path to the embedding cache, if None document embeddings are not cached
+        embedding_cache_size : int
+            maximum number of embeddings in the embedding cache
+        quantization : str
+            type of the quantized embeddings searched, 'float16', 'int8' or 'binary', None if embeddings are not
+            quantized
+        rescore_factor : int
+            number of candidates rescored with float32 embeddings per returned chunk, with quantization
+        embedding_function
+            a function of the embedding model, derived from the embedding_type and embedding_modelname
+        langchain_client: NumpyVectorStore
+            LangChain vectorstore holding the collection
+        client: NumpyVectorStore
+            same as langchain_client
+    """
+
+    def __init__(
+        self,
+        store_path: Union[str, Path] = Path("data/vectordb"),
+        collection_name: str = "grag",
+        embedding_type: str = "instructor-embedding",
+        embedding_model: str = "hkunlp/instructor-xl",
+        read_only: bool = False,
+        batch_size: Union[int, str] = 64,
+        embedding_cache_path: Optional[Union[str, Path]] = None,
+        embedding_cache_size: Union[int, str] = 1_000_000,
+        quantization: Optional[str] = None,
+        rescore_factor: Union[int, str, None] = None,
+    ):
+        """Initialize a NumpyClient object.
+
+        Args:
+            store_path: path to the vectorstore, defaults to 'data/vectordb'
+            collection_name: name of the collection, defaults to 'grag'
+            embedding_type: type of embedding used, supported 'sentence-transformers' and 'instructor-embedding',
+                            defaults to instructor-embedding
+            embedding_model: model name of embedding used, should correspond to the embedding_type,
+                             defaults to hkunlp/instructor-xl
+            read_only: flag indicating whether the client is read-only, defaults to False.
+            batch_size: number of documents embedded and written per insert, defaults to 64.
+            embedding_cache_path: path to the embedding cache, if None document embeddings are not cached,
+                                  defaults to None.
+            embedding_cache_size: maximum number of embeddings in the embedding cache, defaults to 1,000,000.
+            quantization: type of the quantized embeddings searched, 'float16', 'int8' or 'binary', reduces the
+                          memory of searches by 2x, 4x or 32x, a collection keeps the quantization it was created
+                          with, defaults to None, embeddings are not quantized.
+            rescore_factor: number of candidates rescored with float32 embeddings per returned chunk, with
+                            quantization, 0 disables rescoring and float32 embeddings are not stored, defaults to 4,
+                            10 for binary.
+        """
+        self.store_path = Path(store_path)
+        self.collection_name = collection_name
+        self.read_only = read_only
+        self.embedding_type: str = embedding_type
+        self.embedding_model: str = embedding_model
+        self.batch_size = int(batch_size)
+        self.embedding_cache_path = embedding_cache_path
+        self.embedding_cache_size = int(embedding_cache_size)
+        self.quantization = quantization or None
+        self.rescore_factor = rescore_factor
+
+        self.embedding_function = Embedding(
+            embedding_model=self.embedding_model,
+            embedding_type=self.embedding_type,
+            cache_path=self.embedding_cache_path,
+            cache_size=self.embedding_cache_size,
+        ).embedding_function
+
+        self.langchain_client = NumpyVectorStore(
+            path=self.store_path / self.collection_name,
+            embedding=self.embedding_function,
+            read_only=self.read_only,
+            quantization=self.quantization,
+            rescore_factor=self.rescore_factor,
+        )
+        self.client = self.langchain_client
+        self.allowed_metadata_types = (str, int, float, bool)
+
+    def __len__(self) -> int:
+        """Number of chunks in the vector database."""
+        return len(self.client)
+
+    def delete(self) -> None:
+        """Delete all chunks in the vector database."""
+        self.client.delete()
+        self._bump_version()
+
+    def delete_docs(self, doc_ids: List[str], id_key: str = "doc_id") -> None:
+        """Delete the chunks of the given parent documents from the vector database.
+
+        Args:
+            doc_ids: ids of the parent documents
+            id_key: metadata key of the chunks holding the parent document id
+
+        Returns:
+            None
+        """
+        if doc_ids:
+            self.client.delete_where(id_key, doc_ids)
+        self._bump_version()
+
+    def add_docs(self, docs: List[Document], verbose=True) -> None:
+        """Adds documents to the numpy vectorstore.
+
+        Documents are embedded and written in batches of batch_size.
+
+        Args:
+            docs: List of Documents
+            verbose: Show progress bar
+
+        Returns:
+            None
+        """
+        docs = self._filter_metadata(docs)
+        for batch in tqdm(
+            self._batch_docs(docs),
+            total=self._num_batches(docs),
+            desc=f"Adding to {self.collection_name}:",
+            disable=not verbose,
+        ):
+            _ids = self.langchain_client.add_documents(batch)
+        self._bump_version()
+
+    def add_embedded_docs(
+        self, docs: List[Document], embeddings: List[List[float]]
+    ) -> None:
+        """Adds documents with precomputed embeddings to the numpy vectorstore.
+
+        Args:
+            docs: List of Documents
+            embeddings: List of embeddings from embedding_function, one per document
+
+        Returns:
+            None
+        """
+        if not docs:
+            return
+        docs = self._filter_metadata(docs)
+        self.client.add_embeddings(
+            [doc.page_content for doc in docs],
+            embeddings,
+            [doc.metadata for doc in docs],
+        )
+        self._bump_version()
+
+    async def aadd_docs(self, docs: List[Document], verbose=True) -> None:
+        """Asynchronously adds documents to the numpy vectorstore.
+
+        Documents are embedded and written in batches of batch_size.
+
+        Args:
+            docs: List of Documents
+            verbose: Show progress bar
+
+        Returns:
+            None
+        """
+        docs = self._filter_metadata(docs)
+        for batch in atqdm(
+            self._batch_docs(docs),
+            total=self._num_batches(docs),
+            desc=f"Adding documents to {self.collection_name}",
+            disable=not verbose,
+        ):
+            await self.langchain_client.aadd_documents(batch)
+        self._bump_version()
+
+    def get_chunk(
+        self, query: str, with_score: bool = False, top_k: Optional[int] = None
+    ) -> Union[List[Document], List[Tuple[Document, float]]]:
+        """Returns the most (cosine) similar chunks from the numpy vectorstore.
+
+        Args:
+            query: A query string
+            with_score: Outputs scores of returned chunks
+            top_k: Number of top similar chunks to return, if None defaults to self.top_k
+
+        Returns:
+            list of Documents
+
+        """
+        if with_score:
+            return self.langchain_client.similarity_search_with_score(
+                query=query, k=top_k if top_k else 1
+            )
+        else:
+            return self.langchain_client.similarity_search(
+                query=query, k=top_k if top_k else 1
+            )
+
+    def get_chunks(
+        self, queries: List[str], with_score: bool = False, top_k: Optional[int] = None
+    ) -> Union[List[List[Document]], List[List[Tuple[Document, float]]]]:
+        """Returns the most (cosine) similar chunks from the numpy vectorstore for each query.
+
+        All queries are embedded in a single batch and searched together.
+
+        Args:
+            queries: list of query strings
+            with_score: Outputs scores of returned chunks
+            top_k: Number of top similar chunks to return per query, if None defaults to self.top_k
+
+        Returns:
+            list of lists of Documents, one list per query
+
+        """
+        results = self.langchain_client.similarity_search_by_vectors_with_score(
+            embed_queries(self.embedding_function, queries), k=top_k if top_k else 1
+        )
+        if with_score:
+            return results
+        else:
+            return [[doc for doc, _ in result] for result in results]
+
+    def get_chunk_by_vector(
+        self,
+        embedding: List[float],
+        with_score: bool = False,
+        top_k: Optional[int] = None,
+    ) -> Union[List[Document], List[Tuple[Document, float]]]:
+        """Returns the most (cosine) similar chunks to a query embedding from the numpy vectorstore.
+
+        Args:
+            embedding: A query embedding, from self.embedding_function
+            with_score: Outputs scores of returned chunks
+            top_k: Number of top similar chunks to return, if None defaults to self.top_k
+
+        Returns:
+            list of Documents
+
+        """
+        if with_score:
+            return self.langchain_client.similarity_search_by_vector_with_score(
+                embedding, k=top_k if top_k else 1
+            )
+        else:
+            return self.langchain_client.similarity_search_by_vector(
+                embedding, k=top_k if top_k else 1
+            )
+
+    async def aget_chunk(
+        self, query: str, with_score=False, top_k=None
+    ) -> Union[List[Document], List[Tuple[Document, float]]]:
+        """Returns the most (cosine) similar chunks from the numpy vectorstore, asynchronously.
+
+        Args:
+            query: A query string
+            with_score: Outputs scores of returned chunks
+            top_k: Number of top similar chunks to return, if None defaults to self.top_k
+
+        Returns:
+            list of Documents
+
+        """
+        if with_score:
+            return await self.langchain_client.asimilarity_search_with_score(
+                query=query, k=top_k if top_k else 1
+            )
+        else:
+            return await self.langchain_client.asimilarity_search(
+                query=query, k=top_k if top_k else 1
+            )
@@ -5,18 +5,33 @@ This module provides:
 - BasicRAG
 """
 
+import asyncio
 import json
-from typing import List, Optional, Union
+from functools import lru_cache
+from typing import AsyncIterator, Iterator, List, Optional, Union
 
 from grag import prompts
+from grag.components.context_packer import ContextPacker
 from grag.components.llm import LLM
 from grag.components.multivec_retriever import Retriever
 from grag.components.prompt import FewShotPrompt, Prompt
+from grag.components.scheduler import GenerationScheduler
 from grag.components.utils import get_config
 from importlib_resources import files
 from langchain_core.documents import Document
 
-conf = get_config()
+
+@lru_cache(maxsize=None)
+def _conf():
+    """Returns the config, read from config.ini on first use instead of at import."""
+    return get_config()
+
+
+def __getattr__(name):
+    # keeps the module level conf attribute available without reading config.ini at import
+    if name == "conf":
+        return _conf()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class BasicRAG:
@@ -24,11 +39,17 @@ class BasicRAG:
 
     Attributes:
         model_name (str): Name of the llm model
-        doc_chain (str): Name of the document chain, ("stuff", "refine"), defaults to "stuff"
+        doc_chain (str): Name of the document chain, ("stuff", "refine", "map_reduce"), defaults to "stuff"
         task (str): Name of task, defaults to "QA"
         llm_kwargs (dict): Keyword arguments for LLM class
         retriever_kwargs (dict): Keyword arguments for Retriever class
         custom_prompt (Prompt): Prompt, defaults to None
+        max_concurrency (int): Maximum number of requests served concurrently by acall and astream, defaults to 4
+        pack_context (bool): Whether the stuff chain packs the retrieved chunks into the context window of the llm,
+            defaults to False
+        context_packer (ContextPacker): Packs the retrieved chunks, counting tokens with the tokenizer of the llm
+        model_handle (ModelHandle): Handle of the llm in the process wide model registry
+        scheduler (GenerationScheduler): Schedules the generations of acall and astream on the llm
     """
 
     def __init__(
@@ -41,8 +62,13 @@ class BasicRAG:
         retriever_kwargs=None,
         stream: bool = False,
         custom_prompt: Union[Prompt, FewShotPrompt, None] = None,
+        max_concurrency: Union[int, str] = 4,
+        pack_context: bool = False,
     ):
         """Initialize BasicRAG."""
+        self.max_concurrency = int(max_concurrency)
+        self.pack_context = pack_context
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
         if retriever is None:
             if retriever_kwargs is None:
                 self.retriever = Retriever(client_kwargs={"read_only": True})
@@ -74,8 +100,13 @@ class BasicRAG:
                 self.refine_prompt = Prompt.load(
                     self.prompt_path.joinpath(self.refine_prompt_name)
                 )
+            elif self.doc_chain == "map_reduce":
+                self.load_map_reduce_prompts()
         else:
             self.main_prompt = self.custom_prompt
+            if self.doc_chain == "map_reduce":
+                self.map_prompt, self.reduce_prompt = self.custom_prompt
+        self.warm_prompt_cache()
 
     @property
     def model_name(self):
@@ -84,12 +115,38 @@ class BasicRAG:
 
     @model_name.setter
     def model_name(self, value):
-        if value is None:
-            self.llm = self.llm_.load_model()
-            self._model_name = conf["llm"]["model_name"]
-        else:
-            self._model_name = value
-            self.llm = self.llm_.load_model(model_name=self.model_name)
+        # models are shared through the model registry, switching back to a model does not reload it
+        previous_handle = getattr(self, "model_handle", None)
+        previous_llm_name = self.llm_.model_name
+        if previous_handle is not None:
+            # released before acquiring, the registry can then unload the previous model to make room for the new one
+            previous_handle.release()
+        try:
+            if value is None:
+                self.model_handle = self.llm_.acquire_model()
+                self._model_name = _conf()["llm"]["model_name"]
+            else:
+                self.model_handle = self.llm_.acquire_model(model_name=value)
+                self._model_name = value
+        except Exception:
+            if previous_handle is not None:
+                self.model_handle = self.llm_.acquire_model(
+                    model_name=previous_llm_name
+                )
+            raise
+        self.llm = self.model_handle.model
+        self.scheduler = GenerationScheduler(
+            self.llm,
+            pipeline=self.llm_.pipeline,
+            max_batch_size=self.llm_.batch_size,
+            lock=self.model_handle.lock,
+        )
+        self.context_packer = ContextPacker(
+            self.llm_.get_token_counter(self.llm),
+            max_overlap=getattr(
+                self.retriever.splitter.text_splitter, "_chunk_overlap", 400
+            ),
+        )
 
     @property
     def doc_chain(self):
@@ -98,7 +155,7 @@ class BasicRAG:
 
     @doc_chain.setter
     def doc_chain(self, value):
-        _allowed_doc_chains = ["refine", "stuff"]
+        _allowed_doc_chains = ["refine", "stuff", "map_reduce"]
         if value not in _allowed_doc_chains:
             raise ValueError(
                 f"Doc chain {value} is not allowed. Available choices: {_allowed_doc_chains}"
@@ -109,6 +166,11 @@ class BasicRAG:
                 assert len(self.custom_prompt) == 2, ValueError(
                     f"Refine chain needs 2 custom prompts. {len(self.custom_prompt)} custom prompts were given."
                 )
+        if value == "map_reduce":
+            if self.custom_prompt is not None:
+                assert len(self.custom_prompt) == 2, ValueError(
+                    f"Map reduce chain needs 2 custom prompts. {len(self.custom_prompt)} custom prompts were given."
+                )
         self.prompt_matcher()
 
     @property
@@ -140,6 +202,8 @@ class BasicRAG:
 
         self.main_prompt_name = f"{self.model_type}_{self.task}_1.json"
         self.refine_prompt_name = f"{self.model_type}_{self.task}-refine_1.json"
+        self.map_prompt_name = f"{self.model_type}_{self.task}-map_1.json"
+        self.reduce_prompt_name = f"{self.model_type}_{self.task}-reduce_1.json"
         if self.custom_prompt is None:
             self.main_prompt = Prompt.load(
                 self.prompt_path.joinpath(self.main_prompt_name)
@@ -148,6 +212,38 @@ class BasicRAG:
                 self.refine_prompt = Prompt.load(
                     self.prompt_path.joinpath(self.refine_prompt_name)
                 )
+            elif self.doc_chain == "map_reduce":
+                self.load_map_reduce_prompts()
+            self.warm_prompt_cache()
+
+    def load_map_reduce_prompts(self):
+        """Loads the map and reduce prompts of the map reduce chain."""
+        self.map_prompt = Prompt.load(self.prompt_path.joinpath(self.map_prompt_name))
+        self.reduce_prompt = Prompt.load(
+            self.prompt_path.joinpath(self.reduce_prompt_name)
+        )
+
+    def warm_prompt_cache(self):
+        """Caches the KV state of the static prefixes of the prompts, if the llm has a prompt cache."""
+        prompts = [self.main_prompt]
+        if self.doc_chain == "refine" and hasattr(self, "refine_prompt"):
+            prompts.append(self.refine_prompt)
+        elif self.doc_chain == "map_reduce" and hasattr(self, "map_prompt"):
+            prompts.extend([self.map_prompt, self.reduce_prompt])
+        with self.model_handle.lock:
+            for prompt in prompts:
+                if isinstance(prompt, Prompt):
+                    self.llm_.warm_prompt_cache(self.llm, prompt)
+
+    def _invoke(self, prompt: str) -> str:
+        """Generates the response, holding the lock of the shared model."""
+        with self.model_handle.lock:
+            return self.llm.invoke(prompt)
+
+    def _stream(self, prompt: str) -> Iterator[str]:
+        """Streams the response, holding the lock of the shared model until the stream ends."""
+        with self.model_handle.lock:
+            yield from self.llm.stream(prompt)
 
     @staticmethod
     def stuff_docs(docs: List[Document]) -> str:
@@ -167,7 +263,7 @@ class BasicRAG:
 
         def output_parser_wrapper(*args, **kwargs):
             response, retrieved_docs = call_func(*args, **kwargs)
-            if conf["llm"]["std_out"] == "False":
+            if _conf()["llm"]["std_out"] == "False":
                 # if self.llm_.callback_manager is None:
                 print(response)
             print("Sources: ")
@@ -177,9 +273,27 @@ class BasicRAG:
 
         return output_parser_wrapper
 
+    def pack_docs(self, docs: List[Document], query: str) -> List[Document]:
+        """Packs docs into the context window of the llm, leaving room for the prompt and the response.
+
+        Args:
+            docs: retrieved documents, from the highest to the lowest ranked
+            query: A query string
+
+        Returns:
+            the packed documents, see ContextPacker.pack
+        """
+        prompt_tokens = self.context_packer.num_tokens(
+            self.main_prompt.format(context="", question=query)
+        )
+        max_tokens = int(self.llm_.n_ctx) - self.llm_.max_new_tokens - prompt_tokens
+        return self.context_packer.pack(docs, max_tokens)
+
     def stuff_chain(self, query: str):
         """Call function for stuff chain."""
         retrieved_docs = self.retriever.get_chunk(query)
+        if self.pack_context:
+            retrieved_docs = self.pack_docs(retrieved_docs, query)
         context = self.stuff_docs(retrieved_docs)
         prompt = self.main_prompt.format(context=context, question=query)
         return prompt, retrieved_docs
@@ -189,9 +303,9 @@ class BasicRAG:
         """Call function for output of stuff chain."""
         prompt, retrieved_docs = self.stuff_chain(query)
         if self.stream:
-            response = self.llm.stream(prompt)
+            response = self._stream(prompt)
         else:
-            response = self.llm.invoke(prompt)
+            response = self._invoke(prompt)
         return response, retrieved_docs
 
     def refine_chain(self, query: str):
@@ -203,7 +317,7 @@ class BasicRAG:
                 prompt = self.main_prompt.format(
                     context=doc.page_content, question=query
                 )
-                response = self.llm.invoke(prompt)
+                response = self._invoke(prompt)
                 responses.append(response)
             else:
                 prompt = self.refine_prompt.format(
@@ -211,7 +325,7 @@ class BasicRAG:
                     question=query,
                     existing_answer=responses[-1],
                 )
-                response = self.llm.invoke(prompt)
+                response = self._invoke(prompt)
                 responses.append(response)
         prompt = self.refine_prompt.format(
             context=retrieved_docs[-1].page_content,
@@ -225,15 +339,176 @@ class BasicRAG:
         """Call function for output of refine chain."""
         prompt, retrieved_docs, responses = self.refine_chain(query)
         if self.stream:
-            response = self.llm.stream(prompt)
+            response = self._stream(prompt)
         else:
-            response = self.llm.invoke(prompt)
+            response = self._invoke(prompt)
         responses.append(response)
         return responses, retrieved_docs
 
+    @staticmethod
+    def combine_answers(answers: List[str]) -> str:
+        r"""Concatenates the answers of the map step into a numbered list seperated by '\n\n'."""
+        return "\n\n".join(
+            [
+                f"Answer {index + 1}: {answer.strip()}"
+                for index, answer in enumerate(answers)
+            ]
+        )
+
+    def map_reduce_chain(self, query: str):
+        """Call function for map reduce chain.
+
+        The map prompts of all retrieved chunks are independent of each other, so they are generated in a single
+        llm.batch call, which the hf pipeline generates as one batch.
+        """
+        retrieved_docs = self.retriever.get_chunk(query)
+        map_prompts = [
+            self.map_prompt.format(context=doc.page_content, question=query)
+            for doc in retrieved_docs
+        ]
+        with self.model_handle.lock:
+            answers = self.llm.batch(map_prompts)
+        prompt = self.reduce_prompt.format(
+            context=self.combine_answers(answers), question=query
+        )
+        return prompt, retrieved_docs, answers
+
+    @output_parser
+    def map_reduce_call(self, query: str):
+        """Call function for output of map reduce chain."""
+        prompt, retrieved_docs, _ = self.map_reduce_chain(query)
+        if self.stream:
+            response = self._stream(prompt)
+        else:
+            response = self._invoke(prompt)
+        return response, retrieved_docs
+
     def __call__(self, query: str):
         """Call function for the class."""
         if self.doc_chain == "stuff":
             return self.stuff_call(query)
         elif self.doc_chain == "refine":
             return self.refine_call(query)
+        elif self.doc_chain == "map_reduce":
+            return self.map_reduce_call(query)
+
+    def _request_semaphore(self) -> asyncio.Semaphore:
+        """Returns the semaphore limiting concurrent requests, created for the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            self._async_loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _ainvoke(self, prompt: str) -> str:
+        return await self.scheduler.generate(prompt)  # type: ignore
+
+    async def astuff_chain(self, query: str):
+        """Async call function for stuff chain."""
+        retrieved_docs = await self.retriever.aget_chunk(query)
+        if self.pack_context:
+            retrieved_docs = self.pack_docs(retrieved_docs, query)
+        context = self.stuff_docs(retrieved_docs)
+        prompt = self.main_prompt.format(context=context, question=query)
+        return prompt, retrieved_docs
+
+    async def astuff_call(self, query: str):
+        """Async call function for output of stuff chain."""
+        prompt, retrieved_docs = await self.astuff_chain(query)
+        response = await self._ainvoke(prompt)
+        return response, retrieved_docs
+
+    async def arefine_chain(self, query: str):
+        """Async call function for refine chain."""
+        retrieved_docs = await self.retriever.aget_chunk(query)
+        responses: List[str] = []
+        for index, doc in enumerate(retrieved_docs[:-1]):
+            if index == 0:
+                prompt = self.main_prompt.format(
+                    context=doc.page_content, question=query
+                )
+            else:
+                prompt = self.refine_prompt.format(
+                    context=doc.page_content,
+                    question=query,
+                    existing_answer=responses[-1],
+                )
+            responses.append(await self._ainvoke(prompt))
+        prompt = self.refine_prompt.format(
+            context=retrieved_docs[-1].page_content,
+            question=query,
+            existing_answer=responses[-1],
+        )
+        return prompt, retrieved_docs, responses
+
+    async def arefine_call(self, query: str):
+        """Async call function for output of refine chain."""
+        prompt, retrieved_docs, responses = await self.arefine_chain(query)
+        responses.append(await self._ainvoke(prompt))
+        return responses, retrieved_docs
+
+    async def amap_reduce_chain(self, query: str):
+        """Async call function for map reduce chain, the map prompts are generated concurrently."""
+        retrieved_docs = await self.retriever.aget_chunk(query)
+        answers = await asyncio.gather(
+            *[
+                self._ainvoke(
+                    self.map_prompt.format(context=doc.page_content, question=query)
+                )
+                for doc in retrieved_docs
+            ]
+        )
+        prompt = self.reduce_prompt.format(
+            context=self.combine_answers(list(answers)), question=query
+        )
+        return prompt, retrieved_docs, list(answers)
+
+    async def amap_reduce_call(self, query: str):
+        """Async call function for output of map reduce chain."""
+        prompt, retrieved_docs, _ = await self.amap_reduce_chain(query)
+        response = await self._ainvoke(prompt)
+        return response, retrieved_docs
+
+    async def acall(self, query: str):
+        """Async call function for the class.
+
+        Retrieval and generation are awaited, so one event loop can serve many requests. At most max_concurrency
+        requests are served at a time, the others wait for a free slot. Generations are queued on the scheduler,
+        which batches concurrent prompts for the hf pipeline. Unlike __call__, the response and sources are not
+        printed.
+
+        Args:
+            query: A query string
+
+        Returns:
+            the response (a list of responses for the refine chain) and the retrieved documents
+        """
+        async with self._request_semaphore():
+            if self.doc_chain == "stuff":
+                return await self.astuff_call(query)
+            elif self.doc_chain == "refine":
+                return await self.arefine_call(query)
+            elif self.doc_chain == "map_reduce":
+                return await self.amap_reduce_call(query)
+
+    async def astream(self, query: str) -> AsyncIterator[str]:
+        """Streams the response tokens of the query as an async iterator.
+
+        For the refine and map reduce chains, the intermediate responses are generated first and only the final
+        response is streamed. Requests share the max_concurrency slots with acall.
+
+        Args:
+            query: A query string
+
+        Yields:
+            response tokens
+        """
+        async with self._request_semaphore():
+            if self.doc_chain == "stuff":
+                prompt, _ = await self.astuff_chain(query)
+            elif self.doc_chain == "refine":
+                prompt, _, _ = await self.arefine_chain(query)
+            else:
+                prompt, _, _ = await self.amap_reduce_chain(query)
+            async for token in self.scheduler.stream(prompt):
+                yield token
@@ -0,0 +1,58 @@
+from grag.components.context_packer import ContextPacker
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+
+def count_words(text):
+    return len(text.split())
+
+
+text = " ".join(f"word{i}" for i in range(400))
+splitter = RecursiveCharacterTextSplitter(chunk_size=400, chunk_overlap=100, length_function=len)
+chunks = splitter.split_documents([Document(page_content=text, metadata={"source": "a.pdf"})])
+
+
+def test_pack_budget():
+    packer = ContextPacker(count_words, separator="", trim_overlap=False)
+    docs = [Document(page_content="a " * n, metadata={"rank": i}) for i, n in enumerate([5, 10, 3, 2])]
+    packed = packer.pack(docs, max_tokens=10)
+    # the 10 token doc does not fit after the first, shorter lower ranked docs fill the budget
+    assert [doc.metadata["rank"] for doc in packed] == [0, 2, 3]
+    assert sum(count_words(doc.page_content) for doc in packed) <= 10
+    assert packer.pack(docs, max_tokens=1) == []
+
+
+def test_pack_token_count_cache():
+    calls = []
+
+    def count(text):
+        calls.append(text)
+        return count_words(text)
+
+    packer = ContextPacker(count, trim_overlap=False)
+    packer.pack(chunks, max_tokens=10000)
+    num_calls = len(calls)
+    packer.pack(chunks, max_tokens=10000)
+    assert len(calls) == num_calls
+    assert packer.token_counts.hits >= len(chunks)
+
+
+def test_pack_trim_overlap():
+    assert len(chunks) > 3
+    packer = ContextPacker(count_words, separator=" ")
+    # retrieved out of document order
+    docs = [chunks[2], chunks[1], chunks[3], chunks[2]]
+    packed = packer.pack(docs, max_tokens=10000)
+    assert len(packed) == 3
+    assert packed[0].page_content == chunks[2].page_content
+    words = " ".join(doc.page_content for doc in packed).split()
+    # every word of the three chunks is packed exactly once
+    assert sorted(words) == sorted(set(" ".join(c.page_content for c in chunks[1:4]).split()))
+    assert all(doc.metadata["source"] == "a.pdf" for doc in packed)
+
+
+def test_pack_other_sources_not_trimmed():
+    packer = ContextPacker(count_words)
+    other = Document(page_content=chunks[1].page_content, metadata={"source": "b.pdf"})
+    packed = packer.pack([chunks[0], other], max_tokens=10000)
+    assert packed[1].page_content == chunks[1].page_content
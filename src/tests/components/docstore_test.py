@@ -0,0 +1,49 @@
+import threading
+
+import pytest
+from grag.components.docstore import SQLiteStore
+
+
+@pytest.mark.parametrize("compression", [None, "zstd"])
+def test_sqlite_store(tmp_path, compression):
+    store = SQLiteStore(tmp_path / "docstore.sqlite", compression=compression)
+    pairs = [(f"doc_{i}", f"content {i}".encode() * 100) for i in range(1200)]
+    store.mset(pairs)
+    assert len(store) == len(pairs)
+    keys = ["doc_5", "missing", "doc_1100", "doc_5"]
+    assert store.mget(keys) == [pairs[5][1], None, pairs[1100][1], pairs[5][1]]
+    assert store.mget([key for key, _ in pairs]) == [value for _, value in pairs]
+    store.mdelete(["doc_5", "doc_6"])
+    assert store.mget(["doc_5", "doc_6", "doc_7"]) == [None, None, pairs[7][1]]
+    assert sorted(store.yield_keys(prefix="doc_11")) == sorted(
+        ["doc_11"] + [f"doc_11{i}" for i in range(10)] + [f"doc_11{i:02d}" for i in range(100)]
+    )
+    assert len(list(store.yield_keys())) == len(pairs) - 2
+
+
+def test_sqlite_store_mixed_compression(tmp_path):
+    path = tmp_path / "docstore.sqlite"
+    SQLiteStore(path).mset([("plain", b"plain value")])
+    compressed = SQLiteStore(path, compression="zstd")
+    compressed.mset([("compressed", b"compressed value")])
+    assert SQLiteStore(path).mget(["plain", "compressed"]) == [b"plain value", b"compressed value"]
+
+
+def test_sqlite_store_threads(tmp_path):
+    store = SQLiteStore(tmp_path / "docstore.sqlite", compression="zstd")
+    store.mset([(f"doc_{i}", str(i).encode()) for i in range(100)])
+    errors = []
+
+    def read():
+        try:
+            for _ in range(20):
+                assert store.mget([f"doc_{i}" for i in range(100)]) == [str(i).encode() for i in range(100)]
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
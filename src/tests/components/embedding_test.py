@@ -1,6 +1,13 @@
 import numpy as np
 import pytest
-from grag.components.embedding import Embedding
+from grag.components.embedding import (
+    CachedEmbeddings,
+    Embedding,
+    LazyEmbeddings,
+    embed_queries,
+    get_shared_embeddings,
+)
+from langchain_community.embeddings import DeterministicFakeEmbedding
 
 
 # %%
@@ -48,3 +55,105 @@ def test_embeddings(embedding_config):
         ]
     assert similarity_scores[0] > similarity_scores[1]
     del embedding
+
+
+@pytest.mark.parametrize("embedding_config", embedding_configs)
+def test_embed_queries(embedding_config):
+    queries = ["The new movie is awesome.", "The cat sits outside."]
+    embedding = Embedding(**embedding_config)
+    batched = embed_queries(embedding.embedding_function, queries)
+    single = [embedding.embedding_function.embed_query(query) for query in queries]
+    assert np.allclose(batched, single, atol=1e-5)
+    del embedding
+
+
+def test_embed_queries_fallback(tmp_path):
+    queries = ["The new movie is awesome.", "The cat sits outside."]
+    embeddings = DeterministicFakeEmbedding(size=16)
+    single = [embeddings.embed_query(query) for query in queries]
+    assert np.allclose(embed_queries(embeddings, queries), single)
+    cached = CachedEmbeddings(embeddings, cache_path=tmp_path / "cache.sqlite", namespace="test")
+    assert np.allclose(embed_queries(cached, queries), single)
+    assert embed_queries(embeddings, []) == []
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    num_embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.num_embedded += len(texts)
+        return super().embed_documents(texts)
+
+
+def test_cached_embeddings(tmp_path):
+    texts = ["header", "The cat sits outside.", "header"]
+    cached = CachedEmbeddings(
+        CountingEmbeddings(size=16), cache_path=tmp_path / "cache.sqlite", namespace="test"
+    )
+    vecs = cached.embed_documents(texts)
+    assert cached.embeddings.num_embedded == 2
+    assert np.allclose(vecs[0], vecs[2])
+    assert np.allclose(cached.embed_documents(texts), vecs, atol=1e-6)
+    assert cached.embeddings.num_embedded == 2
+    assert cached.hits == 3
+    reloaded = CachedEmbeddings(
+        CountingEmbeddings(size=16), cache_path=tmp_path / "cache.sqlite", namespace="test"
+    )
+    reloaded.embed_documents(texts)
+    assert reloaded.embeddings.num_embedded == 0
+    other_model = CachedEmbeddings(
+        CountingEmbeddings(size=16), cache_path=tmp_path / "cache.sqlite", namespace="other"
+    )
+    other_model.embed_documents(texts)
+    assert other_model.embeddings.num_embedded == 2
+
+
+def test_cached_embeddings_eviction(tmp_path):
+    cached = CachedEmbeddings(
+        CountingEmbeddings(size=16),
+        cache_path=tmp_path / "cache.sqlite",
+        namespace="test",
+        max_size=2,
+    )
+    cached.embed_documents(["a"])
+    cached.embed_documents(["b"])
+    cached.embed_documents(["a"])  # b is now least recently used
+    cached.embed_documents(["c"])
+    assert len(cached) == 2
+    cached.embeddings.num_embedded = 0
+    cached.embed_documents(["a", "c"])
+    assert cached.embeddings.num_embedded == 0
+    cached.embed_documents(["b"])
+    assert cached.embeddings.num_embedded == 1
+
+
+def test_lazy_embeddings():
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return DeterministicFakeEmbedding(size=8)
+
+    lazy = LazyEmbeddings(loader)
+    assert not lazy.loaded
+    assert lazy.embed_query("a") == DeterministicFakeEmbedding(size=8).embed_query("a")
+    assert embed_queries(lazy, ["a", "b"]) == lazy.embed_documents(["a", "b"])
+    assert lazy.loaded
+    assert loads == [1]
+
+
+def test_shared_embeddings(tmp_path):
+    # the models are not loaded until first used, so no model is needed here
+    first = Embedding(embedding_type="instructor-embedding", embedding_model="hkunlp/instructor-xl")
+    second = Embedding(
+        embedding_type="instructor-embedding",
+        embedding_model="hkunlp/instructor-xl",
+        cache_path=tmp_path / "cache.sqlite",
+    )
+    assert first.embedding_function is second.embedding_function.embeddings
+    assert not first.embedding_function.loaded
+    assert first.embedding_function is get_shared_embeddings("instructor-embedding", "hkunlp/instructor-xl")
+    other_device = get_shared_embeddings("instructor-embedding", "hkunlp/instructor-xl", device="cpu")
+    assert other_device is not first.embedding_function
+    with pytest.raises(Exception):
+        Embedding(embedding_type="invalid", embedding_model="hkunlp/instructor-xl")
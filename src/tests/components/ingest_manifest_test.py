@@ -0,0 +1,57 @@
+import os
+
+from grag.components.ingest_manifest import IngestManifest
+
+
+def test_manifest_unchanged(tmp_path):
+    filepath = tmp_path / "doc.pdf"
+    filepath.write_bytes(b"content")
+    manifest = IngestManifest(tmp_path / "manifest.json")
+    assert not manifest.is_unchanged(filepath)
+    manifest.update(filepath, ["b", "a", "a"])
+    assert manifest.is_unchanged(filepath)
+    assert manifest.doc_ids(filepath) == ["a", "b"]
+
+
+def test_manifest_changed(tmp_path):
+    filepath = tmp_path / "doc.pdf"
+    filepath.write_bytes(b"content")
+    manifest = IngestManifest(tmp_path / "manifest.json")
+    manifest.update(filepath, ["a"])
+    filepath.write_bytes(b"new content")
+    assert not manifest.is_unchanged(filepath)
+
+
+def test_manifest_touched(tmp_path):
+    filepath = tmp_path / "doc.pdf"
+    filepath.write_bytes(b"content")
+    manifest = IngestManifest(tmp_path / "manifest.json")
+    manifest.update(filepath, ["a"])
+    stat = filepath.stat()
+    os.utime(filepath, (stat.st_atime, stat.st_mtime + 10))
+    assert manifest.is_unchanged(filepath)
+
+
+def test_manifest_save_load(tmp_path):
+    filepath = tmp_path / "doc.pdf"
+    filepath.write_bytes(b"content")
+    manifest = IngestManifest(tmp_path / "manifest.json")
+    manifest.update(filepath, ["a"])
+    manifest.save()
+    loaded = IngestManifest(tmp_path / "manifest.json")
+    assert filepath in loaded
+    assert loaded.is_unchanged(filepath)
+    loaded.remove(filepath)
+    assert filepath not in loaded
+
+
+def test_manifest_update_with_hash(tmp_path):
+    from grag.components.utils import hash_file
+
+    filepath = tmp_path / "doc.pdf"
+    filepath.write_bytes(b"content")
+    manifest = IngestManifest(tmp_path / "manifest.json")
+    manifest.update(filepath, ["a"], file_hash=hash_file(filepath))
+    stat = filepath.stat()
+    os.utime(filepath, (stat.st_atime, stat.st_mtime + 10))
+    assert manifest.is_unchanged(filepath)
@@ -0,0 +1,90 @@
+import time
+
+import pytest
+from grag.components import ingest_pipeline
+from grag.components.ingest_pipeline import IngestPipeline
+from langchain_core.documents import Document
+
+PARSE_TIME = 0.05
+EMBED_TIME = 0.05
+
+
+def fake_parse_files(paths, parser_kwargs=None, workers=None):
+    for path in paths:
+        time.sleep(PARSE_TIME)
+        if path == "bad.pdf":
+            raise ValueError("could not parse")
+        yield path, {
+            "Text": [Document(page_content=f"text of {path}", metadata={"source": path})],
+            "Tables": [Document(page_content=f"table of {path}", metadata={"source": path})],
+            "Images": [Document(page_content=f"image of {path}", metadata={"source": path})],
+        }
+
+
+def split(docs):
+    return [Document(page_content=word, metadata=doc.metadata) for doc in docs for word in doc.page_content.split()]
+
+
+def embed(texts):
+    time.sleep(EMBED_TIME)
+    return [[float(len(text))] for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def fake_parser(monkeypatch):
+    monkeypatch.setattr(ingest_pipeline, "parse_files", fake_parse_files)
+
+
+def test_pipeline_outputs():
+    paths = [f"{i}.pdf" for i in range(6)]
+    pipeline = IngestPipeline(split=split, embed=embed, split_workers=2, embed_workers=2)
+    results = list(pipeline.run(paths))
+    assert sorted(result[0] for result in results) == paths
+    for path, docs, chunks, embeddings in results:
+        assert [doc.page_content for doc in docs] == [f"text of {path}", f"table of {path}"]
+        assert [chunk.page_content for chunk in chunks] == ["text", "of", path, "table", "of", path]
+        assert embeddings == [[float(len(chunk.page_content))] for chunk in chunks]
+
+
+def test_pipeline_without_embed():
+    results = list(IngestPipeline(split=split).run(["a.pdf"]))
+    assert len(results) == 1
+    assert results[0][3] is None
+
+
+def test_pipeline_stages_overlap():
+    paths = [f"{i}.pdf" for i in range(8)]
+    start = time.perf_counter()
+    list(IngestPipeline(split=split, embed=embed, embed_batch_size=100).run(paths))
+    elapsed = time.perf_counter() - start
+    # serially parsing and embedding takes len(paths) * (PARSE_TIME + EMBED_TIME)
+    assert elapsed < 0.8 * len(paths) * (PARSE_TIME + EMBED_TIME)
+
+
+def test_pipeline_backpressure(monkeypatch):
+    parsed = []
+
+    def counting_parse_files(paths, parser_kwargs=None, workers=None):
+        for item in fake_parse_files(paths):
+            parsed.append(item[0])
+            yield item
+
+    monkeypatch.setattr(ingest_pipeline, "parse_files", counting_parse_files)
+    files = IngestPipeline(split=split, embed=embed, queue_size=1).run([f"{i}.pdf" for i in range(20)])
+    next(files)
+    time.sleep(10 * PARSE_TIME)
+    # the parser waits for the slower stages once the queues are full
+    assert len(parsed) < 8
+    files.close()
+
+
+def test_pipeline_errors():
+    files = IngestPipeline(split=split, embed=embed).run(["a.pdf", "bad.pdf", "c.pdf"])
+    with pytest.raises(ValueError):
+        list(files)
+
+    def bad_embed(texts):
+        raise RuntimeError("embedding failed")
+
+    with pytest.raises(RuntimeError):
+        list(IngestPipeline(split=split, embed=bad_embed, embed_workers=3).run(["a.pdf", "b.pdf"]))
@@ -0,0 +1,118 @@
+import threading
+import time
+
+import pytest
+from grag.components.model_registry import ModelRegistry, get_model_registry
+
+
+class FakeModel:
+    def __init__(self, name):
+        self.name = name
+
+
+def test_acquire_shares_models():
+    registry = ModelRegistry(max_models=None, max_memory_gb=None)
+    loads = []
+
+    def loader():
+        loads.append("a")
+        return FakeModel("a")
+
+    handle = registry.acquire("a", loader)
+    other = registry.acquire("a", loader)
+    assert handle.model is other.model
+    assert handle.lock is other.lock
+    assert loads == ["a"]
+    handle.release()
+    other.release()
+    # released models stay loaded without limits
+    with registry.acquire("a", loader) as handle:
+        assert handle.model.name == "a"
+    assert loads == ["a"]
+    assert handle.released
+    with pytest.raises(RuntimeError):
+        handle.model
+
+
+def test_lru_unloading():
+    registry = ModelRegistry(max_models=2, max_memory_gb=None)
+    handles = {key: registry.acquire(key, lambda key=key: FakeModel(key)) for key in "ab"}
+    handles["a"].release()
+    handles["b"].release()
+    # a is the least recently used unreferenced model
+    handle_c = registry.acquire("c", lambda: FakeModel("c"))
+    assert registry.keys() == ["b", "c"]
+    # models in use are not unloaded, even over the limit
+    handle_b = registry.acquire("b", lambda: FakeModel("b"))
+    handle_a = registry.acquire("a", lambda: FakeModel("a"))
+    assert len(registry) == 3
+    handle_c.release()
+    assert registry.keys() == ["b", "a"]
+    handle_a.release()
+    handle_b.release()
+    registry.clear()
+    assert len(registry) == 0
+
+
+def test_memory_limit():
+    registry = ModelRegistry(max_memory_gb=2.5)
+    size = lambda model: int(1e9)  # noqa: E731
+    for key in "abc":
+        registry.acquire(key, lambda key=key: FakeModel(key), size=size).release()
+    assert registry.keys() == ["b", "c"]
+    assert registry.memory == int(2e9)
+
+
+def test_concurrent_acquire_loads_once():
+    registry = ModelRegistry()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        time.sleep(0.05)
+        return FakeModel("a")
+
+    handles = []
+    threads = [threading.Thread(target=lambda: handles.append(registry.acquire("a", loader))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1
+    assert len({id(handle.model) for handle in handles}) == 1
+
+
+def test_unload_waits_for_generation():
+    registry = ModelRegistry(max_models=1)
+    closed = threading.Event()
+
+    class Client:
+        def close(self):
+            closed.set()
+
+    model = FakeModel("a")
+    model.client = Client()
+    handle = registry.acquire("a", lambda: model)
+    generating = threading.Event()
+    finished = []
+
+    def generate():
+        with handle.lock:
+            generating.set()
+            time.sleep(0.1)
+            finished.append(closed.is_set())
+
+    thread = threading.Thread(target=generate)
+    thread.start()
+    generating.wait()
+    # the handle is released while its model is still generating
+    handle.release()
+    registry.acquire("b", lambda: FakeModel("b")).release()
+    thread.join()
+    assert finished == [False]
+    assert closed.is_set()
+    assert registry.keys() == ["b"]
+
+
+def test_get_model_registry():
+    assert get_model_registry() is get_model_registry()
@@ -165,3 +165,78 @@ def test_retriever_aadd_docs():
 # # len_test = chunk_len <= doc_len
 # # print(f'Is len of chunk less than len of doc?: {len_test} ')
 # # %%
+
+
+def test_retriever_cache():
+    client = DeepLakeClient(collection_name="test_retriever")
+    retriever = Retriever(vectordb=client)
+    client.delete()
+    retriever.add_docs([doc])
+    query = "Hello worlds"
+    chunks = retriever.get_chunk(query, with_score=True)
+    assert retriever.get_chunk(query, with_score=True) == chunks
+    assert retriever.result_cache.hits == 1
+    assert retriever.query_embedding_cache.misses == 1
+    retriever.add_docs([Document(page_content="Hello worlds again", metadata={"source": "bars again"})])
+    retriever.get_chunk(query, with_score=True)
+    assert retriever.result_cache.misses == 2
+    assert retriever.query_embedding_cache.hits == 1
+
+
+def test_retriever_aingest(tmp_path, monkeypatch):
+    import asyncio
+
+    from grag.components import multivec_retriever
+
+    for name in ["a", "b", "c"]:
+        (tmp_path / f"{name}.pdf").write_text(name)
+
+    def load_file(path, parser_kwargs=None):
+        return {"Text": [Document(page_content=f"Hello {Path(path).stem}", metadata={"source": str(path)})],
+                "Tables": [], "Images": []}
+
+    monkeypatch.setattr(multivec_retriever, "load_file", load_file)
+    client = DeepLakeClient(collection_name="test_retriever")
+    retriever = Retriever(vectordb=client, manifest_path=tmp_path / "manifest.json")
+    client.delete()
+    asyncio.run(retriever.aingest(tmp_path, max_concurrency=2, verbose=False))
+    assert len(client) == 3
+    asyncio.run(retriever.aingest(tmp_path, max_concurrency=2, verbose=False))
+    assert len(client) == 3
+
+
+def test_retriever_get_docs_from_chunks():
+    client = DeepLakeClient(collection_name="test_retriever")
+    retriever = Retriever(vectordb=client)
+    client.delete()
+    docs = [Document(page_content="Hello world", metadata={"source": "bar"}),
+            Document(page_content="Hello", metadata={"source": "foo"})]
+    retriever.add_docs(docs)
+    doc_ids = retriever.gen_doc_ids(docs)
+    chunks = [Document(page_content="Hello", metadata={"doc_id": doc_ids[1]}),
+              Document(page_content="world", metadata={"doc_id": doc_ids[0]}),
+              Document(page_content="Hello", metadata={"doc_id": doc_ids[1]}),
+              Document(page_content="orphan", metadata={})]
+    parents = retriever.get_docs_from_chunks(chunks)
+    assert [parent.metadata["source"] for parent in parents] == ["foo", "bar"]
+    parents = retriever.get_docs_from_chunks(chunks, one_to_one=True)
+    assert [parent.metadata["source"] if parent else None for parent in parents] == ["foo", "bar", "foo", None]
+    assert retriever.doc_cache.hits == 2
+
+
+def test_retriever_writes_are_saved(tmp_path):
+    from grag.components.vectordb.hnsw_client import HNSWClient
+    from langchain_community.embeddings import DeterministicFakeEmbedding
+
+    client = HNSWClient(store_path=tmp_path, collection_name="test_retriever_save")
+    client.embedding_function = client.langchain_client.embedding = DeterministicFakeEmbedding(size=32)
+    retriever = Retriever(vectordb=client, store_path=tmp_path / "docs")
+    docs = [Document(page_content="Hello world", metadata={"source": "bar"}),
+            Document(page_content="Hello", metadata={"source": "foo"})]
+    retriever.add_docs(docs)
+    # the hnsw index only reaches its file when saved
+    loaded = HNSWClient(store_path=tmp_path, collection_name="test_retriever_save", read_only=True)
+    assert len(loaded) == len(client) > 0
+    retriever.delete_docs(retriever.gen_doc_ids(docs))
+    loaded = HNSWClient(store_path=tmp_path, collection_name="test_retriever_save", read_only=True)
+    assert len(loaded) == 0
@@ -1,3 +1,8 @@
+from types import SimpleNamespace
+
+from grag.components.parse_pdf import ParsePDF
+from pypdf import PdfReader, PdfWriter
+
 # # add code folder to sys path
 # import time
 # from pathlib import Path
@@ -39,3 +44,105 @@
 #     print(f'Parsing: {filename}')
 #     docs = main(filename)
 #     print('All Tests Passed')
+
+
+
+def test_parse_pdf_auto_strategy(tmp_path):
+    path = str(tmp_path / "doc.pdf")
+    writer = PdfWriter()
+    for _ in range(4):
+        writer.add_blank_page(width=72, height=72)
+    writer.write(path)
+
+    parser = ParsePDF(strategy="auto", hi_res_ratio=0.5)
+    calls = []
+
+    def partition_pdf(path, strategy, **kwargs):
+        num_pages = len(PdfReader(path).pages)
+        calls.append((strategy, num_pages))
+        return [SimpleNamespace(strategy=strategy, metadata=SimpleNamespace(page_number=i + 1))
+                for i in range(num_pages)]
+
+    parser._partition_pdf = partition_pdf
+    parser.page_strategies = lambda path: ["fast", "hi_res", "fast", "fast"]
+    partitions = parser.partition(path)
+    assert sorted(calls) == [("fast", 3), ("hi_res", 1)]
+    assert [el.metadata.page_number for el in partitions] == [1, 2, 3, 4]
+    assert [el.strategy for el in partitions] == ["fast", "hi_res", "fast", "fast"]
+
+    calls.clear()
+    parser.page_strategies = lambda path: ["fast", "hi_res", "hi_res", "fast"]
+    parser.partition(path)
+    assert calls == [("hi_res", 4)]
+
+    calls.clear()
+    parser.page_strategies = lambda path: ["fast"] * 4
+    parser.partition(path)
+    assert calls == [("fast", 4)]
+
+
+def test_parse_pdf_cache_path(tmp_path):
+    for name in ["a.pdf", "b.pdf"]:
+        writer = PdfWriter()
+        writer.add_blank_page(width=72, height=72)
+        writer.write(str(tmp_path / name))
+    parser = ParsePDF(strategy="fast", cache_dir=tmp_path / "cache")
+    cache_path = parser.cache_path(str(tmp_path / "a.pdf"))
+    assert cache_path.parent == tmp_path / "cache"
+    # keyed by content, not path
+    assert parser.cache_path(str(tmp_path / "b.pdf")) == cache_path
+    assert ParsePDF(strategy="fast", cache_dir=tmp_path / "cache",
+                    add_captions_to_text=False).cache_path(str(tmp_path / "a.pdf")) == cache_path
+    assert ParsePDF(strategy="hi_res", cache_dir=tmp_path / "cache").cache_path(str(tmp_path / "a.pdf")) != cache_path
+    assert ParsePDF(strategy="fast").cache_path(str(tmp_path / "a.pdf")) is None
+
+
+def test_parse_pdf_cache(tmp_path):
+    from unstructured.documents.elements import ElementMetadata, NarrativeText
+
+    path = str(tmp_path / "doc.pdf")
+    writer = PdfWriter()
+    writer.add_blank_page(width=72, height=72)
+    writer.write(path)
+    parser = ParsePDF(strategy="fast", cache_dir=tmp_path / "cache")
+    calls = []
+
+    def partition_pdf(path, strategy, **kwargs):
+        calls.append(path)
+        return [NarrativeText("Hello world", metadata=ElementMetadata(filename="doc.pdf", page_number=1))]
+
+    parser._partition_pdf = partition_pdf
+    docs = parser.load_file(path)
+    cached_docs = parser.load_file(path)
+    assert len(calls) == 1
+    assert [doc.page_content for doc in cached_docs["Text"]] == [doc.page_content for doc in docs["Text"]]
+
+
+def _partition_pages_in_worker(path, pages, strategy, image_output_dir, partition_kwargs):
+    partitions = []
+    for page_number in pages:
+        # a table at the end of page 2 and its caption at the start of page 3, in different ranges
+        categories = {2: ["NarrativeText", "Table"], 3: ["FigureCaption", "NarrativeText"]}.get(page_number,
+                                                                                               ["NarrativeText"])
+        partitions.extend(SimpleNamespace(category=category, metadata=SimpleNamespace(page_number=page_number))
+                          for category in categories)
+    return partitions
+
+
+def test_parse_pdf_page_ranges(tmp_path, monkeypatch):
+    from grag.components import parse_pdf
+
+    path = str(tmp_path / "doc.pdf")
+    writer = PdfWriter()
+    for _ in range(5):
+        writer.add_blank_page(width=72, height=72)
+    writer.write(path)
+
+    monkeypatch.setattr(parse_pdf, "_partition_pages_in_worker", _partition_pages_in_worker)
+    parser = ParsePDF(strategy="fast", page_workers=2, page_range_size=2)
+    partitions = parser.partition(path)
+    assert [el.metadata.page_number for el in partitions] == [1, 2, 2, 3, 3, 4, 5]
+    classified = parser.classify(partitions)
+    assert len(classified["Tables"]) == 1
+    table, caption = classified["Tables"][0]
+    assert caption is not None and caption.metadata.page_number == 3
@@ -35,3 +35,22 @@ def test_custom_prompt():
         """
     custom_prompt = Prompt(input_keys={"context", "question"}, template=template)
     assert custom_prompt.format(question=question, context=context) == correct_prompt
+
+
+def test_static_prefix():
+    template = """Answer the following question based on the given context.
+        context: {context}
+        question: {question}
+        answer: 
+        """
+    custom_prompt = Prompt(input_keys=["context", "question"], template=template)
+    prefix = custom_prompt.static_prefix
+    assert prefix == template.split("{context}")[0]
+    assert custom_prompt.format(question=question, context=context).startswith(prefix)
+
+    for file in files("grag.prompts").glob("*_QA_1.json"):
+        prompt = Prompt.load(file)
+        assert prompt.format(question=question, context=context).startswith(
+            prompt.static_prefix
+        )
+        assert len(prompt.static_prefix) > 100
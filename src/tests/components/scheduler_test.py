@@ -0,0 +1,74 @@
+import asyncio
+import time
+from typing import Any, List
+
+import pytest
+from grag.components.scheduler import GenerationScheduler
+from langchain_community.llms.fake import FakeStreamingListLLM
+from langchain_core.outputs import Generation, LLMResult
+
+
+class BatchRecordingLLM(FakeStreamingListLLM):
+    """Answers each prompt with its upper case, recording the size of every generated batch."""
+
+    batch_sizes: List[int] = []
+
+    def _generate(self, prompts, stop=None, run_manager=None, **kwargs: Any) -> LLMResult:
+        assert kwargs["pipeline_kwargs"]["batch_size"] == len(prompts)
+        self.batch_sizes.append(len(prompts))
+        time.sleep(0.05)
+        return LLMResult(generations=[[Generation(text=prompt.upper())] for prompt in prompts])
+
+
+def test_scheduler_batches_hf():
+    llm = BatchRecordingLLM(responses=[""], batch_sizes=[])
+    scheduler = GenerationScheduler(llm, pipeline="hf", max_batch_size=4, max_wait_ms=20)
+    prompts = [f"prompt {i}" for i in range(10)]
+
+    async def run():
+        return await asyncio.gather(*[scheduler.generate(prompt) for prompt in prompts])
+
+    assert asyncio.run(run()) == [prompt.upper() for prompt in prompts]
+    assert sum(llm.batch_sizes) == len(prompts)
+    assert max(llm.batch_sizes) == 4
+    assert len(llm.batch_sizes) < len(prompts)
+    summary = scheduler.summary()
+    assert summary["requests"] == len(prompts)
+    assert summary["mean_batch_size"] > 1
+
+
+def test_scheduler_streams_llama_cpp():
+    llm = FakeStreamingListLLM(responses=["first answer", "second answer"])
+    scheduler = GenerationScheduler(llm, pipeline="llama_cpp")
+
+    async def run():
+        tokens = [token async for token in scheduler.stream("prompt")]
+        response, stats = await scheduler.generate("prompt", return_stats=True)
+        return tokens, response, stats
+
+    tokens, response, stats = asyncio.run(run())
+    assert "".join(tokens) == "first answer"
+    assert len(tokens) > 1
+    assert response == "second answer"
+    assert 0 <= stats.queue_time <= stats.time_to_first_token <= stats.total_time
+    assert stats.batch_size == 1
+    assert len(scheduler.stats) == 2
+
+
+def test_scheduler_errors():
+    class FailingLLM(FakeStreamingListLLM):
+        def _generate(self, *args, **kwargs):
+            raise RuntimeError("generation failed")
+
+    scheduler = GenerationScheduler(FailingLLM(responses=[""]), pipeline="hf")
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await scheduler.generate("prompt")
+        with pytest.raises(RuntimeError):
+            [token async for token in scheduler.stream("prompt")]
+
+    asyncio.run(run())
+    # a new event loop gets its own queue and worker
+    with pytest.raises(RuntimeError):
+        asyncio.run(scheduler.generate("prompt"))
@@ -6,3 +6,61 @@ from grag.components.utils import get_config
 def test_get_config():
     config = get_config(load_env=True)
     assert os.environ["HF_TOKEN"]
+
+
+def test_configure_args_lazy(tmp_path, monkeypatch):
+    from grag.components.utils import configure_args
+
+    config_path = tmp_path / "config.ini"
+    monkeypatch.setenv("CONFIG_PATH", str(config_path))
+
+    class Configured:
+        def __init__(self, value="default", other="default"):
+            self.value = value
+            self.other = other
+
+    Configured.__module__ = "tests.configured"
+    # the config is read on first instantiation, not when the class is decorated
+    Configured = configure_args(Configured)
+    config_path.write_text("[configured]\nvalue : from_config\n")
+    instance = Configured(other="kwarg")
+    assert (instance.value, instance.other) == ("from_config", "kwarg")
+    config_path.write_text("[other]\nvalue : ignored\n")
+    assert Configured().value == "from_config"
+
+
+def test_configure_args_missing_section(tmp_path, monkeypatch):
+    from grag.components.utils import configure_args
+
+    config_path = tmp_path / "config.ini"
+    config_path.write_text("[other]\nvalue : ignored\n")
+    monkeypatch.setenv("CONFIG_PATH", str(config_path))
+
+    class Unconfigured:
+        def __init__(self, value="default"):
+            self.value = value
+
+    Unconfigured.__module__ = "tests.unconfigured"
+    assert configure_args(Unconfigured)().value == "default"
+
+
+def test_lru_cache():
+    from grag.components.utils import LRUCache
+
+    cache = LRUCache(max_size=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # b is now least recently used
+    cache.put("c", 3)
+    assert "b" not in cache
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert (cache.hits, cache.misses) == (3, 1)
+    assert cache.pop("a") == 1
+    assert cache.pop("a") is None
+    assert (cache.hits, cache.misses) == (3, 1)
+    cache.clear()
+    assert len(cache) == 0
+    disabled = LRUCache(max_size=0)
+    disabled.put("a", 1)
+    assert disabled.get("a") is None
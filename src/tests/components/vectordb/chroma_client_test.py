@@ -12,7 +12,8 @@ def test_chroma_connection():
     del chroma_client
 
 
-def test_chroma_add_docs():
+@pytest.mark.parametrize("batch_size", [1, 2, 64])
+def test_chroma_add_docs(batch_size):
     docs = [
         """And so on this rainbow day, with storms all around them, and blue sky
     above, they rode only as far as the valley. But from there, before they
@@ -47,7 +48,7 @@ def test_chroma_add_docs():
     storm-clouds was split to the blinding zigzag of lightning, and the
     thunder rolled and boomed, like the Colorado in flood.""",
     ]
-    chroma_client = ChromaClient(collection_name="test")
+    chroma_client = ChromaClient(collection_name="test", batch_size=batch_size)
     if len(chroma_client) > 0:
         chroma_client.delete()
     docs = [Document(page_content=doc) for doc in docs]
@@ -151,3 +152,24 @@ def test_chroma_aget_chunk(top_k, with_score):
     else:
         assert all(isinstance(doc, Document) for doc in retrieved_chunks)
     del chroma_client
+
+
+@pytest.mark.parametrize("top_k,with_score", chrome_get_chunk_params)
+def test_chroma_get_chunks(top_k, with_score):
+    queries = [
+        """Slone and Lucy never rode down so far as the stately monuments""",
+        """Bostil wanted to be alone, to welcome the King""",
+    ]
+    chroma_client = ChromaClient(collection_name="test")
+    retrieved_chunks = chroma_client.get_chunks(
+        queries=queries, top_k=top_k, with_score=with_score
+    )
+    assert len(retrieved_chunks) == len(queries)
+    for chunks in retrieved_chunks:
+        assert len(chunks) == top_k
+        if with_score:
+            assert all(isinstance(doc[0], Document) for doc in chunks)
+            assert all(isinstance(doc[1], float) for doc in chunks)
+        else:
+            assert all(isinstance(doc, Document) for doc in chunks)
+    del chroma_client
@@ -0,0 +1,186 @@
+import asyncio
+import os
+from pathlib import Path
+
+import pytest
+from grag.components.utils import get_config
+from grag.components.vectordb.hnsw_client import HNSWClient, HNSWVectorStore
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.documents import Document
+
+config = get_config()
+test_path = Path(config['data']['data_path']) / 'vectordb/test_hnsw_client.hnsw'
+if os.path.exists(test_path):
+    os.remove(test_path)
+    print('Deleting test client: {}'.format(test_path))
+
+docs = [
+    """And so on this rainbow day, with storms all around them, and blue sky
+    above, they rode only as far as the valley. But from there, before they
+    turned to go back, the monuments appeared close, and they loomed
+    grandly with the background of purple bank and creamy cloud and shafts
+    of golden lightning.""",
+    """Slone and Lucy never rode down so far as the stately monuments, though
+    these held memories as hauntingly sweet as others were poignantly
+    bitter. Lucy never rode the King again. But Slone rode him, learned to
+    love him.""",
+    """Bostil wanted to be alone, to welcome the King, to lead him back to the
+    home corral, perhaps to hide from all eyes the change and the uplift
+    that would forever keep him from wronging another man.""",
+]
+
+
+def test_hnsw_store_search(tmp_path):
+    store = HNSWVectorStore(tmp_path / 'test.hnsw', DeterministicFakeEmbedding(size=32), initial_capacity=2)
+    store.add_documents([Document(page_content=doc) for doc in docs])
+    assert len(store) == len(docs)
+    for doc in docs:
+        retrieved = store.similarity_search_with_score(doc, k=2)
+        assert len(retrieved) == 2
+        assert retrieved[0][0].page_content == doc
+        assert retrieved[0][1] == pytest.approx(1.0, abs=1e-5)
+        assert retrieved[0][1] >= retrieved[1][1]
+    assert len(store.similarity_search(docs[0], k=10)) == len(docs)
+
+
+def test_hnsw_store_persistence(tmp_path):
+    embedding = DeterministicFakeEmbedding(size=32)
+    store = HNSWVectorStore(tmp_path / 'test.hnsw', embedding)
+    store.add_documents([Document(page_content=doc, metadata={"doc_id": str(i)}) for i, doc in enumerate(docs)])
+    store.save()
+    loaded = HNSWVectorStore(tmp_path / 'test.hnsw', embedding, read_only=True)
+    assert len(loaded) == len(docs)
+    retrieved = loaded.similarity_search(docs[1], k=1)[0]
+    assert retrieved.page_content == docs[1]
+    assert retrieved.metadata == {"doc_id": "1"}
+    with pytest.raises(PermissionError):
+        loaded.add_texts(["new text"])
+
+
+def test_hnsw_store_delete(tmp_path):
+    store = HNSWVectorStore(tmp_path / 'test.hnsw', DeterministicFakeEmbedding(size=32))
+    ids = store.add_documents([Document(page_content=doc, metadata={"doc_id": str(i)}) for i, doc in enumerate(docs)])
+    store.delete_where("doc_id", ["0"])
+    assert len(store) == len(docs) - 1
+    assert all(doc.page_content != docs[0] for doc in store.similarity_search(docs[0], k=3))
+    store.delete([ids[1]])
+    assert [doc.page_content for doc in store.similarity_search(docs[0], k=3)] == [docs[2]]
+    store.delete()
+    assert len(store) == 0
+    assert store.similarity_search(docs[0]) == []
+
+
+def test_hnsw_store_resize(tmp_path):
+    store = HNSWVectorStore(tmp_path / 'test.hnsw', DeterministicFakeEmbedding(size=32), initial_capacity=2)
+    texts = [f"chunk number {i}" for i in range(100)]
+    store.add_texts(texts, metadatas=[{"doc_id": str(i % 10)} for i in range(100)])
+    store.delete_where("doc_id", ["0", "1"])
+    assert len(store) == 80
+    store.add_texts(texts[:20])
+    assert len(store) == 100
+    assert store._index.get_max_elements() >= 100
+    for text in texts[:10] + texts[22:30]:
+        assert store.similarity_search(text, k=1)[0].page_content == text
+
+
+def test_hnsw_store_search_many(tmp_path):
+    embedding = DeterministicFakeEmbedding(size=32)
+    store = HNSWVectorStore(tmp_path / 'test.hnsw', embedding)
+    store.add_documents([Document(page_content=doc) for doc in docs])
+    queries = [docs[2], docs[0], docs[1], docs[2]]
+    results = store.similarity_search_by_vectors_with_score(
+        [embedding.embed_query(query) for query in queries], k=2
+    )
+    assert len(results) == len(queries)
+    for query, result in zip(queries, results):
+        assert len(result) == 2
+        assert result[0][0].page_content == query
+        expected = store.similarity_search_with_score(query, k=2)
+        assert [doc for doc, _ in result] == [doc for doc, _ in expected]
+        assert [score for _, score in result] == pytest.approx([score for _, score in expected], abs=1e-5)
+    assert store.similarity_search_by_vectors_with_score([], k=2) == []
+
+
+def test_hnsw_add_docs():
+    hnsw_client = HNSWClient(collection_name="test_hnsw_client")
+    if len(hnsw_client) > 0:
+        hnsw_client.delete()
+    hnsw_client.add_docs([Document(page_content=doc) for doc in docs])
+    assert len(hnsw_client) == len(docs)
+    hnsw_client.save()
+    del hnsw_client
+
+
+def test_hnsw_aadd_docs():
+    hnsw_client = HNSWClient(collection_name="test_hnsw_client")
+    if len(hnsw_client) > 0:
+        hnsw_client.delete()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(hnsw_client.aadd_docs([Document(page_content=doc) for doc in docs]))
+    assert len(hnsw_client) == len(docs)
+    hnsw_client.save()
+    del hnsw_client
+
+
+hnsw_get_chunk_params = [(1, False), (1, True), (2, False), (2, True)]
+
+
+@pytest.mark.parametrize("top_k,with_score", hnsw_get_chunk_params)
+def test_hnsw_get_chunk(top_k, with_score):
+    hnsw_client = HNSWClient(collection_name="test_hnsw_client", read_only=True)
+    retrieved_chunks = hnsw_client.get_chunk(query=docs[1], top_k=top_k, with_score=with_score)
+    assert len(retrieved_chunks) == top_k
+    if with_score:
+        assert all(isinstance(doc[0], Document) for doc in retrieved_chunks)
+        assert all(isinstance(doc[1], float) for doc in retrieved_chunks)
+    else:
+        assert all(isinstance(doc, Document) for doc in retrieved_chunks)
+    del hnsw_client
+
+
+@pytest.mark.parametrize("top_k,with_score", hnsw_get_chunk_params)
+def test_hnsw_aget_chunk(top_k, with_score):
+    hnsw_client = HNSWClient(collection_name="test_hnsw_client", read_only=True)
+    loop = asyncio.get_event_loop()
+    retrieved_chunks = loop.run_until_complete(
+        hnsw_client.aget_chunk(query=docs[1], top_k=top_k, with_score=with_score)
+    )
+    assert len(retrieved_chunks) == top_k
+    if with_score:
+        assert all(isinstance(doc[0], Document) for doc in retrieved_chunks)
+        assert all(isinstance(doc[1], float) for doc in retrieved_chunks)
+    else:
+        assert all(isinstance(doc, Document) for doc in retrieved_chunks)
+    del hnsw_client
+
+
+@pytest.mark.parametrize("top_k,with_score", hnsw_get_chunk_params)
+def test_hnsw_get_chunks(top_k, with_score):
+    queries = [
+        """Slone and Lucy never rode down so far as the stately monuments""",
+        """Bostil wanted to be alone, to welcome the King""",
+    ]
+    hnsw_client = HNSWClient(collection_name="test_hnsw_client", read_only=True)
+    retrieved_chunks = hnsw_client.get_chunks(
+        queries=queries, top_k=top_k, with_score=with_score
+    )
+    assert len(retrieved_chunks) == len(queries)
+    for chunks in retrieved_chunks:
+        assert len(chunks) == top_k
+        if with_score:
+            assert all(isinstance(doc[0], Document) for doc in chunks)
+            assert all(isinstance(doc[1], float) for doc in chunks)
+        else:
+            assert all(isinstance(doc, Document) for doc in chunks)
+    del hnsw_client
+
+
+def test_hnsw_client_save(tmp_path):
+    hnsw_client = HNSWClient(store_path=tmp_path, collection_name="test_hnsw_save")
+    embedding = DeterministicFakeEmbedding(size=32)
+    hnsw_client.add_embedded_docs([Document(page_content=doc) for doc in docs], embedding.embed_documents(docs))
+    # writes stay in memory until saved
+    assert not (tmp_path / "test_hnsw_save.hnsw").exists()
+    hnsw_client.save()
+    loaded = HNSWClient(store_path=tmp_path, collection_name="test_hnsw_save", read_only=True)
+    assert len(loaded) == len(docs)
@@ -0,0 +1,339 @@
+import asyncio
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pytest
+from grag.components.utils import get_config
+from grag.components.vectordb.numpy_client import NumpyClient, NumpyVectorStore
+from langchain_community.embeddings import DeterministicFakeEmbedding
+from langchain_core.documents import Document
+
+config = get_config()
+test_path = Path(config['data']['data_path']) / 'vectordb/test_numpy_client'
+if os.path.exists(test_path):
+    shutil.rmtree(test_path)
+    print('Deleting test client: {}'.format(test_path))
+
+docs = [
+    """And so on this rainbow day, with storms all around them, and blue sky
+    above, they rode only as far as the valley. But from there, before they
+    turned to go back, the monuments appeared close, and they loomed
+    grandly with the background of purple bank and creamy cloud and shafts
+    of golden lightning.""",
+    """Slone and Lucy never rode down so far as the stately monuments, though
+    these held memories as hauntingly sweet as others were poignantly
+    bitter. Lucy never rode the King again. But Slone rode him, learned to
+    love him.""",
+    """Bostil wanted to be alone, to welcome the King, to lead him back to the
+    home corral, perhaps to hide from all eyes the change and the uplift
+    that would forever keep him from wronging another man.""",
+]
+
+
+def test_numpy_store_search(tmp_path):
+    store = NumpyVectorStore(tmp_path, DeterministicFakeEmbedding(size=32), initial_capacity=2)
+    store.add_documents([Document(page_content=doc) for doc in docs])
+    assert len(store) == len(docs)
+    for doc in docs:
+        retrieved = store.similarity_search_with_score(doc, k=2)
+        assert len(retrieved) == 2
+        assert retrieved[0][0].page_content == doc
+        assert retrieved[0][1] == pytest.approx(1.0, abs=1e-5)
+        assert retrieved[0][1] >= retrieved[1][1]
+    assert len(store.similarity_search(docs[0], k=10)) == len(docs)
+
+
+def test_numpy_store_persistence(tmp_path):
+    embedding = DeterministicFakeEmbedding(size=32)
+    store = NumpyVectorStore(tmp_path, embedding)
+    store.add_documents([Document(page_content=doc, metadata={"doc_id": str(i)}) for i, doc in enumerate(docs)])
+    loaded = NumpyVectorStore(tmp_path, embedding, read_only=True)
+    assert len(loaded) == len(docs)
+    retrieved = loaded.similarity_search(docs[1], k=1)[0]
+    assert retrieved.page_content == docs[1]
+    assert retrieved.metadata == {"doc_id": "1"}
+    with pytest.raises(PermissionError):
+        loaded.add_texts(["new text"])
+
+
+def test_numpy_store_delete(tmp_path):
+    store = NumpyVectorStore(tmp_path, DeterministicFakeEmbedding(size=32))
+    ids = store.add_documents([Document(page_content=doc, metadata={"doc_id": str(i)}) for i, doc in enumerate(docs)])
+    store.delete_where("doc_id", ["0"])
+    assert len(store) == len(docs) - 1
+    assert all(doc.page_content != docs[0] for doc in store.similarity_search(docs[0], k=3))
+    store.delete([ids[1]])
+    assert [doc.page_content for doc in store.similarity_search(docs[0], k=3)] == [docs[2]]
+    store.delete()
+    assert len(store) == 0
+    assert store.similarity_search(docs[0]) == []
+
+
+@pytest.mark.parametrize("crash_at", ["codes", "index"])
+def test_numpy_store_interrupted_delete(tmp_path, monkeypatch, crash_at):
+    from grag.components.vectordb import numpy_client
+
+    rng = np.random.default_rng(0)
+    embeddings = NumpyVectorStore._normalize(rng.standard_normal((50, 16)).astype(np.float32))
+    embedding = DeterministicFakeEmbedding(size=16)
+    store = NumpyVectorStore(tmp_path, embedding, quantization="int8")
+    store.add_embeddings([str(i) for i in range(50)], embeddings.tolist(), [{"row": i} for i in range(50)])
+
+    def crash(*args, **kwargs):
+        raise KeyboardInterrupt
+
+    if crash_at == "codes":
+        # the compacted vectors are written, the codes are not
+        open_memmap = numpy_client.open_memmap
+        opened = []
+
+        def open_vectors(*args, **kwargs):
+            if opened:
+                crash()
+            opened.append(args)
+            return open_memmap(*args, **kwargs)
+
+        monkeypatch.setattr(numpy_client, "open_memmap", open_vectors)
+    else:
+        monkeypatch.setattr(NumpyVectorStore, "_write_index", crash)
+    with pytest.raises(KeyboardInterrupt):
+        store.delete_where("row", list(range(0, 50, 2)))
+    monkeypatch.undo()
+
+    reloaded = NumpyVectorStore(tmp_path, embedding, quantization="int8")
+    assert len(reloaded) == 50
+    for i in [0, 1, 25, 49]:
+        doc, score = reloaded.similarity_search_by_vector_with_score(embeddings[i].tolist(), k=1)[0]
+        assert doc.metadata["row"] == i
+        assert score == pytest.approx(1, abs=1e-5)
+    reloaded.delete_where("row", list(range(0, 50, 2)))
+    reloaded = NumpyVectorStore(tmp_path, embedding, quantization="int8")
+    assert len(reloaded) == 25
+    doc, _ = reloaded.similarity_search_by_vector_with_score(embeddings[1].tolist(), k=1)[0]
+    assert doc.metadata["row"] == 1
+    assert len(list(tmp_path.glob("*.npy"))) == 2
+
+
+def test_numpy_store_search_many(tmp_path):
+    embedding = DeterministicFakeEmbedding(size=32)
+    store = NumpyVectorStore(tmp_path, embedding)
+    store.add_documents([Document(page_content=doc) for doc in docs])
+    queries = [docs[2], docs[0], docs[1], docs[2]]
+    results = store.similarity_search_by_vectors_with_score(
+        [embedding.embed_query(query) for query in queries], k=2
+    )
+    assert len(results) == len(queries)
+    for query, result in zip(queries, results):
+        assert len(result) == 2
+        assert result[0][0].page_content == query
+        expected = store.similarity_search_with_score(query, k=2)
+        assert [doc for doc, _ in result] == [doc for doc, _ in expected]
+        assert [score for _, score in result] == pytest.approx([score for _, score in expected], abs=1e-5)
+    assert store.similarity_search_by_vectors_with_score([], k=2) == []
+
+
+def test_numpy_store_concurrent_delete(tmp_path):
+    import threading
+
+    rng = np.random.default_rng(0)
+    embeddings = NumpyVectorStore._normalize(rng.standard_normal((400, 16)).astype(np.float32))
+    store = NumpyVectorStore(tmp_path, DeterministicFakeEmbedding(size=16))
+    store.add_embeddings([str(i) for i in range(len(embeddings))], embeddings.tolist(),
+                         [{"row": i} for i in range(len(embeddings))])
+    errors = []
+
+    def search():
+        try:
+            for i in range(200):
+                query = embeddings[i % len(embeddings)]
+                for doc, score in store.similarity_search_by_vector_with_score(query.tolist(), k=5):
+                    # a row moved by a delete would return another document than the one scored
+                    assert score == pytest.approx(float(embeddings[doc.metadata["row"]] @ query), abs=1e-5)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for i in range(0, 300, 3):
+        store.delete_where("row", [i])
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(store) == 300
+
+
+def _recall(exact_rows, rows):
+    return sum(len(set(a) & set(b)) for a, b in zip(exact_rows, rows)) / exact_rows.size
+
+
+@pytest.mark.parametrize("quantization,rescore_factor,min_recall",
+                         [("float16", 0, 0.99), ("int8", 0, 0.9), ("int8", 4, 0.99)])
+def test_numpy_store_quantization_recall(tmp_path, monkeypatch, quantization, rescore_factor, min_recall):
+    rng = np.random.default_rng(0)
+    embeddings = rng.standard_normal((2000, 64)).astype(np.float32)
+    queries = NumpyVectorStore._normalize(rng.standard_normal((20, 64)).astype(np.float32))
+    embedding = DeterministicFakeEmbedding(size=64)
+    exact = NumpyVectorStore(tmp_path / "exact", embedding)
+    store = NumpyVectorStore(tmp_path / "quantized", embedding, quantization=quantization,
+                             rescore_factor=rescore_factor)
+    # several inserts grow the int8 scales
+    for start in range(0, len(embeddings), 500):
+        texts = [str(i) for i in range(start, start + 500)]
+        exact.add_embeddings(texts, embeddings[start:start + 500].tolist())
+        store.add_embeddings(texts, embeddings[start:start + 500].tolist())
+    monkeypatch.setattr(NumpyVectorStore, "_max_block_rows", 300)
+    exact_rows, exact_scores = exact._search(queries, 10)
+    rows, scores = store._search(queries, 10)
+    assert rows.shape == exact_rows.shape
+    assert _recall(exact_rows, rows) >= min_recall
+    assert np.all(np.diff(scores, axis=1) <= 0)
+    assert store._codes.dtype == np.dtype(quantization)
+    assert (store._vectors is None) == (rescore_factor == 0)
+    if rescore_factor:
+        # rescored scores are exact cosine similarities
+        assert scores[:, 0] == pytest.approx(exact_scores[:, 0], abs=1e-5)
+
+
+def test_numpy_store_int8_requantization(tmp_path, monkeypatch):
+    rng = np.random.default_rng(0)
+    embedding = DeterministicFakeEmbedding(size=16)
+    store = NumpyVectorStore(tmp_path, embedding, quantization="int8")
+    # each insert has larger values in some dimensions and grows the scales
+    for i in range(5):
+        embeddings = rng.standard_normal((20, 16)) * np.linspace(1, 1 + i, 16)
+        store.add_embeddings([str(i)] * 20, embeddings.tolist())
+    expected = NumpyVectorStore._quantize(store._vectors[:len(store)], store._scales)
+    assert np.array_equal(store._codes[:len(store)], expected)
+    assert len(list(tmp_path.glob("codes*.npy"))) == 1
+
+    # an insert interrupted before index.json is written keeps the previous codes and scales
+    scales = store._scales.copy()
+    codes = np.array(store._codes[:len(store)])
+    monkeypatch.setattr(NumpyVectorStore, "_write_index", lambda self: 1 / 0)
+    with pytest.raises(ZeroDivisionError):
+        store.add_embeddings(["big"], [[100.0] + [0.0] * 15])
+    monkeypatch.undo()
+    reloaded = NumpyVectorStore(tmp_path, embedding, quantization="int8")
+    assert len(reloaded) == 100
+    assert np.array_equal(reloaded._scales, scales)
+    assert np.array_equal(reloaded._codes[:100], codes)
+
+
+def test_numpy_store_binary_quantization(tmp_path):
+    from grag.components.vectordb.numpy_client import _POPCOUNT_TABLE, _popcount
+
+    rng = np.random.default_rng(0)
+    words = rng.integers(0, 2 ** 63, size=(3, 5, 4), dtype=np.uint64)
+    expected = _POPCOUNT_TABLE[words.view(np.uint8)].sum(axis=-1)
+    assert np.array_equal(_popcount(words), expected)
+    assert np.array_equal(expected, [[sum(bin(int(w)).count("1") for w in row) for row in block] for block in words])
+
+    # clustered embeddings, as retrieved chunks are close to their query
+    centers = rng.standard_normal((50, 200))
+    embeddings = (centers[rng.integers(0, 50, 2000)] + 0.7 * rng.standard_normal((2000, 200))).astype(np.float32)
+    queries = (centers[rng.integers(0, 50, 20)] + 0.7 * rng.standard_normal((20, 200))).astype(np.float32)
+    queries = NumpyVectorStore._normalize(queries)
+    embedding = DeterministicFakeEmbedding(size=200)
+    exact = NumpyVectorStore(tmp_path / "exact", embedding)
+    store = NumpyVectorStore(tmp_path / "binary", embedding, quantization="binary")
+    texts = [str(i) for i in range(len(embeddings))]
+    exact.add_embeddings(texts, embeddings.tolist())
+    store.add_embeddings(texts, embeddings.tolist())
+    assert store.rescore_factor == 10
+    # 200 dimensions are packed into 4 words
+    assert store._codes.shape[1] == 4 and store._codes.dtype == np.uint64
+    exact_rows, exact_scores = exact._search(queries, 10)
+    rows, scores = store._search(queries, 10)
+    assert _recall(exact_rows, rows) >= 0.95
+    assert scores[:, 0] == pytest.approx(exact_scores[:, 0], abs=1e-5)
+    result = store.similarity_search_by_vector_with_score(queries[0].tolist(), k=3)
+    assert [doc.page_content for doc, _ in result] == [texts[row] for row in exact_rows[0, :3]]
+
+
+def test_numpy_store_quantization_persistence(tmp_path):
+    embedding = DeterministicFakeEmbedding(size=32)
+    store = NumpyVectorStore(tmp_path, embedding, quantization="int8")
+    store.add_documents([Document(page_content=doc, metadata={"doc_id": str(i)}) for i, doc in enumerate(docs)])
+    store.delete_where("doc_id", ["0"])
+    loaded = NumpyVectorStore(tmp_path, embedding, read_only=True, quantization="int8")
+    assert len(loaded) == len(docs) - 1
+    assert loaded.similarity_search(docs[1], k=1)[0].page_content == docs[1]
+    with pytest.raises(ValueError):
+        NumpyVectorStore(tmp_path, embedding, read_only=True)
+    with pytest.raises(ValueError):
+        NumpyVectorStore(tmp_path / "other", embedding, quantization="int4")
+
+
+def test_numpy_add_docs():
+    numpy_client = NumpyClient(collection_name="test_numpy_client")
+    if len(numpy_client) > 0:
+        numpy_client.delete()
+    numpy_client.add_docs([Document(page_content=doc) for doc in docs])
+    assert len(numpy_client) == len(docs)
+    del numpy_client
+
+
+def test_numpy_aadd_docs():
+    numpy_client = NumpyClient(collection_name="test_numpy_client")
+    if len(numpy_client) > 0:
+        numpy_client.delete()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(numpy_client.aadd_docs([Document(page_content=doc) for doc in docs]))
+    assert len(numpy_client) == len(docs)
+    del numpy_client
+
+
+numpy_get_chunk_params = [(1, False), (1, True), (2, False), (2, True)]
+
+
+@pytest.mark.parametrize("top_k,with_score", numpy_get_chunk_params)
+def test_numpy_get_chunk(top_k, with_score):
+    numpy_client = NumpyClient(collection_name="test_numpy_client", read_only=True)
+    retrieved_chunks = numpy_client.get_chunk(query=docs[1], top_k=top_k, with_score=with_score)
+    assert len(retrieved_chunks) == top_k
+    if with_score:
+        assert all(isinstance(doc[0], Document) for doc in retrieved_chunks)
+        assert all(isinstance(doc[1], float) for doc in retrieved_chunks)
+    else:
+        assert all(isinstance(doc, Document) for doc in retrieved_chunks)
+    del numpy_client
+
+
+@pytest.mark.parametrize("top_k,with_score", numpy_get_chunk_params)
+def test_numpy_aget_chunk(top_k, with_score):
+    numpy_client = NumpyClient(collection_name="test_numpy_client", read_only=True)
+    loop = asyncio.get_event_loop()
+    retrieved_chunks = loop.run_until_complete(
+        numpy_client.aget_chunk(query=docs[1], top_k=top_k, with_score=with_score)
+    )
+    assert len(retrieved_chunks) == top_k
+    if with_score:
+        assert all(isinstance(doc[0], Document) for doc in retrieved_chunks)
+        assert all(isinstance(doc[1], float) for doc in retrieved_chunks)
+    else:
+        assert all(isinstance(doc, Document) for doc in retrieved_chunks)
+    del numpy_client
+
+
+@pytest.mark.parametrize("top_k,with_score", numpy_get_chunk_params)
+def test_numpy_get_chunks(top_k, with_score):
+    queries = [
+        """Slone and Lucy never rode down so far as the stately monuments""",
+        """Bostil wanted to be alone, to welcome the King""",
+    ]
+    numpy_client = NumpyClient(collection_name="test_numpy_client", read_only=True)
+    retrieved_chunks = numpy_client.get_chunks(
+        queries=queries, top_k=top_k, with_score=with_score
+    )
+    assert len(retrieved_chunks) == len(queries)
+    for chunks in retrieved_chunks:
+        assert len(chunks) == top_k
+        if with_score:
+            assert all(isinstance(doc[0], Document) for doc in chunks)
+            assert all(isinstance(doc[1], float) for doc in chunks)
+        else:
+            assert all(isinstance(doc, Document) for doc in chunks)
+    del numpy_client
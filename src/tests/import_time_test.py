@@ -0,0 +1,64 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+# modules that take seconds to import and must only be imported in the code paths that need them
+heavy_modules = [
+    "torch",
+    "transformers",
+    "llama_cpp",
+    "sentence_transformers",
+    "InstructorEmbedding",
+    "unstructured",
+    "deeplake",
+]
+
+public_modules = [
+    "grag.components.utils",
+    "grag.components.embedding",
+    "grag.components.llm",
+    "grag.components.parse_pdf",
+    "grag.components.text_splitter",
+    "grag.components.prompt",
+    "grag.components.docstore",
+    "grag.components.multivec_retriever",
+    "grag.components.vectordb.numpy_client",
+    "grag.components.vectordb.hnsw_client",
+    "grag.rag.basic_rag",
+]
+
+
+def import_module(module):
+    """Imports module in a fresh interpreter.
+
+    Returns:
+        the cumulative import time in microseconds per imported module and the heavy modules that were imported
+    """
+    code = (
+        f"import sys, json, {module}; "
+        f"print(json.dumps([m for m in {heavy_modules!r} if m in sys.modules]))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    imported_heavy_modules = json.loads(result.stdout.strip().splitlines()[-1])
+    return times, imported_heavy_modules
+
+
+@pytest.mark.parametrize("module", public_modules)
+def test_import_time(module):
+    times, imported_heavy_modules = import_module(module)
+    assert not imported_heavy_modules, f"importing {module} imports {imported_heavy_modules}"
+    print(f"{module}: {times[module] / 1e6:.3f} s")
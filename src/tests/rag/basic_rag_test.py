@@ -1,3 +1,4 @@
+import asyncio
 from typing import List, Text
 
 from grag.components.multivec_retriever import Retriever
@@ -29,3 +30,45 @@ def test_rag_refine():
     assert isinstance(sources, List)
     assert all(isinstance(s, str) for s in sources)
     del rag.llm
+
+
+def test_rag_map_reduce():
+    rag = BasicRAG(doc_chain="map_reduce", retriever=retriever,
+                   llm_kwargs={"model_name": "Llama-2-7b-chat", "n_gpu_layers": "-1"})
+    response, retrieved_docs = rag("What is Flash Attention?")
+    sources = [doc.metadata["source"] for doc in retrieved_docs]
+    assert isinstance(response, Text)
+    assert isinstance(sources, List)
+    assert all(isinstance(s, str) for s in sources)
+    response, retrieved_docs = asyncio.run(rag.acall("What is Flash Attention?"))
+    assert isinstance(response, Text)
+    del rag.llm
+
+
+def test_rag_acall():
+    rag = BasicRAG(doc_chain="stuff", retriever=retriever, max_concurrency=2,
+                   llm_kwargs={"model_name": "Llama-2-7b-chat", "n_gpu_layers": "-1"})
+    queries = ["What is Flash Attention?", "What is a transformer?", "What is attention?"]
+
+    async def run():
+        return await asyncio.gather(*[rag.acall(query) for query in queries])
+
+    results = asyncio.run(run())
+    assert len(results) == len(queries)
+    for response, retrieved_docs in results:
+        assert isinstance(response, Text)
+        assert all(isinstance(doc.metadata["source"], str) for doc in retrieved_docs)
+    del rag.llm
+
+
+def test_rag_astream():
+    rag = BasicRAG(doc_chain="refine", retriever=retriever,
+                   llm_kwargs={"model_name": "Llama-2-7b-chat", "n_gpu_layers": "-1"})
+
+    async def run():
+        return [token async for token in rag.astream("What is Flash Attention?")]
+
+    tokens = asyncio.run(run())
+    assert len(tokens) > 0
+    assert all(isinstance(token, str) for token in tokens)
+    del rag.llm